@@ -148,4 +148,12 @@ func restore_energy(amount: float):
 	
 	# Console output for energy pickup
 	print("Energy picked up! +", actual_restored, " energy")
-	print("Current energy: ", ember_energy, "/", max_ember_energy)
\ No newline at end of file
+	print("Current energy: ", ember_energy, "/", max_ember_energy)
+	
+	# Notify MCP of energy pickup
+	if has_node("/root/MCPClient"):
+		get_node("/root/MCPClient").notify_game_event({
+			"type": "energy_pickup",
+			"amount": actual_restored,
+			"energy_remaining": ember_energy
+		})
\ No newline at end of file
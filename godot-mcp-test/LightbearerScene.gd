@@ -72,6 +72,8 @@ func _ready():
 	# Update initial UI
 	update_ui()
 	
+	notify_mcp({"type": "game_start", "total_villagers": total_villagers, "total_shadows": total_shadows})
+	
 	# Add scene to group for villagers to find
 	add_to_group("lightbearer_scene")
 
@@ -110,6 +112,7 @@ func setup_villagers():
 func on_villager_cleansed(villager_name: String):
 	"""Called when a villager is cleansed of shadows"""
 	villagers_cleansed += 1
+	notify_mcp({"type": "villager_cleansed", "villager_name": villager_name})
 	
 	# Only output remaining villagers count
 	var remaining = total_villagers - villagers_cleansed
@@ -129,6 +132,7 @@ func on_shadow_defeated(shadow_name: String):
 	"""Called when a shadow enemy is defeated"""
 	shadows_defeated += 1
 	var remaining_shadows = total_shadows - shadows_defeated
+	notify_mcp({"type": "shadow_defeated", "shadow_name": shadow_name})
 	
 	print("Shadow defeated: ", shadow_name)
 	print("Shadows remaining: ", remaining_shadows)
@@ -149,6 +153,7 @@ func remove_shadow_barriers():
 	"""Remove all shadow barriers when conditions are met"""
 	barriers_removed = true
 	print("All shadows defeated! The shadow barriers are dissolving...")
+	notify_mcp({"type": "barriers_removed"})
 	
 	# Find and remove all barriers
 	var barriers = get_tree().get_nodes_in_group("shadow_barriers")
@@ -189,6 +194,12 @@ func check_victory_condition():
 		print("VICTORY! Light has triumphed over shadow!")
 		print("Kael has completed his journey and saved the village!")
 		show_temporary_message("VICTORY! All villagers saved!", 5.0)
+		notify_mcp({"type": "victory", "game_time": GameManager.get_game_time() if GameManager else 0.0})
+
+func notify_mcp(event_data: Dictionary):
+	"""Report a progress event to the MCP server if the client is loaded"""
+	if has_node("/root/MCPClient"):
+		get_node("/root/MCPClient").notify_game_event(event_data)
 
 func _input(event):
 	"""Handle any additional input if needed"""
@@ -5,45 +5,313 @@ var http_request: HTTPRequest
 var mcp_server_url = "http://localhost:8082"
 var request_queue = []
 var is_requesting = false
+var session_id = ""  # Stamped on every game event so the server can track progress per session
+
+# Event batching - game events are buffered and sent to /from-godot/batch
+var event_buffer = []
+var batch_max_events = 32
+var batch_flush_interval = 0.5  # seconds
+var flush_timer: Timer
+
+# WebSocket channel - multiplexes requests over one connection, HTTP is the fallback
+const WS_OPS = {"/status": "status", "/from-godot": "event", "/from-godot/batch": "batch"}
+var use_websocket = true
+var ws_url = "ws://localhost:8082/ws"
+var ws: WebSocketPeer
+var ws_connected = false
+var next_request_id = 1
+var pending_requests = {}
+var ws_retry_delay = 1.0  # seconds before the next reconnect attempt, doubled on each failure
+const WS_RETRY_MAX_DELAY = 30.0
+
+# Binary wire format for event batches (see BINARY_CONTENT_TYPE in the server)
+# type -> [code, number of keys the fixed layout covers, including type and session_id]
+const BINARY_EVENT_FORMATS = {
+	"light_pulse_used": [1, 5],
+	"energy_pickup": [2, 4],
+	"shadow_defeated": [3, 3],
+	"villager_cleansed": [4, 3],
+	"barriers_removed": [5, 2],
+	"victory": [6, 3],
+	"game_start": [7, 4]
+}
+var use_binary_events = true
+
+# Request bodies at least this large are gzip-compressed (0 disables compression)
+var compress_min_bytes = 1024
+
+# Backpressure - requests rejected with 429 are retried after Retry-After seconds
+var current_request = {}
 
 func _ready():
 	print("MCP Client initializing...")
+	session_id = "%d-%08x" % [int(Time.get_unix_time_from_system()), randi()]
 	http_request = HTTPRequest.new()
 	add_child(http_request)
 	http_request.request_completed.connect(_on_request_completed)
+	
+	flush_timer = Timer.new()
+	flush_timer.one_shot = true
+	flush_timer.wait_time = batch_flush_interval
+	add_child(flush_timer)
+	flush_timer.timeout.connect(flush_events)
+	
+	if use_websocket:
+		connect_websocket()
+	
 	call_deferred("test_connection")
 
+func connect_websocket():
+	"""Open the persistent WebSocket channel to the MCP server"""
+	ws = WebSocketPeer.new()
+	var error = ws.connect_to_url(ws_url)
+	if error != OK:
+		print("MCP WebSocket unavailable, using HTTP: ", error)
+		ws = null
+		schedule_reconnect()
+
+func schedule_reconnect():
+	"""Retry the WebSocket channel with exponential backoff; HTTP carries requests meanwhile"""
+	if not is_inside_tree():
+		return
+	get_tree().create_timer(ws_retry_delay).timeout.connect(connect_websocket)
+	ws_retry_delay = min(ws_retry_delay * 2, WS_RETRY_MAX_DELAY)
+
+func is_websocket_connecting() -> bool:
+	return ws != null and ws.get_ready_state() == WebSocketPeer.STATE_CONNECTING
+
+func _process(_delta):
+	if ws == null:
+		return
+	
+	ws.poll()
+	var state = ws.get_ready_state()
+	if state == WebSocketPeer.STATE_OPEN:
+		if not ws_connected:
+			ws_connected = true
+			ws_retry_delay = 1.0
+			print("MCP WebSocket connected")
+			process_queue()
+		while ws.get_available_packet_count() > 0:
+			_on_websocket_message(ws.get_packet().get_string_from_utf8())
+	elif state == WebSocketPeer.STATE_CLOSED:
+		print("MCP WebSocket closed (", ws.get_close_code(), "), falling back to HTTP")
+		ws = null
+		ws_connected = false
+		# Unacknowledged requests go out again over HTTP, in the order they were sent
+		var ids = pending_requests.keys()
+		ids.sort()
+		var unacknowledged = []
+		for request_id in ids:
+			unacknowledged.append(pending_requests[request_id])
+		pending_requests.clear()
+		request_queue = unacknowledged + request_queue
+		schedule_reconnect()
+		process_queue()
+
+func _notification(what):
+	if what == NOTIFICATION_WM_CLOSE_REQUEST:
+		flush_on_exit()
+
+func _exit_tree():
+	flush_on_exit()
+
+func flush_on_exit():
+	"""Deliver buffered and queued events before quitting; the tree is going away, so this blocks"""
+	var batch = event_buffer
+	event_buffer = []
+	var remaining = []
+	for request_info in request_queue:
+		if request_info.endpoint.begins_with("/from-godot"):
+			send_blocking(request_info)
+		else:
+			remaining.append(request_info)
+	request_queue = remaining
+	if not batch.is_empty():
+		send_blocking({"endpoint": "/from-godot/batch", "data": batch})
+
+func send_blocking(request_info: Dictionary, timeout_ms: int = 1000) -> bool:
+	"""POST a request synchronously with HTTPClient, giving up after timeout_ms"""
+	var deadline = Time.get_ticks_msec() + timeout_ms
+	var address = mcp_server_url.trim_prefix("http://")
+	var port = int(address.get_slice(":", 1)) if ":" in address else 80
+	var client = HTTPClient.new()
+	if client.connect_to_host(address.get_slice(":", 0), port) != OK:
+		return false
+	
+	while client.get_status() in [HTTPClient.STATUS_RESOLVING, HTTPClient.STATUS_CONNECTING]:
+		if Time.get_ticks_msec() > deadline:
+			return false
+		client.poll()
+		OS.delay_msec(5)
+	if client.get_status() != HTTPClient.STATUS_CONNECTED:
+		return false
+	
+	var request = build_http_request(request_info)
+	if client.request_raw(HTTPClient.METHOD_POST, request_info.endpoint, request.headers, request.body) != OK:
+		return false
+	while client.get_status() == HTTPClient.STATUS_REQUESTING:
+		if Time.get_ticks_msec() > deadline:
+			return false
+		client.poll()
+		OS.delay_msec(5)
+	var sent = client.get_status() in [HTTPClient.STATUS_BODY, HTTPClient.STATUS_CONNECTED]
+	client.close()
+	return sent
+
 func test_connection():
 	print("Testing MCP connection...")
 	make_request("/status", {})
 
 func notify_game_event(event_data: Dictionary):
-	make_request("/from-godot", event_data)
+	"""Buffer a game event; flushed when the batch is full or the timer fires"""
+	if not event_data.has("session_id"):
+		event_data["session_id"] = session_id
+	event_buffer.append(event_data)
+	if event_buffer.size() >= batch_max_events:
+		flush_events()
+	elif flush_timer.is_stopped():
+		flush_timer.start()
 
-func make_request(endpoint: String, data: Dictionary = {}):
+func flush_events():
+	"""Send all buffered events in a single batch request"""
+	flush_timer.stop()
+	if event_buffer.is_empty():
+		return
+	
+	var batch = event_buffer
+	event_buffer = []
+	make_request("/from-godot/batch", batch)
+
+func make_request(endpoint: String, data = {}):
 	var request_info = {"endpoint": endpoint, "data": data}
 	request_queue.append(request_info)
 	process_queue()
 
+func send_queue_over_websocket():
+	"""Send every queued request the WebSocket channel supports without waiting for replies"""
+	var remaining = []
+	for request_info in request_queue:
+		if not WS_OPS.has(request_info.endpoint):
+			remaining.append(request_info)
+			continue
+		
+		var op = WS_OPS[request_info.endpoint]
+		if op == "batch" and use_binary_events:
+			ws.send(encode_events(request_info.data, next_request_id))
+		else:
+			var frame = {"id": next_request_id, "op": op, "data": request_info.data}
+			ws.send_text(JSON.stringify(frame))
+		pending_requests[next_request_id] = request_info
+		next_request_id += 1
+	request_queue = remaining
+
 func process_queue():
-	if is_requesting or request_queue.is_empty():
+	if ws_connected:
+		send_queue_over_websocket()
+	
+	if is_requesting or request_queue.is_empty() or is_websocket_connecting():
 		return
 	
 	is_requesting = true
 	var request_info = request_queue.pop_front()
+	current_request = request_info
 	
-	var headers = ["Content-Type: application/json"]
 	var url = mcp_server_url + request_info.endpoint
-	
 	if request_info.data.is_empty():
-		http_request.request(url, headers)
+		http_request.request(url, ["Content-Type: application/json"])
+		return
+	
+	var request = build_http_request(request_info)
+	http_request.request_raw(url, request.headers, HTTPClient.METHOD_POST, request.body)
+
+func build_http_request(request_info: Dictionary) -> Dictionary:
+	"""Headers and (possibly binary, possibly compressed) body for a POST request"""
+	var headers = ["Content-Type: application/json"]
+	var body: PackedByteArray
+	if request_info.endpoint == "/from-godot/batch" and use_binary_events:
+		headers = ["Content-Type: application/x-godot-events"]
+		body = encode_events(request_info.data)
 	else:
-		var json_string = JSON.stringify(request_info.data)
-		http_request.request(url, headers, HTTPClient.METHOD_POST, json_string)
+		body = JSON.stringify(request_info.data).to_utf8_buffer()
+	
+	if compress_min_bytes > 0 and body.size() >= compress_min_bytes:
+		body = body.compress(FileAccess.COMPRESSION_GZIP)
+		headers.append("Content-Encoding: gzip")
+	return {"headers": headers, "body": body}
 
 func _on_request_completed(result: int, response_code: int, headers: PackedStringArray, body: PackedByteArray):
 	var response = body.get_string_from_utf8()
 	print("MCP Response (", response_code, "): ", response)
 	
+	if response_code == 429:
+		# Server is shedding load - put the request back and wait before retrying
+		request_queue.push_front(current_request)
+		await get_tree().create_timer(get_retry_after(headers)).timeout
+	
 	is_requesting = false
-	call_deferred("process_queue")  # Process next request in queue
\ No newline at end of file
+	call_deferred("process_queue")  # Process next request in queue
+
+func _on_websocket_message(message: String):
+	var reply = JSON.parse_string(message)
+	if typeof(reply) != TYPE_DICTIONARY:
+		print("MCP WebSocket: invalid reply: ", message)
+		return
+	
+	var request_id = int(reply.get("id", 0))  # JSON numbers parse as float
+	var request_info = pending_requests.get(request_id, {})
+	pending_requests.erase(request_id)
+	print("MCP Response (ws ", request_info.get("endpoint", "?"), "): ", message)
+	
+	if reply.has("retry_after") and not request_info.is_empty():
+		await get_tree().create_timer(float(reply.retry_after)).timeout
+		request_queue.push_front(request_info)
+		process_queue()
+
+func get_retry_after(headers: PackedStringArray) -> float:
+	"""Read the Retry-After header (seconds), defaulting to one second"""
+	for header in headers:
+		if header.to_lower().begins_with("retry-after:"):
+			return max(header.get_slice(":", 1).strip_edges().to_float(), 0.1)
+	return 1.0
+
+func binary_event_code(event: Dictionary) -> int:
+	"""Fixed-layout code for an event, or 0 to send it as embedded JSON"""
+	var layout = BINARY_EVENT_FORMATS.get(event.get("type", ""), [0, 0])
+	if event.size() != layout[1] or event.get("session_id", session_id) != session_id:
+		return 0
+	return layout[0]
+
+func encode_events(events: Array, request_id: int = 0) -> PackedByteArray:
+	"""Encode an event batch in the compact binary format"""
+	var buffer = StreamPeerBuffer.new()
+	buffer.put_data("GEV1".to_ascii_buffer())
+	buffer.put_u32(request_id)
+	buffer.put_utf8_string(session_id)
+	buffer.put_u16(events.size())
+	
+	for event in events:
+		var code = binary_event_code(event)
+		buffer.put_u8(code)
+		match code:
+			1:
+				buffer.put_float(event.position.x)
+				buffer.put_float(event.position.y)
+				buffer.put_float(event.energy_remaining)
+				buffer.put_float(event.energy_percentage)
+			2:
+				buffer.put_float(event.amount)
+				buffer.put_float(event.energy_remaining)
+			3:
+				buffer.put_utf8_string(event.shadow_name)
+			4:
+				buffer.put_utf8_string(event.villager_name)
+			6:
+				buffer.put_float(event.game_time)
+			7:
+				buffer.put_u16(event.total_villagers)
+				buffer.put_u16(event.total_shadows)
+			0:
+				buffer.put_utf8_string(JSON.stringify(event))
+	
+	return buffer.data_array
\ No newline at end of file
@@ -5,11 +5,33 @@ Handles file extensions properly
 """
 
 import asyncio
+import bisect
+import ctypes
+import ctypes.util
+import difflib
+import errno
+import fnmatch
+import hashlib
 import json
 import logging
+import math
+import mmap
 import os
+import posixpath
+import re
+import shutil
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
 from pathlib import Path
 from typing import Dict, Any
+from urllib.parse import unquote
 
 try:
     from aiohttp import web
@@ -17,91 +39,4362 @@ except ImportError:
     print("aiohttp not found. Install with: pip install aiohttp")
     exit(1)
 
+try:
+    from pydantic import ConfigDict, TypeAdapter, ValidationError
+    from typing_extensions import Literal, NotRequired, TypedDict
+except ImportError:
+    TypeAdapter = None  # Event schema validation is skipped without pydantic
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("godot-mcp-fixed")
 
+MCP_DATA_DIR = ".mcp"  # Server-owned data inside the Godot project (hidden from the editor)
+
+def ensure_data_dir(project_path: str, *parts: str) -> str:
+    """Create (if needed) and return a directory under the project's .mcp folder"""
+    base = os.path.join(project_path, MCP_DATA_DIR)
+    os.makedirs(base, exist_ok=True)
+    gdignore = os.path.join(base, ".gdignore")
+    if not os.path.exists(gdignore):
+        open(gdignore, "w").close()
+    
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+class FileIOPool:
+    """Dedicated thread pool for filesystem work; calls sharing a key run in submission order"""
+    
+    def __init__(self, workers: int = 8):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mcp-io")
+        self.tails = {}  # key -> future completed when the latest call for that key finishes
+        self.calls = 0
+    
+    @asynccontextmanager
+    async def ordered(self, key):
+        """Hold a key: the block starts after, and finishes before, other holders of the same key"""
+        previous = self.tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self.tails[key] = done
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            yield
+        finally:
+            if previous is not None and not previous.done():
+                # Cancelled while queued: the next holder must still wait for our predecessor
+                previous.add_done_callback(lambda _: done.set_result(None))
+                if self.tails.get(key) is done:
+                    self.tails[key] = previous
+            else:
+                done.set_result(None)
+                if self.tails.get(key) is done:
+                    del self.tails[key]
+    
+    async def run(self, key, fn, *args):
+        """Run fn(*args) on the pool after every earlier call with the same key"""
+        loop = asyncio.get_running_loop()
+        self.calls += 1
+        if key is None:
+            return await loop.run_in_executor(self.executor, fn, *args)
+        async with self.ordered(key):
+            return await loop.run_in_executor(self.executor, fn, *args)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "calls": self.calls, "busy_paths": len(self.tails)}
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+class PathLockManager:
+    """Reader/writer locks keyed by normalised path, created on first use and dropped when idle.
+    Waiters are served in arrival order, so a stream of readers cannot starve a writer."""
+    
+    HOT_PATHS = 512  # contention counters kept for at most this many paths
+    
+    def __init__(self):
+        self.locks = {}  # key -> {"readers": int, "writer": bool, "waiters": deque of (mode, future)}
+        self.contention = Counter()  # key -> times a caller had to wait
+        self.stats_counts = {"acquired": 0, "contended": 0, "wait_seconds": 0.0, "peak_locks": 0}
+    
+    @staticmethod
+    def key(path: str) -> str:
+        return os.path.normcase(os.path.normpath(path))
+    
+    @staticmethod
+    def compatible(lock: Dict[str, Any], mode: str) -> bool:
+        if mode == "read":
+            return not lock["writer"]
+        return not lock["writer"] and lock["readers"] == 0
+    
+    @staticmethod
+    def grant(lock: Dict[str, Any], mode: str):
+        if mode == "read":
+            lock["readers"] += 1
+        else:
+            lock["writer"] = True
+    
+    async def acquire(self, key: str, mode: str):
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = {"readers": 0, "writer": False, "waiters": deque()}
+            self.stats_counts["peak_locks"] = max(self.stats_counts["peak_locks"], len(self.locks))
+        self.stats_counts["acquired"] += 1
+        if not lock["waiters"] and self.compatible(lock, mode):
+            self.grant(lock, mode)
+            return
+        
+        self.stats_counts["contended"] += 1
+        self.contention[key] += 1
+        if len(self.contention) > 2 * self.HOT_PATHS:
+            self.contention = Counter(dict(self.contention.most_common(self.HOT_PATHS)))
+        
+        started = time.perf_counter()
+        waiter = (mode, asyncio.get_running_loop().create_future())
+        lock["waiters"].append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release(key, mode)  # granted just as we were cancelled
+            else:
+                lock["waiters"].remove(waiter)
+                self.wake(key, lock)
+            raise
+        finally:
+            self.stats_counts["wait_seconds"] += time.perf_counter() - started
+    
+    def release(self, key: str, mode: str):
+        lock = self.locks[key]
+        if mode == "read":
+            lock["readers"] -= 1
+        else:
+            lock["writer"] = False
+        self.wake(key, lock)
+    
+    def wake(self, key: str, lock: Dict[str, Any]):
+        """Grant waiters from the front of the queue, then drop the lock if nobody uses it"""
+        waiters = lock["waiters"]
+        while waiters and self.compatible(lock, waiters[0][0]):
+            mode, future = waiters.popleft()
+            self.grant(lock, mode)
+            future.set_result(None)
+        if not waiters and not lock["writer"] and lock["readers"] == 0:
+            del self.locks[key]
+    
+    @asynccontextmanager
+    async def hold(self, path: str, mode: str):
+        key = self.key(path)
+        await self.acquire(key, mode)
+        try:
+            yield
+        finally:
+            self.release(key, mode)
+    
+    def read(self, path: str):
+        """Shared lock: any number of readers, no writer"""
+        return self.hold(path, "read")
+    
+    def write(self, path: str):
+        """Exclusive lock"""
+        return self.hold(path, "write")
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats_counts,
+            "held": len(self.locks),
+            "hot_paths": dict(self.contention.most_common(10))
+        }
+
+class ContentHashIndex:
+    """Content hashes of project files written through the server, validated by size and mtime"""
+    
+    def __init__(self):
+        self.entries = {}  # normalised path -> (digest, size, mtime_ns)
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def digest(data: bytes) -> bytes:
+        return hashlib.blake2b(data, digest_size=16).digest()
+    
+    def matches(self, path: str, digest: bytes, size: int) -> bool:
+        """True if the file on disk already holds content with this digest (runs on the I/O pool)"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.entries.pop(path, None)
+            return False
+        
+        entry = self.entries.get(path)
+        if entry is None or entry[1] != st.st_size or entry[2] != st.st_mtime_ns:
+            # Unknown or edited outside the server; only same-size files can be equal
+            if st.st_size != size:
+                self.misses += 1
+                return False
+            with open(path, "rb") as f:
+                entry = (self.digest(f.read()), st.st_size, st.st_mtime_ns)
+            self.entries[path] = entry
+        
+        if entry[0] == digest:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+    
+    def record(self, path: str, digest: bytes):
+        st = os.stat(path)
+        self.entries[path] = (digest, st.st_size, st.st_mtime_ns)
+    
+    def forget(self, path: str):
+        self.entries.pop(path, None)
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"files": len(self.entries), "unchanged": self.hits, "changed": self.misses}
+
+def make_delta(base: bytes, data: bytes) -> bytes:
+    """Encode data as line-aligned copies from base plus inserted bytes"""
+    base_lines = base.splitlines(keepends=True)
+    new_lines = data.splitlines(keepends=True)
+    offsets = [0]
+    for line in base_lines:
+        offsets.append(offsets[-1] + len(line))
+    
+    out = bytearray()
+    matcher = difflib.SequenceMatcher(None, base_lines, new_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            out += b"C" + struct.pack("<II", offsets[i1], offsets[i2] - offsets[i1])
+        elif j2 > j1:
+            inserted = b"".join(new_lines[j1:j2])
+            out += b"I" + struct.pack("<I", len(inserted)) + inserted
+    return bytes(out)
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    out = bytearray()
+    position = 0
+    while position < len(delta):
+        op = delta[position:position + 1]
+        if op == b"C":
+            offset, length = struct.unpack_from("<II", delta, position + 1)
+            out += base[offset:offset + length]
+            position += 9
+        elif op == b"I":
+            (length,) = struct.unpack_from("<I", delta, position + 1)
+            out += delta[position + 5:position + 5 + length]
+            position += 5 + length
+        else:
+            raise ValueError("Corrupt delta")
+    return bytes(out)
+
+class VersionStore:
+    """Content-addressed history of every file the server writes, under <project>/.mcp/history.
+    Objects are named by the sha256 of the full content and stored zlib-compressed, either
+    whole or as a delta against the previous version of the same file."""
+    
+    HEADER = struct.Struct("<2sBH32s")  # magic, kind (0 full, 1 delta), chain depth, base sha256
+    MAGIC = b"V1"
+    MAX_CHAIN = 16  # a full copy is stored at least every MAX_CHAIN versions, bounding restore cost
+    
+    def __init__(self):
+        self.root = None  # project directory; history paths are relative to it
+        self.directory = None
+        self.versions = {}  # relative path -> [{"version", "size", "time"}], oldest first
+        self.depths = {}  # sha256 hex -> delta chain depth of the stored object
+        self.lock = threading.Lock()  # objects are stored from several I/O threads
+        self.stats = {"objects": 0, "full": 0, "delta": 0, "deduplicated": 0, "stored_bytes": 0, "logical_bytes": 0}
+    
+    def open(self, root: str, directory: str):
+        """Load the version log of a project (runs on the I/O pool)"""
+        self.root = root
+        self.directory = directory
+        self.versions = {}
+        self.depths = {}
+        log_path = os.path.join(directory, "log.jsonl")
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line
+                self.versions.setdefault(entry.pop("path"), []).append(entry)
+    
+    def relative(self, full_path: str) -> str:
+        return os.path.relpath(full_path, self.root).replace(os.sep, "/")
+    
+    def object_path(self, version: str) -> str:
+        return os.path.join(self.directory, "objects", version[:2], version[2:])
+    
+    def store(self, full_path: str, data: bytes) -> str:
+        """Store data as an object (deduplicated) and return its version id; call before the write lands"""
+        version = hashlib.sha256(data).hexdigest()
+        path = self.object_path(version)
+        with self.lock:
+            self.stats["logical_bytes"] += len(data)
+        if version in self.depths or os.path.exists(path):
+            with self.lock:
+                self.stats["deduplicated"] += 1
+            return version
+        
+        blob = header = None
+        history = self.versions.get(self.relative(full_path))
+        if history:
+            base = history[-1]["version"]
+            try:
+                depth = self.depth(base) + 1
+                if depth <= self.MAX_CHAIN:
+                    blob = zlib.compress(make_delta(self.load(base), data))
+                    header = self.HEADER.pack(self.MAGIC, 1, depth, bytes.fromhex(base))
+            except (OSError, ValueError):
+                blob = None  # base unreadable: fall back to a full copy
+        full = zlib.compress(data)
+        if blob is None or len(blob) >= len(full):
+            blob, depth = full, 0
+            header = self.HEADER.pack(self.MAGIC, 0, 0, bytes(32))
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(header + blob)
+        os.replace(temp_path, path)
+        
+        with self.lock:
+            self.depths[version] = depth
+            self.stats["objects"] += 1
+            self.stats["delta" if depth else "full"] += 1
+            self.stats["stored_bytes"] += len(header) + len(blob)
+        return version
+    
+    def store_file(self, full_path: str, source_path: str, version: str) -> str:
+        """Store a file too large to hold in memory as a streamed full copy"""
+        path = self.object_path(version)
+        size = os.path.getsize(source_path)
+        with self.lock:
+            self.stats["logical_bytes"] += size
+        if version in self.depths or os.path.exists(path):
+            with self.lock:
+                self.stats["deduplicated"] += 1
+            return version
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        compressor = zlib.compressobj()
+        stored = self.HEADER.size
+        with open(source_path, "rb") as source, open(temp_path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, 0, 0, bytes(32)))
+            while block := source.read(1024 * 1024):
+                stored += f.write(compressor.compress(block))
+            stored += f.write(compressor.flush())
+        os.replace(temp_path, path)
+        
+        with self.lock:
+            self.depths[version] = 0
+            self.stats["objects"] += 1
+            self.stats["full"] += 1
+            self.stats["stored_bytes"] += stored
+        return version
+    
+    def append(self, full_path: str, version: str, size: int):
+        """Record that full_path now holds version (after the write has landed)"""
+        entry = {"version": version, "size": size, "time": time.time()}
+        line = json.dumps({"path": self.relative(full_path), **entry}, separators=(",", ":")) + "\n"
+        with self.lock:
+            with open(os.path.join(self.directory, "log.jsonl"), "a", encoding="utf-8") as f:
+                f.write(line)
+            self.versions.setdefault(self.relative(full_path), []).append(entry)
+    
+    def read_object(self, version: str):
+        with open(self.object_path(version), "rb") as f:
+            raw = f.read()
+        magic, kind, depth, base = self.HEADER.unpack_from(raw)
+        if magic != self.MAGIC:
+            raise ValueError(f"Corrupt history object: {version}")
+        return kind, depth, base.hex(), zlib.decompress(raw[self.HEADER.size:])
+    
+    def depth(self, version: str) -> int:
+        if version not in self.depths:
+            self.depths[version] = self.read_object(version)[1]
+        return self.depths[version]
+    
+    def load(self, version: str) -> bytes:
+        """Rebuild the content of a version by applying its delta chain"""
+        chain = []
+        current = version
+        while True:
+            kind, depth, base, payload = self.read_object(current)
+            self.depths[current] = depth
+            chain.append(payload)
+            if kind == 0:
+                break
+            current = base
+        
+        data = chain.pop()
+        while chain:
+            data = apply_delta(data, chain.pop())
+        if hashlib.sha256(data).hexdigest() != version:
+            raise ValueError(f"History object failed verification: {version}")
+        return data
+    
+    def history(self, full_path: str):
+        return self.versions.get(self.relative(full_path), [])
+    
+    def report(self) -> Dict[str, Any]:
+        return {**self.stats, "files": len(self.versions)}
+
+class AtomicFileWriter:
+    """Crash-safe file writes: temp file + rename, with none/batched/immediate fsync"""
+    
+    FSYNC_POLICIES = ("none", "batched", "immediate")
+    # Temp files from temp_path(), and the transaction backups named after them
+    LEFTOVER_NAME = re.compile(r"^\..+\.(?P<pid>\d+)-\d+\.(?:tmp|bak)$")
+    LEFTOVER_AGE = 3600.0  # this process's own leftovers are only removed once this old
+    
+    def __init__(self, io: FileIOPool, hashes: ContentHashIndex = None, history: VersionStore = None,
+                 locks: PathLockManager = None):
+        self.io = io
+        self.locks = locks or PathLockManager()  # writes hold their path exclusively
+        self.listeners = []  # called with the path after every change the writer makes (on the I/O pool)
+        self.hashes = hashes  # when set, writes of unchanged content are skipped
+        self.history = history  # when set, every write is recorded as a version
+        self.pending = []  # (temp fd, temp path, final path, digest, version, future) awaiting a group commit
+        self.commit_lock = asyncio.Lock()
+        self.temp_counter = 0
+        self.directories = set()  # directories known to exist, so makedirs runs once per directory
+        self.stats = {"writes": 0, "unchanged": 0, "group_commits": 0, "fsyncs": 0, "mkdirs": 0, "swept": 0}
+        for policy in self.FSYNC_POLICIES:
+            self.stats[policy] = 0
+    
+    def temp_path(self, full_path: str) -> str:
+        # Dot-prefixed so the Godot editor ignores the file while it exists
+        self.temp_counter += 1
+        directory, name = os.path.split(full_path)
+        return os.path.join(directory, f".{name}.{os.getpid()}-{self.temp_counter}.tmp")
+    
+    def sweep(self, root: str) -> int:
+        """Remove temp files and backups left in the project by a crash (runs on the I/O pool,
+        after transaction recovery). Files of another process are stale: a live writer's pid is ours."""
+        removed = 0
+        cutoff = time.time() - self.LEFTOVER_AGE
+        pid = str(os.getpid())
+        for directory, dirs, names in os.walk(root):
+            if directory == root and MCP_DATA_DIR in dirs:
+                dirs.remove(MCP_DATA_DIR)  # server data cleans up after itself
+            for name in names:
+                match = self.LEFTOVER_NAME.match(name)
+                if not match:
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    if match.group("pid") == pid and os.path.getmtime(path) > cutoff:
+                        continue
+                    os.unlink(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        self.stats["swept"] += removed
+        return removed
+    
+    def write_temp(self, full_path: str, temp_path: str, data: bytes, sync: bool) -> int:
+        """Write data to a temp file next to the target; returns the still-open fd"""
+        directory = os.path.dirname(full_path)
+        if directory not in self.directories:
+            os.makedirs(directory, exist_ok=True)
+            self.directories.add(directory)
+            self.stats["mkdirs"] += 1
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileNotFoundError:
+            # Directory was removed behind our back
+            self.directories.discard(directory)
+            os.makedirs(directory, exist_ok=True)
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            try:
+                os.chmod(temp_path, os.stat(full_path).st_mode & 0o7777)
+            except FileNotFoundError:
+                pass
+            if sync:
+                os.fsync(fd)
+                self.stats["fsyncs"] += 1
+        except BaseException:
+            os.close(fd)
+            os.unlink(temp_path)
+            raise
+        return fd
+    
+    def publish(self, fd: int, temp_path: str, full_path: str):
+        os.close(fd)
+        os.replace(temp_path, full_path)
+    
+    def sync_directory(self, directory: str):
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            self.stats["fsyncs"] += 1
+        finally:
+            os.close(fd)
+    
+    def is_unchanged(self, full_path: str, data: bytes):
+        """Return (unchanged, digest) for data about to be written to full_path"""
+        if self.hashes is None:
+            return False, None
+        digest = ContentHashIndex.digest(data)
+        return self.hashes.matches(os.path.normpath(full_path), digest, len(data)), digest
+    
+    def record(self, full_path: str, digest: bytes):
+        if self.hashes is not None:
+            self.hashes.record(os.path.normpath(full_path), digest)
+        self.changed(full_path)
+    
+    def changed(self, full_path: str):
+        for listener in self.listeners:
+            listener(full_path)
+    
+    def store_version(self, full_path: str, data: bytes):
+        """Store data in the history before it is written; returns (version, size) or None"""
+        if self.history is None or self.history.directory is None:
+            return None
+        try:
+            return self.history.store(full_path, data), len(data)
+        except OSError as e:
+            logger.warning(f"Could not record history for {full_path}: {e}")
+            return None
+    
+    def store_landed_version(self, full_path: str):
+        """Store the content full_path now holds; for writes whose data is no longer in memory"""
+        if self.history is None or self.history.directory is None:
+            return None
+        try:
+            with open(full_path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            logger.warning(f"Could not record history for {full_path}: {e}")
+            return None
+        return self.store_version(full_path, data)
+    
+    def record_version(self, full_path: str, version):
+        if version is not None:
+            try:
+                self.history.append(full_path, *version)
+            except OSError as e:
+                logger.warning(f"Could not record history for {full_path}: {e}")
+    
+    def apply_transform(self, full_path: str, transform) -> bytes:
+        with open(full_path, "rb") as f:
+            return transform(f.read())
+    
+    def write_now(self, full_path: str, data: bytes, sync: bool, transform=None) -> bool:
+        """Unbatched write: temp file, optional fsync, rename (runs on the I/O pool)"""
+        if transform is not None:
+            data = self.apply_transform(full_path, transform)
+        unchanged, digest = self.is_unchanged(full_path, data)
+        if unchanged:
+            return False
+        
+        version = self.store_version(full_path, data)
+        temp_path = self.temp_path(full_path)
+        fd = self.write_temp(full_path, temp_path, data, sync)
+        self.publish(fd, temp_path, full_path)
+        if sync:
+            self.sync_directory(os.path.dirname(full_path))
+        self.record(full_path, digest)
+        self.record_version(full_path, version)
+        return True
+    
+    def stage(self, full_path: str, data: bytes, transform=None):
+        """Write a temp file for the next group commit; returns (fd or None if unchanged, temp path, digest, version)"""
+        if transform is not None:
+            data = self.apply_transform(full_path, transform)
+        unchanged, digest = self.is_unchanged(full_path, data)
+        if unchanged:
+            return None, None, digest, None
+        version = self.store_version(full_path, data)
+        temp_path = self.temp_path(full_path)
+        return self.write_temp(full_path, temp_path, data, False), temp_path, digest, version
+    
+    def commit_batch(self, batch):
+        """fsync every temp file, rename them into place, then fsync each directory once"""
+        errors = []
+        directories = set()
+        for fd, temp_path, full_path, digest, version, _ in batch:
+            try:
+                os.fsync(fd)
+                self.stats["fsyncs"] += 1
+                self.publish(fd, temp_path, full_path)
+                self.record(full_path, digest)
+                self.record_version(full_path, version)
+                directories.add(os.path.dirname(full_path))
+                errors.append(None)
+            except OSError as e:
+                try:
+                    os.close(fd)
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+                errors.append(e)
+        
+        for directory in directories:
+            self.sync_directory(directory)
+        return errors
+    
+    async def commit(self):
+        """Commit everything pending; writers that queue up meanwhile share the next commit"""
+        async with self.commit_lock:
+            batch, self.pending = self.pending, []
+            if not batch:
+                return
+            try:
+                errors = await self.io.run(None, self.commit_batch, batch)
+            except OSError as e:
+                errors = [e] * len(batch)
+            self.stats["group_commits"] += 1
+            
+            for (*_, future), error in zip(batch, errors):
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+    
+    async def write(self, full_path: str, data: bytes, fsync: str = "batched", transform=None) -> bool:
+        """Atomically replace full_path with data; same-path writes land in call order.
+        With transform, the new content is transform(current content), computed while the
+        path is held so no other write can slip in between the read and the write.
+        Returns False when the file already held this content and nothing was written."""
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        
+        async with self.locks.write(full_path):
+            if fsync != "batched":
+                written = await self.io.run(None, self.write_now, full_path, data, fsync == "immediate", transform)
+            else:
+                fd, temp_path, digest, version = await self.io.run(None, self.stage, full_path, data, transform)
+                written = fd is not None
+                if written:
+                    future = asyncio.get_running_loop().create_future()
+                    self.pending.append((fd, temp_path, full_path, digest, version, future))
+                    # Shielded: the batch holds other writers' futures, which must resolve even if this caller goes away
+                    await asyncio.shield(self.commit())
+                    await future
+        
+        if written:
+            self.stats["writes"] += 1
+            self.stats[fsync] += 1
+        else:
+            self.stats["unchanged"] += 1
+        return written
+
+class WriteCoalescer:
+    """Write-behind mode: writes to one path within the debounce window collapse into a
+    single write of the latest content, and every caller gets that write's outcome"""
+    
+    def __init__(self, writer: AtomicFileWriter, window: float = 0.1, max_delay: float = 1.0):
+        self.writer = writer
+        self.window = window
+        self.max_delay = max_delay  # a path under constant writes is still flushed this often
+        self.pending = {}  # normalised path -> pending entry
+        self.stats = {"requests": 0, "coalesced": 0, "flushes": 0}
+    
+    async def write(self, full_path: str, data: bytes, fsync: str = "batched") -> bool:
+        """Queue data for full_path and wait for the write it ends up in"""
+        if fsync not in AtomicFileWriter.FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        loop = asyncio.get_running_loop()
+        key = os.path.normpath(full_path)
+        self.stats["requests"] += 1
+        
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = {"path": full_path, "fsync": fsync, "first": loop.time(), "future": loop.create_future()}
+            self.pending[key] = entry
+        else:
+            entry["handle"].cancel()
+            self.stats["coalesced"] += 1
+            # The merged write is as durable as the strictest request in it
+            policies = AtomicFileWriter.FSYNC_POLICIES
+            entry["fsync"] = max(entry["fsync"], fsync, key=policies.index)
+        entry["data"] = data
+        delay = min(self.window, entry["first"] + self.max_delay - loop.time())
+        entry["handle"] = loop.call_later(max(delay, 0), self.flush, key)
+        
+        # Shielded so one caller going away does not cancel the write for the others
+        return await asyncio.shield(entry["future"])
+    
+    def flush(self, key: str):
+        entry = self.pending.pop(key, None)
+        if entry is None:
+            return
+        entry["handle"].cancel()
+        self.stats["flushes"] += 1
+        task = asyncio.ensure_future(self.writer.write(entry["path"], entry["data"], entry["fsync"]))
+        task.add_done_callback(lambda t: self.finish(entry["future"], t))
+    
+    @staticmethod
+    def finish(future, task):
+        if future.done():
+            return
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+    
+    async def drain(self):
+        """Flush every pending path now and wait for the writes (used on shutdown)"""
+        futures = [entry["future"] for entry in self.pending.values()]
+        for key in list(self.pending):
+            self.flush(key)
+        if futures:
+            await asyncio.wait(futures)
+    
+    def report(self) -> Dict[str, Any]:
+        return {**self.stats, "pending": len(self.pending), "window": self.window}
+
+class TooManyTransactions(Exception):
+    """Every transaction slot is held by a transaction that has not expired yet"""
+
+class TransactionManager:
+    """Multi-file transactions. Staged files are written to temp files next to their targets;
+    commit renames them into place under an on-disk journal, so after a crash a commit is
+    either fully applied or rolled back. Old versions are kept as hard links, not copies."""
+    
+    def __init__(self, writer: AtomicFileWriter, ttl: float = 3600.0, max_open: int = 64):
+        self.writer = writer
+        self.io = writer.io
+        self.directory = None  # journal directory, <project>/.mcp/transactions
+        self.open = {}  # transaction id -> {normalised path: (temp path, full path, digest, size)}
+        self.touched = {}  # transaction id -> time it was last begun or staged into
+        self.ttl = ttl  # idle transactions older than this are aborted when a new one begins
+        self.max_open = max_open
+        self.counter = 0
+        self.stats = {"begun": 0, "committed": 0, "aborted": 0, "expired": 0, "rolled_back": 0, "recovered": 0}
+    
+    async def begin(self) -> str:
+        await self.expire(time.time())
+        if len(self.open) >= self.max_open:
+            raise TooManyTransactions(f"Too many open transactions (limit {self.max_open})")
+        self.counter += 1
+        transaction_id = f"{int(time.time())}-{os.getpid()}-{self.counter}"
+        self.open[transaction_id] = {}
+        self.touched[transaction_id] = time.time()
+        self.stats["begun"] += 1
+        return transaction_id
+    
+    async def expire(self, now: float):
+        """Abort transactions left idle past the TTL, removing their temp files"""
+        for transaction_id in [tid for tid, touched in self.touched.items() if now - touched > self.ttl]:
+            if transaction_id in self.open:
+                await self.abort(transaction_id, "expired")
+    
+    def files(self, transaction_id: str):
+        files = self.open.get(transaction_id)
+        if files is None:
+            raise KeyError(f"Unknown transaction: {transaction_id}")
+        return files
+    
+    async def stage(self, transaction_id: str, full_path: str, data: bytes):
+        """Write data to a temp file; it replaces full_path when the transaction commits"""
+        files = self.files(transaction_id)
+        self.touched[transaction_id] = time.time()
+        temp_path = self.writer.temp_path(full_path)
+        await self.io.run(None, self.write_staged, full_path, temp_path, data)
+        entry = (temp_path, full_path, ContentHashIndex.digest(data), len(data))
+        
+        if self.open.get(transaction_id) is not files:
+            # Committed or aborted while the temp file was being written
+            await self.io.run(None, self.discard, [entry])
+            raise KeyError(f"Unknown transaction: {transaction_id}")
+        previous = files.get(os.path.normpath(full_path))
+        files[os.path.normpath(full_path)] = entry
+        if previous is not None:
+            await self.io.run(None, self.discard, [previous])
+    
+    def write_staged(self, full_path: str, temp_path: str, data: bytes):
+        """Write a temp file and close it, so open transactions hold no descriptors; commit reopens it to fsync"""
+        os.close(self.writer.write_temp(full_path, temp_path, data, False))
+    
+    @staticmethod
+    def discard(entries):
+        for temp_path, *_ in entries:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+    
+    async def abort(self, transaction_id: str, outcome: str = "aborted"):
+        files = self.files(transaction_id)
+        del self.open[transaction_id]
+        self.touched.pop(transaction_id, None)
+        await self.io.run(None, self.discard, list(files.values()))
+        self.stats[outcome] += 1
+    
+    async def abort_all(self):
+        for transaction_id in list(self.open):
+            await self.abort(transaction_id)
+    
+    async def commit(self, transaction_id: str):
+        """Apply every staged file or none of them; returns the paths actually written"""
+        files = self.files(transaction_id)
+        del self.open[transaction_id]
+        self.touched.pop(transaction_id, None)
+        keys = sorted(files)
+        
+        # Hold every path (in sorted order, so overlapping commits cannot deadlock)
+        async with AsyncExitStack() as stack:
+            for lock_key in sorted({self.writer.locks.key(key) for key in keys}):
+                await stack.enter_async_context(self.writer.locks.write(lock_key))
+            try:
+                written = await self.io.run(None, self.apply, transaction_id, [files[key] for key in keys])
+            except BaseException:
+                self.stats["rolled_back"] += 1
+                raise
+        
+        self.stats["committed"] += 1
+        return written
+    
+    def apply(self, transaction_id: str, entries):
+        """Commit protocol (runs on the I/O pool with every path held)"""
+        changes = []
+        try:
+            for temp_path, full_path, digest, size in entries:
+                hashes = self.writer.hashes
+                if hashes is not None and hashes.matches(os.path.normpath(full_path), digest, size):
+                    os.unlink(temp_path)
+                    continue
+                fd = os.open(temp_path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                self.writer.stats["fsyncs"] += 1
+                changes.append({
+                    "path": full_path, "temp": temp_path, "backup": None,
+                    "digest": digest.hex()
+                })
+        except BaseException:
+            self.discard(entries)
+            raise
+        
+        journal = {"id": transaction_id, "state": "prepared", "files": changes}
+        journal_path = os.path.join(self.directory, f"{transaction_id}.json")
+        try:
+            for change in changes:
+                if os.path.exists(change["path"]):
+                    change["backup"] = change["temp"][:-len(".tmp")] + ".bak"
+                    try:
+                        os.link(change["path"], change["backup"])
+                    except OSError:
+                        shutil.copy2(change["path"], change["backup"])  # no hard links on this filesystem
+            self.write_journal(journal_path, journal)
+            
+            for change in changes:
+                os.replace(change["temp"], change["path"])
+            for directory in {os.path.dirname(change["path"]) for change in changes}:
+                self.writer.sync_directory(directory)
+            
+            journal["state"] = "committed"
+            self.write_journal(journal_path, journal)
+        except BaseException:
+            self.rollback(journal, journal_path)
+            raise
+        
+        for change in changes:
+            self.writer.record(change["path"], bytes.fromhex(change["digest"]))
+            # Versioned only once committed, so aborted or rolled-back content leaves no history
+            self.writer.record_version(change["path"], self.writer.store_landed_version(change["path"]))
+        self.finish(journal, journal_path)
+        return [change["path"] for change in changes]
+    
+    def write_journal(self, path: str, journal: Dict[str, Any]):
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(journal, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        self.writer.sync_directory(self.directory)
+    
+    def rollback(self, journal: Dict[str, Any], journal_path: str):
+        """Put back every file a prepared transaction may have replaced"""
+        for change in reversed(journal["files"]):
+            if os.path.exists(change["temp"]):
+                os.unlink(change["temp"])  # never renamed into place
+                if change["backup"] and os.path.exists(change["backup"]):
+                    os.unlink(change["backup"])
+            elif change["backup"]:
+                if os.path.exists(change["backup"]):
+                    os.replace(change["backup"], change["path"])
+            elif os.path.exists(change["path"]):
+                os.unlink(change["path"])  # file was created by this transaction
+            if self.writer.hashes is not None:
+                self.writer.hashes.forget(os.path.normpath(change["path"]))
+            self.writer.changed(change["path"])
+        for directory in {os.path.dirname(change["path"]) for change in journal["files"]}:
+            if os.path.isdir(directory):
+                self.writer.sync_directory(directory)
+        if os.path.exists(journal_path):
+            os.unlink(journal_path)
+    
+    def finish(self, journal: Dict[str, Any], journal_path: str):
+        """Drop the backups of a committed transaction, then its journal"""
+        for change in journal["files"]:
+            if change["backup"] and os.path.exists(change["backup"]):
+                os.unlink(change["backup"])
+        os.unlink(journal_path)
+    
+    def recover(self, directory: str) -> int:
+        """Complete or roll back transactions interrupted by a crash (runs on the I/O pool)"""
+        self.directory = directory
+        recovered = 0
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if name.endswith(".json.tmp"):
+                os.unlink(path)  # journal update that never landed; the previous state stands
+                continue
+            if not name.endswith(".json"):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                journal = json.load(f)
+            if journal.get("state") == "committed":
+                self.finish(journal, path)
+            else:
+                self.rollback(journal, path)
+                self.stats["rolled_back"] += 1
+            recovered += 1
+        self.stats["recovered"] += recovered
+        return recovered
+    
+    def report(self) -> Dict[str, Any]:
+        return {**self.stats, "open": len(self.open)}
+
+class UploadConflict(Exception):
+    """An upload request does not match the upload's current offset"""
+    
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+class UploadManager:
+    """Resumable streaming uploads. Data is appended to <project>/.mcp/uploads/<id>.part as it
+    arrives, so memory stays bounded and an interrupted upload continues from its offset;
+    completing the upload renames the part file into place."""
+    
+    CHUNK_SIZE = 1024 * 1024  # bytes buffered between writes to the part file
+    
+    def __init__(self, writer: AtomicFileWriter, ttl: float = 24 * 3600):
+        self.writer = writer
+        self.io = writer.io
+        self.ttl = ttl  # unfinished uploads older than this are removed when the project is opened
+        self.directory = None
+        self.uploads = {}  # upload id -> state; reloaded from the manifest after a restart
+        self.stats = {"started": 0, "completed": 0, "aborted": 0, "reloaded": 0, "expired": 0, "bytes": 0}
+    
+    def open(self, directory: str):
+        """Use a project's upload directory, dropping stale uploads (runs on the I/O pool)"""
+        self.directory = directory
+        self.uploads = {}
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+                if name.endswith(".json"):
+                    self.stats["expired"] += 1
+    
+    def manifest_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.json")
+    
+    def part_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.part")
+    
+    @staticmethod
+    def new_state(upload_id: str, full_path: str, size, sha256) -> Dict[str, Any]:
+        return {
+            "id": upload_id, "path": full_path, "size": size, "sha256": sha256, "offset": 0,
+            "hash": hashlib.sha256(), "digest": hashlib.blake2b(digest_size=16)
+        }
+    
+    async def begin(self, full_path: str, size: int = None, sha256: str = None) -> Dict[str, Any]:
+        upload = self.new_state(os.urandom(12).hex(), full_path, size, sha256)
+        await self.io.run(None, self.create, upload)
+        self.uploads[upload["id"]] = upload
+        self.stats["started"] += 1
+        return upload
+    
+    def create(self, upload: Dict[str, Any]):
+        manifest = {key: upload[key] for key in ("id", "path", "size", "sha256")}
+        with open(self.manifest_path(upload["id"]), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        open(self.part_path(upload["id"]), "wb").close()
+    
+    def load(self, upload_id: str) -> Dict[str, Any]:
+        """Rebuild an upload's state from its manifest and part file (runs on the I/O pool)"""
+        try:
+            with open(self.manifest_path(upload_id), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            raise KeyError(f"Unknown upload: {upload_id}")
+        upload = self.new_state(upload_id, manifest["path"], manifest["size"], manifest["sha256"])
+        with open(self.part_path(upload_id), "rb") as f:
+            while block := f.read(self.CHUNK_SIZE):
+                upload["hash"].update(block)
+                upload["digest"].update(block)
+                upload["offset"] += len(block)
+        self.stats["reloaded"] += 1
+        return upload
+    
+    async def get(self, upload_id: str) -> Dict[str, Any]:
+        if not re.fullmatch(r"[0-9a-f]{24}", upload_id) or self.directory is None:
+            raise KeyError(f"Unknown upload: {upload_id}")
+        if upload_id not in self.uploads:
+            self.uploads[upload_id] = await self.io.run(None, self.load, upload_id)
+        return self.uploads[upload_id]
+    
+    def append(self, upload: Dict[str, Any], data: bytes):
+        with open(self.part_path(upload["id"]), "ab") as f:
+            f.write(data)
+        upload["hash"].update(data)
+        upload["digest"].update(data)
+        upload["offset"] += len(data)
+        self.stats["bytes"] += len(data)
+    
+    async def receive(self, upload_id: str, offset: int, chunks) -> int:
+        """Append the chunks of an async iterator at offset; returns the new offset.
+        Whatever arrived before a dropped connection is kept, so the client can resume."""
+        async with self.io.ordered(f"upload:{upload_id}"):
+            upload = await self.get(upload_id)
+            if offset != upload["offset"]:
+                raise UploadConflict(f"Upload is at offset {upload['offset']}, not {offset}", upload["offset"])
+            
+            buffer = bytearray()
+            try:
+                async for chunk in chunks:
+                    buffer += chunk
+                    if len(buffer) >= self.CHUNK_SIZE:
+                        await self.io.run(None, self.append, upload, bytes(buffer))
+                        buffer.clear()
+            finally:
+                if buffer:
+                    await asyncio.shield(self.io.run(None, self.append, upload, bytes(buffer)))
+            return upload["offset"]
+    
+    async def complete(self, upload_id: str, fsync: str = "batched") -> bool:
+        """Verify the upload and move it into place; returns False if the file already had this content"""
+        async with self.io.ordered(f"upload:{upload_id}"):
+            upload = await self.get(upload_id)
+            if upload["size"] is not None and upload["offset"] != upload["size"]:
+                raise UploadConflict(f"Upload has {upload['offset']} of {upload['size']} bytes", upload["offset"])
+            if upload["sha256"] and upload["hash"].hexdigest() != upload["sha256"]:
+                await self.io.run(None, self.remove, upload_id)
+                del self.uploads[upload_id]
+                raise ValueError("Uploaded content does not match sha256; upload discarded")
+            
+            async with self.writer.locks.write(upload["path"]):
+                written = await self.io.run(None, self.publish, upload, fsync)
+            del self.uploads[upload_id]
+        
+        self.stats["completed"] += 1
+        self.writer.stats["writes" if written else "unchanged"] += 1
+        if written:
+            self.writer.stats[fsync] += 1
+        return written
+    
+    def publish(self, upload: Dict[str, Any], fsync: str) -> bool:
+        """Rename the part file over the target (runs on the I/O pool with the path held)"""
+        full_path = upload["path"]
+        part_path = self.part_path(upload["id"])
+        digest = upload["digest"].digest()
+        size = upload["offset"]
+        
+        hashes = self.writer.hashes
+        if hashes is not None and hashes.matches(os.path.normpath(full_path), digest, size):
+            self.remove(upload["id"])
+            return False
+        
+        version = None
+        history = self.writer.history
+        if history is not None and history.directory is not None:
+            try:
+                version = history.store_file(full_path, part_path, upload["hash"].hexdigest()), size
+            except OSError as e:
+                logger.warning(f"Could not record history for {full_path}: {e}")
+        
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        try:
+            os.chmod(part_path, os.stat(full_path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        if fsync != "none":
+            fd = os.open(part_path, os.O_RDWR)
+            try:
+                os.fsync(fd)
+                self.writer.stats["fsyncs"] += 1
+            finally:
+                os.close(fd)
+        
+        try:
+            os.replace(part_path, full_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Target is on another filesystem: copy next to it, then rename
+            temp_path = self.writer.temp_path(full_path)
+            shutil.copyfile(part_path, temp_path)
+            os.replace(temp_path, full_path)
+            os.unlink(part_path)
+        if fsync != "none":
+            self.writer.sync_directory(directory)
+        
+        os.unlink(self.manifest_path(upload["id"]))
+        self.writer.record(full_path, digest)
+        self.writer.record_version(full_path, version)
+        return True
+    
+    def remove(self, upload_id: str):
+        for path in (self.part_path(upload_id), self.manifest_path(upload_id)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+    
+    async def abort(self, upload_id: str):
+        async with self.io.ordered(f"upload:{upload_id}"):
+            await self.get(upload_id)
+            await self.io.run(None, self.remove, upload_id)
+            del self.uploads[upload_id]
+        self.stats["aborted"] += 1
+    
+    def report(self) -> Dict[str, Any]:
+        return {**self.stats, "active": len(self.uploads)}
+
+class PatchConflict(ValueError):
+    """The file no longer matches the base a patch was made against"""
+
+def apply_range_edits(base: bytes, edits) -> bytes:
+    """Apply non-overlapping replacements given as 1-based inclusive line ranges
+    ({start_line, end_line, text}) or 0-based byte ranges ({start_byte, end_byte, text}).
+    All ranges refer to the base content; end_line = start_line - 1 inserts before start_line."""
+    if not isinstance(edits, list):
+        raise ValueError("edits must be a list")
+    
+    line_starts = None
+    ranges = []
+    for edit in edits:
+        if not isinstance(edit, dict) or not isinstance(edit.get("text", ""), str):
+            raise ValueError("Each edit needs a text string and a line or byte range")
+        try:
+            if "start_line" in edit:
+                if line_starts is None:
+                    line_starts = [0]
+                    for line in base.splitlines(keepends=True):
+                        line_starts.append(line_starts[-1] + len(line))
+                first, last = int(edit["start_line"]), int(edit.get("end_line", edit["start_line"]))
+                if not 1 <= first <= len(line_starts) or not first - 1 <= last < len(line_starts):
+                    raise PatchConflict(f"Line range {first}-{last} is outside the file")
+                start, end = line_starts[first - 1], line_starts[last]
+            else:
+                start, end = int(edit["start_byte"]), int(edit["end_byte"])
+                if not 0 <= start <= end <= len(base):
+                    raise PatchConflict(f"Byte range {start}-{end} is outside the file")
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid edit range: {e}")
+        ranges.append((start, end, edit.get("text", "").encode("utf-8")))
+    
+    ranges.sort(key=lambda r: (r[0], r[1]))
+    out = []
+    position = 0
+    for start, end, text in ranges:
+        if start < position:
+            raise ValueError("Edits overlap")
+        out.append(base[position:start])
+        out.append(text)
+        position = end
+    out.append(base[position:])
+    return b"".join(out)
+
+def apply_unified_diff(base: bytes, diff: bytes) -> bytes:
+    """Apply a unified diff exactly (no fuzz); context and removed lines must match the base.
+    Each hunk is as long as its header counts say; anything else is a malformed diff"""
+    old_lines = base.splitlines(keepends=True)
+    out = []
+    position = 0
+    hunk = None  # [old start, lines, old lines left, new lines left] of the hunk being read
+    hunks = []
+    
+    def check_complete(current):
+        if current and (current[2] or current[3]):
+            raise ValueError(f"Hunk at line {current[0] + 1} is shorter than its header counts")
+    
+    for line in diff.splitlines(keepends=True):
+        if line.startswith(b"@@"):
+            match = re.match(rb"@@ -(\d+)(?:,(\d+))? \+\d+(?:,(\d+))? @@", line)
+            if not match:
+                raise ValueError(f"Malformed hunk header: {line.decode('utf-8', 'replace').strip()}")
+            check_complete(hunk)
+            old_start, old_count = int(match.group(1)), int(match.group(2) or 1)
+            hunk = [old_start - 1 if old_count else old_start, [], old_count, int(match.group(3) or 1)]
+            hunks.append(hunk)
+        elif hunk is None:
+            continue  # file headers (---/+++) and preamble
+        elif line.startswith(b"\\"):
+            if hunk[1]:
+                kind, text = hunk[1][-1]
+                hunk[1][-1] = (kind, text.rstrip(b"\r\n"))
+        elif hunk[2] or hunk[3]:
+            kind, text = line[:1], line[1:]
+            if line.strip() == b"" and kind not in (b" ", b"-", b"+"):
+                kind, text = b" ", line  # some tools drop the space on empty context lines
+            elif kind not in (b" ", b"-", b"+"):
+                raise ValueError(f"Unexpected diff line: {line.decode('utf-8', 'replace').strip()}")
+            if kind != b"+":
+                hunk[2] -= 1
+            if kind != b"-":
+                hunk[3] -= 1
+            if hunk[2] < 0 or hunk[3] < 0:
+                raise ValueError(f"Hunk at line {hunk[0] + 1} is longer than its header counts")
+            hunk[1].append((kind, text))
+        elif line.strip():
+            raise ValueError(f"Hunk at line {hunk[0] + 1} is longer than its header counts")
+        # blank lines after a complete hunk (e.g. a trailing newline on the diff) are ignored
+    check_complete(hunk)
+    
+    if not hunks:
+        raise ValueError("Diff contains no hunks")
+    
+    for start, lines, *_ in hunks:
+        if start < position or start > len(old_lines):
+            raise PatchConflict(f"Hunk at line {start + 1} does not fit the file")
+        out.extend(old_lines[position:start])
+        position = start
+        for kind, text in lines:
+            if kind == b"+":
+                out.append(text)
+                continue
+            if position >= len(old_lines) or old_lines[position] != text:
+                raise PatchConflict(f"Diff does not match the file at line {position + 1}")
+            if kind == b" ":
+                out.append(text)
+            position += 1
+    
+    out.extend(old_lines[position:])
+    return b"".join(out)
+
+class EventLog:
+    """Append-only segmented log of Godot events with group-commit fsync"""
+    
+    RECORD_HEADER = struct.Struct("<II")  # payload length, crc32
+    SEGMENT_FORMAT = "events-{:06d}.log"
+    POSITION_SHIFT = 40  # session index entries pack (segment id << 40) | record offset
+    
+    def __init__(self, directory: str, segment_size: int = 8 * 1024 * 1024,
+                 commit_interval: float = 0.05, executor=None):
+        self.directory = directory
+        self.executor = executor
+        self.segment_size = segment_size
+        self.commit_interval = commit_interval
+        os.makedirs(directory, exist_ok=True)
+        
+        self.segments = sorted(
+            int(name[7:13]) for name in os.listdir(directory)
+            if name.startswith("events-") and name.endswith(".log")
+        ) or [0]
+        self.active_id = self.segments[-1]
+        self.active_size = self.recover(self.segment_path(self.active_id))
+        self.file = open(self.segment_path(self.active_id), "ab")
+        
+        self.pending = []
+        self.appended = 0
+        self.committed = 0
+        self.commits = 0
+        self.commit_failures = 0
+        self.commit_lock = asyncio.Lock()
+        self.commit_task = None
+        self.mmaps = {}  # segment id -> mmap of a sealed segment
+        
+        self.session_index = {}  # session id -> array of packed record positions, in log order
+        for segment_id in self.segments:
+            self.index_segment(segment_id)
+    
+    def segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.directory, self.SEGMENT_FORMAT.format(segment_id))
+    
+    def recover(self, path: str) -> int:
+        """Truncate a torn record left at the end of a segment; return its valid size"""
+        if not os.path.exists(path):
+            return 0
+        
+        valid = 0
+        with open(path, "rb") as f:
+            data = f.read()
+        for _, end in self.iter_records(data, 0, len(data)):
+            valid = end
+        if valid < len(data):
+            logger.warning(f"Truncating torn tail of {path} at {valid} bytes")
+            with open(path, "r+b") as f:
+                f.truncate(valid)
+        return valid
+    
+    def index_segment(self, segment_id: int):
+        """Add a segment's records to the per-session index (at open, after recovery)"""
+        path = self.segment_path(segment_id)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        offset = 0
+        for payload, end in self.iter_records(data, 0, len(data)):
+            try:
+                session_id = json.loads(payload).get("session_id")
+            except (ValueError, AttributeError):
+                session_id = None
+            self.index_position(session_id, segment_id, offset)
+            offset = end
+    
+    def index_position(self, session_id, segment_id: int, offset: int):
+        if isinstance(session_id, str) and session_id:
+            positions = self.session_index.get(session_id)
+            if positions is None:
+                positions = self.session_index[session_id] = array("Q")
+            positions.append(segment_id << self.POSITION_SHIFT | offset)
+    
+    def iter_records(self, data, offset: int, end: int):
+        """Yield (payload, next_offset) for each intact record in data[offset:end]"""
+        header_size = self.RECORD_HEADER.size
+        while offset + header_size <= end:
+            length, crc = self.RECORD_HEADER.unpack_from(data, offset)
+            start = offset + header_size
+            if start + length > end:
+                return
+            payload = data[start:start + length]
+            if zlib.crc32(payload) != crc:
+                return
+            offset = start + length
+            yield payload, offset
+    
+    def append(self, event: Dict[str, Any]) -> int:
+        """Queue an event for the next group commit; returns its sequence number"""
+        payload = json.dumps(event, separators=(",", ":")).encode("utf-8")
+        record = self.RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        self.pending.append((record, event.get("session_id")))
+        self.appended += 1
+        
+        if self.commit_task is None or self.commit_task.done():
+            self.commit_task = asyncio.ensure_future(self.commit_after(self.commit_interval))
+        return self.appended
+    
+    async def commit_after(self, delay: float):
+        """Commit after delay, retrying with backoff while writes fail"""
+        while True:
+            await asyncio.sleep(delay)
+            # Shielded so cancelling the timer (close) never interrupts a batch mid-write
+            if await asyncio.shield(self.commit()):
+                return
+            delay = min(max(delay * 2, 0.1), 5.0)
+    
+    async def commit(self) -> bool:
+        """Write and fsync all pending records as one batch; False if the write failed"""
+        async with self.commit_lock:
+            if not self.pending:
+                return True
+            batch, self.pending = self.pending, []
+            try:
+                placed = await asyncio.get_running_loop().run_in_executor(self.executor, self.write_batch, batch)
+            except OSError as error:
+                # Records synced before a segment roll are durable; the rest go back to the front
+                synced = getattr(error, "synced", 0)
+                for (_, session_id), (segment_id, offset) in zip(batch, getattr(error, "placed", [])[:synced]):
+                    self.index_position(session_id, segment_id, offset)
+                self.pending[:0] = batch[synced:]
+                self.committed += synced
+                self.commit_failures += 1
+                logger.error(f"Event log commit failed, keeping {len(batch) - synced} events for retry: {error}")
+                return False
+            for (_, session_id), (segment_id, offset) in zip(batch, placed):
+                self.index_position(session_id, segment_id, offset)
+            self.committed += len(batch)
+            self.commits += 1
+            return True
+    
+    def write_batch(self, batch):
+        """Append and fsync records, returning each one's (segment, offset); on failure the
+        unsynced tail is cut off before re-raising"""
+        synced = 0
+        start = self.active_size
+        placed = []
+        try:
+            for index, (record, _) in enumerate(batch):
+                if self.active_size and self.active_size + len(record) > self.segment_size:
+                    self.roll_segment()
+                    synced, start = index, 0
+                placed.append((self.active_id, self.active_size))
+                self.file.write(record)
+                self.active_size += len(record)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        except OSError as error:
+            error.synced = synced
+            error.placed = placed
+            self.discard_tail(start)
+            raise
+        return placed
+    
+    def discard_tail(self, size: int):
+        """Reopen the active segment cut back to size, so a retry does not follow a torn record"""
+        try:
+            self.file.close()
+        except OSError:
+            pass  # the unflushed bytes are being discarded anyway
+        path = self.segment_path(self.active_id)
+        try:
+            os.truncate(path, size)
+        except OSError as error:
+            logger.error(f"Could not truncate {path} to {size} bytes: {error}")
+        self.file = open(path, "ab")
+        self.active_size = size
+    
+    def roll_segment(self):
+        """Seal the active segment and start a new one"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        
+        self.active_id += 1
+        self.active_size = 0
+        self.segments.append(self.active_id)
+        self.file = open(self.segment_path(self.active_id), "ab")
+    
+    def segment_view(self, segment_id: int):
+        """Return (buffer, readable size) for a segment using a memory map"""
+        if segment_id in self.mmaps:
+            view = self.mmaps[segment_id]
+            return view, len(view)
+        
+        size = self.active_size if segment_id == self.active_id else os.path.getsize(self.segment_path(segment_id))
+        if size == 0:
+            return b"", 0
+        with open(self.segment_path(segment_id), "rb") as f:
+            view = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        if segment_id != self.active_id:
+            self.mmaps[segment_id] = view
+        return view, size
+    
+    def read(self, segment_id: int = None, offset: int = 0, limit: int = 1000):
+        """Read committed events starting at a (segment, offset) cursor"""
+        if segment_id is None:
+            segment_id = self.segments[0]
+        
+        events = []
+        for current in self.segments:
+            if current < segment_id:
+                continue
+            if current > segment_id:
+                offset = 0
+            
+            view, size = self.segment_view(current)
+            for payload, end in self.iter_records(view, offset, size):
+                events.append(json.loads(payload))
+                offset = end
+                if len(events) >= limit:
+                    return events, {"segment": current, "offset": offset}
+            segment_id = current
+        
+        return events, {"segment": segment_id, "offset": offset}
+    
+    def read_session(self, session_id: str, offset: int = 0, limit: int = 1000):
+        """Read one session's committed events from its index; offset counts that session's events"""
+        positions = self.session_index.get(session_id, ())
+        events = []
+        for position in positions[offset:offset + limit]:
+            segment_id = position >> self.POSITION_SHIFT
+            record_offset = position & ((1 << self.POSITION_SHIFT) - 1)
+            view, size = self.segment_view(segment_id)
+            for payload, _ in self.iter_records(view, record_offset, size):
+                events.append(json.loads(payload))
+                break
+        return events, {"session_id": session_id, "offset": offset + len(events)}
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "segments": len(self.segments),
+            "active_segment": self.active_id,
+            "active_size": self.active_size,
+            "appended": self.appended,
+            "committed": self.committed,
+            "pending": len(self.pending),
+            "indexed_sessions": len(self.session_index),
+            "group_commits": self.commits,
+            "commit_failures": self.commit_failures
+        }
+    
+    async def close(self):
+        """Stop the commit timer, commit what is pending and close the active segment"""
+        if self.commit_task is not None and not self.commit_task.done():
+            self.commit_task.cancel()
+            try:
+                await self.commit_task
+            except asyncio.CancelledError:
+                pass
+        if not await self.commit():
+            logger.error(f"Closing event log with {len(self.pending)} uncommitted events")
+        self.file.close()
+        for view in self.mmaps.values():
+            view.close()
+        self.mmaps.clear()
+
+# Compact binary event batches (little-endian, as written by Godot's StreamPeerBuffer):
+#   "GEV1" | u32 request id | str session id | u16 count | count x (u8 type code, fields)
+# Strings are u32 length + UTF-8 bytes (StreamPeerBuffer.put_utf8_string). Type code 0
+# carries any other event as a JSON string.
+BINARY_CONTENT_TYPE = "application/x-godot-events"
+BINARY_MAGIC = b"GEV1"
+BINARY_HEADER = struct.Struct("<4sI")
+BINARY_COUNT = struct.Struct("<H")
+BINARY_CODE = struct.Struct("<B")
+BINARY_LENGTH = struct.Struct("<I")
+BINARY_LIGHT_PULSE = struct.Struct("<ffff")  # x, y, energy_remaining, energy_percentage
+BINARY_ENERGY_PICKUP = struct.Struct("<ff")  # amount, energy_remaining
+BINARY_GAME_START = struct.Struct("<HH")  # total_villagers, total_shadows
+BINARY_FLOAT = struct.Struct("<f")
+
+def read_binary_string(data, offset: int):
+    (length,) = BINARY_LENGTH.unpack_from(data, offset)
+    offset += BINARY_LENGTH.size
+    if offset + length > len(data):
+        raise ValueError("Truncated string in binary batch")
+    return bytes(data[offset:offset + length]).decode("utf-8"), offset + length
+
+def decode_binary_events(data: bytes):
+    """Decode a binary event batch straight into event objects; returns (request id, events, shaped).
+    shaped[i] is True when event i came from a fixed binary layout, whose field types already
+    match its schema, and False for generic (JSON-coded) events that still need validating"""
+    try:
+        magic, request_id = BINARY_HEADER.unpack_from(data, 0)
+        if magic != BINARY_MAGIC:
+            raise ValueError("Not a binary event batch")
+        session_id, offset = read_binary_string(data, BINARY_HEADER.size)
+        (count,) = BINARY_COUNT.unpack_from(data, offset)
+        offset += BINARY_COUNT.size
+        
+        events = []
+        shaped = []
+        for _ in range(count):
+            (code,) = BINARY_CODE.unpack_from(data, offset)
+            offset += BINARY_CODE.size
+            
+            if code == 1:
+                x, y, energy, percentage = BINARY_LIGHT_PULSE.unpack_from(data, offset)
+                offset += BINARY_LIGHT_PULSE.size
+                event = {"type": "light_pulse_used", "position": {"x": x, "y": y},
+                         "energy_remaining": energy, "energy_percentage": percentage}
+            elif code == 2:
+                amount, energy = BINARY_ENERGY_PICKUP.unpack_from(data, offset)
+                offset += BINARY_ENERGY_PICKUP.size
+                event = {"type": "energy_pickup", "amount": amount, "energy_remaining": energy}
+            elif code == 3:
+                name, offset = read_binary_string(data, offset)
+                event = {"type": "shadow_defeated", "shadow_name": name}
+            elif code == 4:
+                name, offset = read_binary_string(data, offset)
+                event = {"type": "villager_cleansed", "villager_name": name}
+            elif code == 5:
+                event = {"type": "barriers_removed"}
+            elif code == 6:
+                (game_time,) = BINARY_FLOAT.unpack_from(data, offset)
+                offset += BINARY_FLOAT.size
+                event = {"type": "victory", "game_time": game_time}
+            elif code == 7:
+                villagers, shadows = BINARY_GAME_START.unpack_from(data, offset)
+                offset += BINARY_GAME_START.size
+                event = {"type": "game_start", "total_villagers": villagers, "total_shadows": shadows}
+            elif code == 0:
+                text, offset = read_binary_string(data, offset)
+                event = json.loads(text)
+                if not isinstance(event, dict):
+                    raise ValueError("Generic binary event must be a JSON object")
+            else:
+                raise ValueError(f"Unknown binary event code: {code}")
+            
+            if session_id:
+                event.setdefault("session_id", session_id)
+            events.append(event)
+            shaped.append(code != 0)
+    except struct.error as e:
+        raise ValueError(f"Truncated binary batch: {e}")
+    
+    return request_id, events, shaped
+
+def build_event_schemas() -> Dict[str, Any]:
+    """Schemas for the events the game sends (extra keys such as session_id are allowed)"""
+    config = ConfigDict(strict=True, extra="allow")
+    
+    class Position(TypedDict):
+        __pydantic_config__ = config
+        x: float
+        y: float
+    
+    class LightPulseUsed(TypedDict):
+        __pydantic_config__ = config
+        type: Literal["light_pulse_used"]
+        position: Position
+        energy_remaining: float
+        energy_percentage: float
+    
+    class EnergyPickup(TypedDict):
+        __pydantic_config__ = config
+        type: Literal["energy_pickup"]
+        amount: float
+        energy_remaining: float
+    
+    class ShadowDefeated(TypedDict):
+        __pydantic_config__ = config
+        type: Literal["shadow_defeated"]
+        shadow_name: str
+    
+    class VillagerCleansed(TypedDict):
+        __pydantic_config__ = config
+        type: Literal["villager_cleansed"]
+        villager_name: str
+    
+    class GameStart(TypedDict):
+        __pydantic_config__ = config
+        type: Literal["game_start"]
+        total_villagers: int
+        total_shadows: int
+    
+    class Victory(TypedDict):
+        __pydantic_config__ = config
+        type: Literal["victory"]
+        game_time: NotRequired[float]
+    
+    return {
+        "light_pulse_used": LightPulseUsed,
+        "energy_pickup": EnergyPickup,
+        "shadow_defeated": ShadowDefeated,
+        "villager_cleansed": VillagerCleansed,
+        "game_start": GameStart,
+        "victory": Victory
+    }
+
+class EventSchemaRegistry:
+    """Validators for known event types, compiled once and timed per type"""
+    
+    def __init__(self, schemas: Dict[str, Any] = None):
+        self.validators = {}
+        self.stats = {}
+        if TypeAdapter is None:
+            logger.warning("pydantic not found - event schema validation disabled")
+            return
+        for event_type, schema in (schemas or build_event_schemas()).items():
+            self.register(event_type, schema)
+    
+    def register(self, event_type: str, schema):
+        self.validators[event_type] = TypeAdapter(schema).validate_python
+        self.stats[event_type] = {"validated": 0, "rejected": 0, "seconds": 0.0}
+    
+    def validate(self, event: Dict[str, Any]):
+        """Raise ValueError if a known event type is malformed; unknown types pass through"""
+        validator = self.validators.get(event.get("type"))
+        if validator is None:
+            return
+        
+        stats = self.stats[event["type"]]
+        start = time.perf_counter()
+        try:
+            validator(event)
+        except ValidationError as e:
+            stats["rejected"] += 1
+            problems = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc']) or 'event'}: {error['msg']}"
+                for error in e.errors(include_url=False)
+            )
+            raise ValueError(f"Invalid {event['type']} event: {problems}") from None
+        else:
+            stats["validated"] += 1
+        finally:
+            stats["seconds"] += time.perf_counter() - start
+    
+    def report(self) -> Dict[str, Any]:
+        return {
+            event_type: {
+                **stats,
+                "avg_us": round(stats["seconds"] * 1e6 / max(stats["validated"] + stats["rejected"], 1), 3)
+            }
+            for event_type, stats in self.stats.items()
+        }
+
+class IngestQueueFull(Exception):
+    """Raised when the ingestion queue cannot take more events"""
+    
+    def __init__(self, retry_after: int):
+        super().__init__("Ingestion queue full")
+        self.retry_after = retry_after
+
+class IngestQueue:
+    """Bounded queue between the HTTP handlers and a pool of event consumers. The handler is a
+    coroutine; workers only overlap while it awaits (session restores on the I/O pool)."""
+    
+    def __init__(self, handler, maxsize: int = 10000, workers: int = 4, retry_after: int = 1):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.worker_count = workers
+        self.retry_after = retry_after
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.workers = []
+        
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.high_water = 0
+    
+    def put_many(self, events):
+        """Enqueue all events or none of them"""
+        if self.maxsize - self.queue.qsize() < len(events):
+            self.dropped += len(events)
+            raise IngestQueueFull(self.retry_after)
+        
+        for event in events:
+            self.queue.put_nowait(event)
+        self.enqueued += len(events)
+        self.high_water = max(self.high_water, self.queue.qsize())
+    
+    async def worker(self):
+        while True:
+            event = await self.queue.get()
+            try:
+                await self.handler(event)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error processing event: {e}")
+            finally:
+                self.queue.task_done()
+    
+    def start(self):
+        self.workers = [asyncio.ensure_future(self.worker()) for _ in range(self.worker_count)]
+    
+    async def stop(self, timeout: float = 5.0):
+        """Drain queued events, then cancel the consumers"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self.queue.qsize()} queued events on shutdown")
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.queue.qsize(),
+            "capacity": self.maxsize,
+            "workers": len(self.workers),
+            "high_water": self.high_water,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors
+        }
+
+class StringDictionary:
+    """Interns repeated strings (names, ids) as small integer codes"""
+    
+    MISSING = 0xFFFFFFFF
+    
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+    
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+    
+    def decode(self, code: int) -> str:
+        return self.values[code]
+
+class ColumnTable:
+    """Typed array-backed columns for one event type, ordered by receive time"""
+    
+    FLOAT_TYPE = "f"  # float32 is plenty for positions and energy values
+    CODE_TYPE = "I"
+    
+    def __init__(self, strings: StringDictionary):
+        self.strings = strings
+        self.timestamps = array("d")
+        self.columns = {}
+        self.kinds = {}  # column name -> "num" or "str"
+        self.missing = {}  # column name -> number of rows without a value
+    
+    def __len__(self):
+        return len(self.timestamps)
+    
+    def add_column(self, name: str, kind: str):
+        rows = len(self.timestamps)
+        if kind == "num":
+            column = array(self.FLOAT_TYPE, [math.nan]) * rows
+        else:
+            column = array(self.CODE_TYPE, [StringDictionary.MISSING]) * rows
+        self.columns[name] = column
+        self.kinds[name] = kind
+        self.missing[name] = rows
+    
+    def append(self, fields: Dict[str, Any], timestamp: float):
+        for name, value in fields.items():
+            if name not in self.columns:
+                self.add_column(name, "str" if isinstance(value, str) else "num")
+        
+        for name, column in self.columns.items():
+            value = fields.get(name)
+            if self.kinds[name] == "num":
+                if isinstance(value, (int, float)):
+                    column.append(value)
+                    continue
+                column.append(math.nan)
+            else:
+                if isinstance(value, str):
+                    column.append(self.strings.encode(value))
+                    continue
+                column.append(StringDictionary.MISSING)
+            self.missing[name] += 1
+        self.timestamps.append(timestamp)
+    
+    def row_range(self, start: float = None, end: float = None):
+        lo = bisect.bisect_left(self.timestamps, start) if start is not None else 0
+        hi = bisect.bisect_right(self.timestamps, end) if end is not None else len(self.timestamps)
+        return lo, max(lo, hi)
+    
+    def aggregate(self, name: str, start: float = None, end: float = None) -> Dict[str, Any]:
+        """count/sum/min/max for a numeric column, value counts for a string column"""
+        column = self.columns[name]
+        lo, hi = self.row_range(start, end)
+        values = column[lo:hi]
+        
+        if self.kinds[name] == "str":
+            counts = Counter(values)
+            counts.pop(StringDictionary.MISSING, None)
+            return {
+                "count": sum(counts.values()),
+                "values": {self.strings.decode(code): n for code, n in counts.items()}
+            }
+        
+        if self.missing[name]:
+            values = [v for v in values if v == v]  # drop NaN placeholders
+        if not values:
+            return {"count": 0, "sum": 0.0, "min": None, "max": None}
+        return {"count": len(values), "sum": math.fsum(values), "min": min(values), "max": max(values)}
+    
+    def nbytes(self) -> int:
+        total = self.timestamps.itemsize * len(self.timestamps)
+        for column in self.columns.values():
+            total += column.itemsize * len(column)
+        return total
+
+class EventStore:
+    """Columnar in-memory store of Godot events, one table per event type"""
+    
+    def __init__(self):
+        self.strings = StringDictionary()
+        self.tables = {}
+    
+    @staticmethod
+    def flatten(data: Dict[str, Any], prefix: str = "", out: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Flatten nested dicts into dotted column names (position.x, position.y)"""
+        if out is None:
+            out = {}
+        for key, value in data.items():
+            if isinstance(value, dict):
+                EventStore.flatten(value, f"{prefix}{key}.", out)
+            elif isinstance(value, (str, int, float)):
+                out[f"{prefix}{key}"] = value
+        return out
+    
+    def append(self, data: Dict[str, Any], timestamp: float):
+        event_type = data.get("type", "unknown")
+        table = self.tables.get(event_type)
+        if table is None:
+            table = self.tables[event_type] = ColumnTable(self.strings)
+        
+        fields = self.flatten(data)
+        fields.pop("type", None)
+        table.append(fields, timestamp)
+    
+    def query(self, event_type: str, field: str, start: float = None, end: float = None) -> Dict[str, Any]:
+        table = self.tables.get(event_type)
+        if table is None:
+            raise KeyError(f"Unknown event type: {event_type}")
+        if field not in table.columns:
+            raise KeyError(f"Unknown field for {event_type}: {field}")
+        return table.aggregate(field, start, end)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "types": {
+                event_type: {
+                    "rows": len(table),
+                    "columns": table.kinds,
+                    "bytes": table.nbytes()
+                }
+                for event_type, table in self.tables.items()
+            },
+            "strings": len(self.strings.values)
+        }
+
+class HeatmapPyramid:
+    """Count grids at power-of-two bin sizes over a world rectangle, updated incrementally per
+    event. Points outside the rectangle are counted separately rather than binned."""
+    
+    def __init__(self, x: int = 0, y: int = 0, width: int = 4096, height: int = 1024,
+                 base_bin: int = 8, levels: int = 8):
+        self.x = x  # world position of the grid's top-left corner
+        self.y = y
+        self.width = width
+        self.height = height
+        self.base_bin = base_bin
+        self.total = 0
+        self.outside = 0
+        self.levels = []  # (bin size, columns, rows, counts), finest first
+        for level in range(levels):
+            bin_size = base_bin << level
+            columns = -(-width // bin_size)
+            rows = -(-height // bin_size)
+            self.levels.append((bin_size, columns, rows, array("I", [0]) * (columns * rows)))
+    
+    def add(self, x: float, y: float):
+        x -= self.x
+        y -= self.y
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            self.outside += 1
+            return
+        for bin_size, columns, rows, counts in self.levels:
+            counts[int(y // bin_size) * columns + int(x // bin_size)] += 1
+        self.total += 1
+    
+    def snap(self, value: float, up: bool = False) -> int:
+        cells = math.ceil(value / self.base_bin) if up else math.floor(value / self.base_bin)
+        return cells * self.base_bin
+    
+    def query(self, bin_size: float, x0: float = None, x1: float = None, y0: float = None, y1: float = None) -> Dict[str, Any]:
+        """Counts per bin over a region (world coordinates); bin size and bounds snap to the base grid"""
+        bin_size = max(self.base_bin, self.snap(bin_size + self.base_bin / 2))
+        x0 = min(max(self.snap(0 if x0 is None else x0 - self.x), 0), self.width)
+        y0 = min(max(self.snap(0 if y0 is None else y0 - self.y), 0), self.height)
+        x1 = min(max(self.snap(self.width if x1 is None else x1 - self.x, up=True), x0), self.width)
+        y1 = min(max(self.snap(self.height if y1 is None else y1 - self.y, up=True), y0), self.height)
+        
+        # Coarsest level whose cells tile both the requested bins and the region bounds
+        level_bin, columns, rows, counts = self.levels[0]
+        for level in self.levels:
+            if all(value % level[0] == 0 for value in (bin_size, x0, y0)) \
+                    and (x1 % level[0] == 0 or x1 == self.width) \
+                    and (y1 % level[0] == 0 or y1 == self.height):
+                level_bin, columns, rows, counts = level
+        
+        span = bin_size // level_bin
+        first_column, last_column = x0 // level_bin, -(-x1 // level_bin)
+        first_row, last_row = y0 // level_bin, -(-y1 // level_bin)
+        out_columns = -(-(x1 - x0) // bin_size)
+        out_rows = -(-(y1 - y0) // bin_size)
+        
+        grid = []
+        for out_row in range(out_rows):
+            row_start = first_row + out_row * span
+            row_end = min(row_start + span, last_row, rows)
+            line = []
+            for out_column in range(out_columns):
+                column_start = first_column + out_column * span
+                column_end = min(column_start + span, last_column, columns)
+                line.append(sum(
+                    sum(counts[r * columns + column_start:r * columns + column_end])
+                    for r in range(row_start, row_end)
+                ))
+            grid.append(line)
+        
+        return {
+            "bin_size": bin_size,
+            "level_bin_size": level_bin,
+            "x0": x0 + self.x, "x1": x1 + self.x, "y0": y0 + self.y, "y1": y1 + self.y,
+            "columns": out_columns,
+            "rows": out_rows,
+            "total": self.total,
+            "outside": self.outside,
+            "grid": grid
+        }
+
+class SessionTracker:
+    """Folds events into per-session game progress records as they arrive"""
+    
+    def __init__(self, idle_timeout: float = 600.0):
+        self.idle_timeout = idle_timeout
+        self.sessions = {}  # session id -> progress record
+        self.directory = None  # where idle sessions are evicted to
+        self.evicted = 0
+        self.saving = {}  # session id -> evicted record not yet on disk
+    
+    @staticmethod
+    def new_state(session_id: str, now: float) -> Dict[str, Any]:
+        return {
+            "session_id": session_id,
+            "started_at": now,
+            "last_seen": now,
+            "events": 0,
+            "light_pulses": 0,
+            "energy_pickups": 0,
+            "energy_remaining": None,
+            "villagers_cleansed": 0,
+            "total_villagers": None,
+            "shadows_defeated": 0,
+            "total_shadows": None,
+            "barriers_removed": False,
+            "victorious": False
+        }
+    
+    def session_path(self, session_id: str) -> str:
+        safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in session_id)
+        return os.path.join(self.directory, f"{safe_id}.json")
+    
+    def apply(self, event: Dict[str, Any], now: float):
+        """Update the event's session in O(1), in memory only"""
+        session_id = event.get("session_id")
+        if not isinstance(session_id, str) or not session_id:
+            return
+        
+        state = self.sessions.get(session_id)
+        if state is None:
+            # Evicted sessions are restored on the I/O pool before apply (see needs_restore)
+            state = self.saving.pop(session_id, None) or self.new_state(session_id, now)
+            self.sessions[session_id] = state
+        state["last_seen"] = now
+        state["events"] += 1
+        
+        event_type = event.get("type")
+        if event_type == "game_start":
+            state["total_villagers"] = event.get("total_villagers", state["total_villagers"])
+            state["total_shadows"] = event.get("total_shadows", state["total_shadows"])
+        elif event_type == "light_pulse_used":
+            state["light_pulses"] += 1
+            state["energy_remaining"] = event.get("energy_remaining", state["energy_remaining"])
+        elif event_type == "energy_pickup":
+            state["energy_pickups"] += 1
+            state["energy_remaining"] = event.get("energy_remaining", state["energy_remaining"])
+        elif event_type == "shadow_defeated":
+            state["shadows_defeated"] += 1
+        elif event_type == "barriers_removed":
+            state["barriers_removed"] = True
+        elif event_type == "villager_cleansed":
+            state["villagers_cleansed"] += 1
+            total = state["total_villagers"]
+            if total is not None and state["villagers_cleansed"] >= total:
+                state["victorious"] = True
+        elif event_type == "victory":
+            state["victorious"] = True
+    
+    def needs_restore(self, session_id) -> bool:
+        """True if the session is not in memory and may have been evicted to disk"""
+        return (bool(self.directory) and isinstance(session_id, str) and bool(session_id)
+                and session_id not in self.sessions and session_id not in self.saving)
+    
+    def restore(self, session_id: str, state, now: float):
+        """Make a session resident again with the record load() returned (None: a new session)"""
+        if session_id not in self.sessions and session_id not in self.saving:
+            self.sessions[session_id] = state or self.new_state(session_id, now)
+    
+    def load(self, session_id: str):
+        """Read an evicted session from disk (runs on the I/O pool)"""
+        if not self.directory:
+            return None
+        try:
+            with open(self.session_path(session_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def get(self, session_id: str):
+        return self.resident(session_id) or self.load(session_id)
+    
+    def resident(self, session_id: str):
+        return self.sessions.get(session_id) or self.saving.get(session_id)
+    
+    @staticmethod
+    def field_matches(stored, value: str) -> bool:
+        """Compare a stored field with a query-string value parsed according to the field's type"""
+        if stored is None:
+            return value == "null"
+        if isinstance(stored, bool):
+            return value == ("true" if stored else "false")
+        if isinstance(stored, (int, float)):
+            try:
+                return stored == float(value)
+            except ValueError:
+                return False
+        return str(stored) == value
+    
+    def load_evicted(self, skip) -> list:
+        """Read every evicted session except the ids in skip (runs on the I/O pool)"""
+        states = []
+        if self.directory:
+            for name in os.listdir(self.directory):
+                session_id = name[:-5]
+                if name.endswith(".json") and session_id not in skip:
+                    state = self.load(session_id)
+                    if state:
+                        states.append(state)
+        return states
+    
+    def query(self, filters: Dict[str, str], evicted=()):
+        """Sessions whose fields equal every (query-string) filter value; evicted adds records
+        load_evicted() read, skipping any that became resident again meanwhile"""
+        states = list(self.sessions.values()) + list(self.saving.values())
+        states.extend(state for state in evicted if not self.resident(state.get("session_id")))
+        return [
+            state for state in states
+            if all(key in state and self.field_matches(state[key], value) for key, value in filters.items())
+        ]
+    
+    def pop_idle(self, now: float):
+        """Remove sessions idle past the timeout; they stay readable until saved"""
+        if not self.directory:
+            return []
+        
+        idle = [sid for sid, state in self.sessions.items() if now - state["last_seen"] > self.idle_timeout]
+        states = [self.sessions.pop(session_id) for session_id in idle]
+        for state in states:
+            self.saving[state["session_id"]] = state
+        self.evicted += len(states)
+        return states
+    
+    def save(self, states) -> int:
+        """Write evicted sessions to disk via temp file + rename (runs on the I/O pool). A failure
+        carries how many states landed first as error.saved"""
+        for saved, state in enumerate(states):
+            path = self.session_path(state["session_id"])
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+                os.replace(temp_path, path)
+            except OSError as e:
+                e.saved = saved
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+                raise
+        return len(states)
+    
+    def finish_save(self, states, saved: int):
+        """Forget the first saved states; the rest go back into memory unless an event already revived them"""
+        for state in states[:saved]:
+            if self.saving.get(state["session_id"]) is state:
+                del self.saving[state["session_id"]]
+        for state in states[saved:]:
+            if self.saving.get(state["session_id"]) is state:
+                self.sessions[state["session_id"]] = self.saving.pop(state["session_id"])
+                self.evicted -= 1
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"active": len(self.sessions), "evicted": self.evicted}
+
+class ProjectIndex:
+    """In-memory index of the project tree (what the Godot editor sees: hidden entries and
+    directories holding a .gdignore are skipped), kept sorted by path for prefix queries"""
+    
+    FILE_TYPES = {
+        ".gd": "script", ".cs": "script", ".tscn": "scene", ".scn": "scene",
+        ".tres": "resource", ".res": "resource", ".gdshader": "shader", ".import": "import",
+        ".png": "image", ".svg": "image", ".jpg": "image", ".webp": "image",
+        ".wav": "audio", ".ogg": "audio", ".mp3": "audio", ".ttf": "font", ".otf": "font"
+    }
+    
+    def __init__(self, workers: int = 8):
+        self.workers = workers
+        self.root = None
+        self.entries = {}  # relative path -> entry
+        self.paths = []  # sorted relative paths
+        self.lock = threading.Lock()  # updated from I/O threads, queried from the event loop
+        self.build_seconds = 0.0
+    
+    def make_entry(self, relative: str, stat, is_dir: bool) -> Dict[str, Any]:
+        kind = "directory" if is_dir else self.FILE_TYPES.get(os.path.splitext(relative)[1].lower(), "file")
+        return {
+            "path": relative,
+            "res_path": f"res://{relative}",
+            "type": kind,
+            "size": 0 if is_dir else stat.st_size,
+            "mtime": stat.st_mtime
+        }
+    
+    def scan(self, relative: str):
+        """List one directory; returns (entries, subdirectories to scan)"""
+        entries = []
+        subdirs = []
+        with os.scandir(os.path.join(self.root, relative)) as it:
+            for item in it:
+                if item.name.startswith("."):
+                    continue
+                child = f"{relative}/{item.name}" if relative else item.name
+                is_dir = item.is_dir(follow_symlinks=False)
+                if is_dir and os.path.exists(os.path.join(item.path, ".gdignore")):
+                    continue
+                entries.append(self.make_entry(child, item.stat(follow_symlinks=False), is_dir))
+                if is_dir:
+                    subdirs.append(child)
+        return entries, subdirs
+    
+    def build(self, root: str):
+        """Index the whole tree, scanning each level's directories in parallel (runs on the I/O pool)"""
+        started = time.perf_counter()
+        self.root = root
+        entries = {}
+        level = [""]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mcp-scan") as executor:
+            while level:
+                next_level = []
+                for found, subdirs in executor.map(self.scan, level):
+                    for entry in found:
+                        entries[entry["path"]] = entry
+                    next_level.extend(subdirs)
+                level = next_level
+        
+        with self.lock:
+            self.entries = entries
+            self.paths = sorted(entries)
+        self.build_seconds = time.perf_counter() - started
+    
+    def relative(self, full_path: str):
+        """Project-relative path, or None for paths the index does not cover"""
+        if self.root is None:
+            return None
+        relative = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+        parts = relative.split("/")
+        if relative == "." or parts[0] == ".." or any(part.startswith(".") for part in parts):
+            return None
+        return relative
+    
+    def refresh(self, full_path: str):
+        """Bring one path (and any new parent directories) up to date after a change"""
+        relative = self.relative(full_path)
+        if relative is None:
+            return
+        try:
+            stat = os.stat(full_path)
+        except FileNotFoundError:
+            self.remove(relative)
+            return
+        
+        updates = [self.make_entry(relative, stat, os.path.isdir(full_path))]
+        parent = os.path.dirname(relative)
+        while parent and parent not in self.entries:
+            updates.append(self.make_entry(parent, os.stat(os.path.join(self.root, parent)), True))
+            parent = os.path.dirname(parent)
+        
+        with self.lock:
+            for entry in updates:
+                if entry["path"] not in self.entries:
+                    bisect.insort(self.paths, entry["path"])
+                self.entries[entry["path"]] = entry
+    
+    def apply_deltas(self, deltas):
+        """ProjectWatcher subscriber"""
+        for delta in deltas:
+            if delta["type"] == "rescan":
+                self.build(self.root)
+            else:
+                self.refresh(delta["path"])
+    
+    def files(self, extensions) -> list:
+        """Relative paths of indexed files ending in one of the extensions"""
+        with self.lock:
+            return [path for path in self.paths
+                    if path.endswith(extensions) and self.entries[path]["type"] != "directory"]
+    
+    def remove(self, relative: str):
+        """Drop a path and everything below it"""
+        with self.lock:
+            start = bisect.bisect_left(self.paths, relative)
+            end = bisect.bisect_left(self.paths, relative + "/\uffff")
+            for path in self.paths[start:end]:
+                if path == relative or path.startswith(relative + "/"):
+                    del self.entries[path]
+            self.paths[start:end] = [p for p in self.paths[start:end] if p in self.entries]
+    
+    def query(self, prefix: str = "", depth: int = None, pattern: str = None, kind: str = None,
+              offset: int = 0, limit: int = 1000) -> Dict[str, Any]:
+        """Entries under prefix, at most depth levels below it, matching a glob and type, paginated"""
+        prefix = prefix.removeprefix("res://").strip("/")
+        base_depth = prefix.count("/") + 1 if prefix else 0
+        # Globs without a slash match file names, like find -name
+        match_name = pattern is not None and "/" not in pattern
+        
+        with self.lock:
+            if prefix:
+                start = bisect.bisect_left(self.paths, prefix + "/")
+                end = bisect.bisect_left(self.paths, prefix + "/\uffff")
+            else:
+                start, end = 0, len(self.paths)
+            candidates = self.paths[start:end]
+            entries = self.entries
+            
+            matched = []
+            for path in candidates:
+                if depth is not None and path.count("/") - base_depth >= depth:
+                    continue
+                if pattern is not None and not fnmatch.fnmatchcase(path.rsplit("/", 1)[-1] if match_name else path, pattern):
+                    continue
+                entry = entries[path]
+                if kind is not None and entry["type"] != kind:
+                    continue
+                matched.append(entry)
+        
+        return {"total": len(matched), "offset": offset, "limit": limit, "entries": matched[offset:offset + limit]}
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self.entries), "build_ms": round(self.build_seconds * 1000, 1)}
+
+class TextResourceParser:
+    """Parser for Godot's text resource format (.tscn/.tres): [section key=value ...] headers
+    followed by key = value properties. Values become JSON-friendly Python objects; resource
+    references become {"ext_resource": id} / {"sub_resource": id}, other constructors
+    {"type": name, "args": [...]}. Non-finite floats have no JSON form and stay as Godot
+    spells them: "inf", "inf_neg", "nan"."""
+    
+    TOKEN = re.compile(r"""\s*(?:
+        (?P<string>[&^]?"(?:[^"\\]|\\.)*")
+        |(?P<number>[-+]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?(?![\w.])|[-+]inf\b)
+        |(?P<ident>[A-Za-z_][\w]*)
+        |(?P<punct>[\[\]{}(),:=])
+    )""", re.S | re.X)
+    PROPERTY = re.compile(r"\s*([^\s=\[;][^=\n]*?)\s*=")
+    OPENS_ON_LINE = re.compile(r"[ \t]*[\[(]")  # an opening bracket later on the same line
+    CONSTANTS = {"true": True, "false": False, "null": None, "inf": "inf", "inf_neg": "inf_neg", "nan": "nan"}
+    
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+    
+    def error(self, message: str):
+        line = self.text.count("\n", 0, self.pos) + 1
+        return ValueError(f"{message} at line {line}")
+    
+    def next_token(self):
+        match = self.TOKEN.match(self.text, self.pos)
+        if not match:
+            raise self.error("Unexpected input")
+        self.pos = match.end()
+        return match.lastgroup, match.group(match.lastgroup)
+    
+    def peek(self):
+        match = self.TOKEN.match(self.text, self.pos)
+        return (match.lastgroup, match.group(match.lastgroup)) if match else (None, None)
+    
+    def expect(self, punct: str):
+        kind, value = self.next_token()
+        if kind != "punct" or value != punct:
+            raise self.error(f"Expected '{punct}'")
+    
+    def sequence(self, close: str):
+        """Comma-separated values up to the closing bracket"""
+        items = []
+        while self.peek() != ("punct", close):
+            items.append(self.value())
+            if self.peek() == ("punct", ","):
+                self.next_token()
+        self.next_token()
+        return items
+    
+    def value(self):
+        kind, token = self.next_token()
+        if kind == "string":
+            return json.loads(token.lstrip("&^"), strict=False)
+        if kind == "number":
+            if token.endswith("inf"):
+                return "inf_neg" if token[0] == "-" else "inf"
+            return float(token) if any(c in token for c in ".eE") else int(token)
+        if kind == "ident":
+            if token in self.CONSTANTS:
+                return self.CONSTANTS[token]
+            # Only brackets on the same line belong to the identifier; a "[" on the next
+            # line is the following section header
+            following = self.peek() if self.OPENS_ON_LINE.match(self.text, self.pos) else None
+            if following == ("punct", "["):
+                # Typed collection, e.g. Array[StringName]([&"a"]) or Dictionary[String, int]({})
+                self.next_token()
+                self.sequence("]")
+                following = self.peek()
+            if following == ("punct", "("):
+                self.next_token()
+                args = self.sequence(")")
+                if token == "ExtResource":
+                    return {"ext_resource": args[0] if args else None}
+                if token == "SubResource":
+                    return {"sub_resource": args[0] if args else None}
+                if token in ("Array", "Dictionary") and len(args) == 1:
+                    return args[0]
+                return {"type": token, "args": args}
+            return token
+        if token == "[":
+            return self.sequence("]")
+        if token == "{":
+            result = {}
+            while self.peek() != ("punct", "}"):
+                key = self.value()
+                self.expect(":")
+                result[key if isinstance(key, str) else json.dumps(key)] = self.value()
+                if self.peek() == ("punct", ","):
+                    self.next_token()
+            self.next_token()
+            return result
+        raise self.error(f"Unexpected '{token}'")
+    
+    def sections(self):
+        """Yield (tag, attributes, properties, line) for each section"""
+        text = self.text
+        current = None
+        while True:
+            # Skip blank lines and ; comments
+            while self.pos < len(text):
+                if text[self.pos] in " \t\r\n":
+                    self.pos += 1
+                elif text[self.pos] == ";":
+                    end = text.find("\n", self.pos)
+                    self.pos = len(text) if end < 0 else end
+                else:
+                    break
+            if self.pos >= len(text):
+                break
+            
+            if text[self.pos] == "[":
+                if current is not None:
+                    yield current
+                line = text.count("\n", 0, self.pos) + 1
+                self.pos += 1
+                _, tag = self.next_token()
+                attributes = {}
+                while self.peek() != ("punct", "]"):
+                    _, key = self.next_token()
+                    self.expect("=")
+                    attributes[key] = self.value()
+                self.next_token()
+                current = (tag, attributes, {}, line)
+                continue
+            
+            match = self.PROPERTY.match(text, self.pos)
+            if not match:
+                raise self.error("Expected a property")
+            self.pos = match.end()
+            value = self.value()
+            if current is not None:
+                current[2][match.group(1).strip('"')] = value
+        if current is not None:
+            yield current
+
+def parse_scene(text: str) -> Dict[str, Any]:
+    """Structured model of a .tscn file: resources, nodes (with full paths) and connections"""
+    model = {
+        "uid": None, "format": None, "ext_resources": {}, "sub_resources": {},
+        "nodes": [], "connections": [], "editable": []
+    }
+    node_paths = {}
+    for tag, attributes, properties, line in TextResourceParser(text).sections():
+        if tag == "gd_scene":
+            model["uid"] = attributes.get("uid")
+            model["format"] = attributes.get("format")
+        elif tag == "ext_resource":
+            model["ext_resources"][str(attributes.get("id"))] = {**attributes, "line": line}
+        elif tag == "sub_resource":
+            model["sub_resources"][str(attributes.get("id"))] = {**attributes, "properties": properties, "line": line}
+        elif tag == "node":
+            name = attributes.get("name", "")
+            parent = attributes.get("parent")
+            if parent is None:
+                path = "."
+            elif parent == ".":
+                path = name
+            else:
+                path = f"{parent}/{name}"
+            
+            def resource_path(reference):
+                if isinstance(reference, dict) and "ext_resource" in reference:
+                    return model["ext_resources"].get(str(reference["ext_resource"]), {}).get("path")
+                return None
+            
+            node = {
+                "name": name,
+                "path": path,
+                "parent": parent,
+                "type": attributes.get("type"),
+                "instance": resource_path(attributes.get("instance")),
+                "script": resource_path(properties.get("script")),
+                "groups": attributes.get("groups", []),
+                "properties": properties,
+                "line": line
+            }
+            node_paths[path] = len(model["nodes"])
+            model["nodes"].append(node)
+        elif tag == "connection":
+            model["connections"].append({**attributes, "line": line})
+        elif tag == "editable":
+            model["editable"].append(attributes.get("path"))
+    model["node_paths"] = node_paths
+    return model
+
+class ProjectFileIndex:
+    """Base for indexes derived from project files with given extensions. They cover the same
+    files as ProjectIndex (hidden and .gdignore'd directories excluded), are built from its
+    entries, and follow AtomicFileWriter changes and ProjectWatcher deltas per file."""
+    
+    EXTENSIONS = ()
+    
+    def __init__(self, project: ProjectIndex):
+        self.project = project
+        self.root = None
+    
+    def res_path(self, full_path: str) -> str:
+        return "res://" + os.path.relpath(full_path, self.root).replace(os.sep, "/")
+    
+    def full_path(self, res_path: str) -> str:
+        return os.path.join(self.root, *res_path.removeprefix("res://").split("/"))
+    
+    def build(self, root: str, relative_paths):
+        raise NotImplementedError
+    
+    def update(self, full_path: str):
+        raise NotImplementedError
+    
+    def remove(self, res_path: str):
+        raise NotImplementedError
+    
+    def indexed_paths(self):
+        """res:// paths of the files currently indexed"""
+        raise NotImplementedError
+    
+    def rebuild(self):
+        """Index every matching file ProjectIndex knows about (runs on the I/O pool)"""
+        self.build(self.project.root, self.project.files(self.EXTENSIONS))
+    
+    def changed(self, full_path: str):
+        """AtomicFileWriter listener"""
+        if full_path.endswith(self.EXTENSIONS) and self.root is not None:
+            self.update(full_path)
+    
+    def apply_deltas(self, deltas):
+        """ProjectWatcher subscriber; runs after ProjectIndex's, so a rescan sees the rebuilt tree"""
+        for delta in deltas:
+            if delta["type"] == "rescan":
+                self.rebuild()
+            elif delta["is_dir"] and delta["type"] == "deleted":
+                prefix = self.res_path(delta["path"]) + "/"
+                for res_path in [path for path in self.indexed_paths() if path.startswith(prefix)]:
+                    self.remove(res_path)
+            elif delta["path"].endswith(self.EXTENSIONS):
+                self.update(delta["path"])
+
+class SceneIndex(ProjectFileIndex):
+    """Parsed .tscn models cached per file (keyed on mtime/size, then content hash), with
+    node-type and instanced-scene indexes so queries never reparse"""
+    
+    EXTENSIONS = (".tscn",)
+    
+    def __init__(self, project: ProjectIndex):
+        super().__init__(project)
+        self.scenes = {}  # res:// path -> {"mtime_ns", "size", "digest", "model"}
+        self.by_type = {}  # node type -> {(scene, node path)}
+        self.by_instance = {}  # instanced scene -> {(scene, node path)}
+        self.lock = threading.Lock()
+        self.counts = {"parsed": 0, "unchanged": 0, "errors": 0, "parse_seconds": 0.0}
+    
+    def build(self, root: str, relative_paths):
+        """Parse every scene in the project (runs on the I/O pool)"""
+        with self.lock:
+            self.root = root
+            self.scenes, self.by_type, self.by_instance = {}, {}, {}
+        for relative in relative_paths:
+            self.update(os.path.join(root, relative))
+    
+    def update(self, full_path: str):
+        """Reparse a scene if its content changed; drop it if it is gone"""
+        res_path = self.res_path(full_path)
+        try:
+            stat = os.stat(full_path)
+            cached = self.scenes.get(res_path)
+            if cached and (cached["mtime_ns"], cached["size"]) == (stat.st_mtime_ns, stat.st_size):
+                return
+            with open(full_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.remove(res_path)
+            return
+        
+        digest = ContentHashIndex.digest(data)
+        if cached and cached["digest"] == digest:
+            cached["mtime_ns"], cached["size"] = stat.st_mtime_ns, stat.st_size  # touched, not changed
+            self.counts["unchanged"] += 1
+            return
+        
+        started = time.perf_counter()
+        try:
+            model = parse_scene(data.decode("utf-8"))
+        except (ValueError, UnicodeDecodeError) as e:
+            logger.warning(f"Could not parse {res_path}: {e}")
+            self.counts["errors"] += 1
+            self.remove(res_path)
+            return
+        self.counts["parse_seconds"] += time.perf_counter() - started
+        self.counts["parsed"] += 1
+        
+        with self.lock:
+            self.unindex(res_path)
+            self.scenes[res_path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "digest": digest, "model": model}
+            for node in model["nodes"]:
+                if node["type"]:
+                    self.by_type.setdefault(node["type"], set()).add((res_path, node["path"]))
+                if node["instance"]:
+                    self.by_instance.setdefault(node["instance"], set()).add((res_path, node["path"]))
+    
+    def unindex(self, res_path: str):
+        cached = self.scenes.pop(res_path, None)
+        if cached is None:
+            return
+        for node in cached["model"]["nodes"]:
+            for index, key in ((self.by_type, node["type"]), (self.by_instance, node["instance"])):
+                if key and key in index:
+                    index[key].discard((res_path, node["path"]))
+                    if not index[key]:
+                        del index[key]
+    
+    def remove(self, res_path: str):
+        with self.lock:
+            self.unindex(res_path)
+    
+    def indexed_paths(self):
+        return list(self.scenes)
+    
+    def model(self, res_path: str):
+        cached = self.scenes.get(res_path)
+        return cached["model"] if cached else None
+    
+    def root_type(self, res_path: str, seen=None):
+        """Type of a scene's root node, following inherited scenes"""
+        model = self.model(res_path)
+        if not model or not model["nodes"]:
+            return None
+        root = model["nodes"][0]
+        if root["type"] or not root["instance"]:
+            return root["type"]
+        seen = seen or set()
+        if res_path in seen:
+            return None
+        seen.add(res_path)
+        return self.root_type(root["instance"], seen)
+    
+    def node_summary(self, scene: str, path: str) -> Dict[str, Any]:
+        model = self.model(scene)
+        node = model["nodes"][model["node_paths"][path]]
+        return {
+            "scene": scene,
+            "path": path,
+            "name": node["name"],
+            "type": node["type"] or (self.root_type(node["instance"]) if node["instance"] else None),
+            "instance": node["instance"],
+            "script": node["script"],
+            "line": node["line"]
+        }
+    
+    def find_nodes(self, node_type: str = None, name: str = None, scene: str = None):
+        """Nodes by type (including scene instances whose root has that type), name glob and scene"""
+        with self.lock:
+            if node_type is not None:
+                matches = set(self.by_type.get(node_type, ()))
+                for instanced in self.scenes:
+                    if self.root_type(instanced) == node_type:
+                        matches |= self.by_instance.get(instanced, set())
+            else:
+                matches = {
+                    (res_path, node["path"])
+                    for res_path, cached in self.scenes.items() for node in cached["model"]["nodes"]
+                }
+            results = [
+                self.node_summary(res_path, path) for res_path, path in sorted(matches)
+                if scene is None or res_path == scene
+            ]
+        if name is not None:
+            results = [node for node in results if fnmatch.fnmatchcase(node["name"], name)]
+        return results
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counts,
+            "scenes": len(self.scenes),
+            "nodes": sum(len(cached["model"]["nodes"]) for cached in self.scenes.values())
+        }
+
+class DependencyGraph(ProjectFileIndex):
+    """res:// dependency graph: scene/resource ext_resources, preload()/load() and other res://
+    string literals in scripts, and autoloads/main scene in project.godot. Edges are updated
+    per file, so a change costs only that file; reverse edges answer "what depends on X"."""
+    
+    EXTENSIONS = (".gd", ".tscn", ".tres", ".godot")
+    EXT_RESOURCE = re.compile(r'^\[ext_resource\b[^\n]*?\bpath="([^"]+)"', re.M)
+    SCRIPT_LOAD = re.compile(r'\b(?:preload|load)\(\s*"([^"]+)"')
+    SCRIPT_RES_PATH = re.compile(r'"(res://[^"]+)"')
+    PROJECT_SETTING = re.compile(r'^(\w+|run/main_scene)="\*?(res://[^"]+)"')
+    
+    def __init__(self, project: ProjectIndex):
+        super().__init__(project)
+        self.forward = {}  # res:// path -> set of res:// paths it uses
+        self.reverse = {}  # res:// path -> set of res:// paths that use it
+        self.closures = {}  # (direction, res:// path) -> transitive result, cleared on any edge change
+        self.lock = threading.Lock()
+        self.counts = {"updates": 0, "queries": 0, "cached_queries": 0}
+    
+    @staticmethod
+    def resolve(source: str, reference: str) -> str:
+        """Absolute res:// path for a reference, which scripts may give relative to themselves"""
+        if reference.startswith(("res://", "uid://")):
+            return reference
+        directory = posixpath.dirname(source.removeprefix("res://"))
+        return "res://" + posixpath.normpath(posixpath.join(directory, reference))
+    
+    def extract(self, res_path: str, text: str):
+        """The res:// paths a file refers to"""
+        if res_path.endswith(".godot"):
+            deps = set()
+            section = None
+            for line in text.splitlines():
+                if line.startswith("["):
+                    section = line.strip()
+                elif section in ("[autoload]", "[application]"):
+                    match = self.PROJECT_SETTING.match(line)
+                    if match and (section == "[autoload]" or match.group(1) == "run/main_scene"):
+                        deps.add(match.group(2))
+            return deps
+        if res_path.endswith(".gd"):
+            deps = set()
+            for line in text.splitlines():
+                if line.lstrip().startswith("#"):
+                    continue
+                deps.update(self.resolve(res_path, ref) for ref in self.SCRIPT_LOAD.findall(line))
+                deps.update(self.SCRIPT_RES_PATH.findall(line))
+            deps.discard(res_path)
+            return deps
+        return {self.resolve(res_path, ref) for ref in self.EXT_RESOURCE.findall(text)}
+    
+    def build(self, root: str, relative_paths):
+        """Read every source file in the project (runs on the I/O pool)"""
+        with self.lock:
+            self.root = root
+            self.forward, self.reverse, self.closures = {}, {}, {}
+        for relative in relative_paths:
+            if relative.endswith(self.EXTENSIONS):
+                self.update(os.path.join(root, relative))
+    
+    def update(self, full_path: str):
+        res_path = self.res_path(full_path)
+        try:
+            with open(full_path, "r", encoding="utf-8", errors="replace") as f:
+                deps = self.extract(res_path, f.read())
+        except FileNotFoundError:
+            deps = set()  # deleted: its outgoing edges go, edges pointing at it stay (now dangling)
+        self.set_edges(res_path, deps)
+    
+    def set_edges(self, res_path: str, deps):
+        with self.lock:
+            old = self.forward.get(res_path, set())
+            if old == deps:
+                return
+            for dep in old - deps:
+                users = self.reverse.get(dep)
+                if users is not None:
+                    users.discard(res_path)
+                    if not users:
+                        del self.reverse[dep]
+            for dep in deps - old:
+                self.reverse.setdefault(dep, set()).add(res_path)
+            if deps:
+                self.forward[res_path] = deps
+            else:
+                self.forward.pop(res_path, None)
+            self.closures = {}
+            self.counts["updates"] += 1
+    
+    def remove(self, res_path: str):
+        self.set_edges(res_path, set())
+    
+    def indexed_paths(self):
+        return list(self.forward)
+    
+    def query(self, res_path: str, reverse: bool = False, transitive: bool = True):
+        """Direct or transitive dependencies (or dependents, with reverse) of a res:// path"""
+        edges = self.reverse if reverse else self.forward
+        with self.lock:
+            self.counts["queries"] += 1
+            if not transitive:
+                return sorted(edges.get(res_path, ()))
+            key = (reverse, res_path)
+            if key in self.closures:
+                self.counts["cached_queries"] += 1
+                return self.closures[key]
+            
+            seen = set()
+            frontier = [res_path]
+            while frontier:
+                current = frontier.pop()
+                for other in edges.get(current, ()):
+                    if other not in seen:
+                        seen.add(other)
+                        frontier.append(other)
+            seen.discard(res_path)
+            self.closures[key] = result = sorted(seen)
+            return result
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counts,
+            "files": len(self.forward),
+            "edges": sum(len(deps) for deps in self.forward.values())
+        }
+
+class SymbolIndex(ProjectFileIndex):
+    """Declarations in GDScript files (func, signal, var, const, enum, class, class_name, extends)
+    kept in one array sorted by lowercased name, so exact and prefix lookups are a bisect and
+    fuzzy lookups scan names only; files are re-indexed one at a time as they change."""
+    
+    EXTENSIONS = (".gd",)
+    KINDS = ("func", "signal", "var", "const", "enum", "class", "class_name", "extends")
+    DECLARATION = re.compile(
+        r"^(?P<indent>[ \t]*)(?:@\w+(?:\([^)]*\))?\s+)*(?:static\s+)?"
+        r"(?P<kind>func|signal|var|const|enum|class_name|class|extends)\s+(?P<name>\"[^\"]*\"|[\w.]+)"
+    )
+    
+    def __init__(self, project: ProjectIndex):
+        super().__init__(project)
+        self.files = {}  # res:// path -> [symbol keys]
+        self.symbols = []  # sorted keys: (lowercased name, name, kind, res:// path, line, container, declaration)
+        self.lock = threading.Lock()
+        self.counts = {"indexed_files": 0, "queries": 0}
+    
+    @staticmethod
+    def indent_width(indent: str) -> int:
+        return len(indent.expandtabs(4))
+    
+    def extract(self, res_path: str, text: str):
+        """Symbol keys for one script; locals inside function bodies are skipped"""
+        keys = []
+        func_indent = None  # indentation of the enclosing func, while inside its body
+        classes = []  # (indentation, name) of enclosing inner classes
+        for number, line in enumerate(text.splitlines(), 1):
+            stripped = line.strip()
+            if not stripped or stripped.startswith("#"):
+                continue
+            indent = self.indent_width(line[:len(line) - len(line.lstrip())])
+            if func_indent is not None and indent > func_indent:
+                continue
+            func_indent = None
+            while classes and indent <= classes[-1][0]:
+                classes.pop()
+            
+            match = self.DECLARATION.match(line)
+            if not match:
+                continue
+            kind, name = match.group("kind"), match.group("name").strip('"')
+            container = classes[-1][1] if classes else ""
+            declaration = stripped.split("#", 1)[0].rstrip().rstrip(":")
+            keys.append((name.lower(), name, kind, res_path, number, container, declaration))
+            if kind == "func":
+                func_indent = indent
+            elif kind == "class":
+                classes.append((indent, name))
+        return keys
+    
+    def build(self, root: str, relative_paths):
+        """Index every script in the project (runs on the I/O pool)"""
+        with self.lock:
+            self.root = root
+            self.files, self.symbols = {}, []
+        keys = []
+        for relative in relative_paths:
+            if relative.endswith(self.EXTENSIONS):
+                res_path = self.res_path(os.path.join(root, relative))
+                try:
+                    with open(os.path.join(root, relative), "r", encoding="utf-8", errors="replace") as f:
+                        self.files[res_path] = self.extract(res_path, f.read())
+                except FileNotFoundError:
+                    continue
+                keys.extend(self.files[res_path])
+        with self.lock:
+            self.symbols = sorted(keys)
+            self.counts["indexed_files"] += len(self.files)
+    
+    def update(self, full_path: str):
+        res_path = self.res_path(full_path)
+        try:
+            with open(full_path, "r", encoding="utf-8", errors="replace") as f:
+                keys = self.extract(res_path, f.read())
+        except FileNotFoundError:
+            keys = []
+        self.set_symbols(res_path, keys)
+    
+    def set_symbols(self, res_path: str, keys):
+        with self.lock:
+            for key in self.files.pop(res_path, []):
+                position = bisect.bisect_left(self.symbols, key)
+                if position < len(self.symbols) and self.symbols[position] == key:
+                    del self.symbols[position]
+            for key in keys:
+                bisect.insort(self.symbols, key)
+            if keys:
+                self.files[res_path] = keys
+            self.counts["indexed_files"] += 1
+    
+    def remove(self, res_path: str):
+        self.set_symbols(res_path, [])
+    
+    def indexed_paths(self):
+        return list(self.files)
+    
+    @staticmethod
+    def fuzzy_score(query: str, name: str):
+        """Score name as a subsequence match of query (higher is better), or None if it does not match"""
+        score = 0
+        position = 0
+        previous = -2
+        for char in query:
+            found = name.find(char, position)
+            if found < 0:
+                return None
+            if found == previous + 1:
+                score += 3  # consecutive
+            if found == 0 or name[found - 1] in "_.":
+                score += 2  # start of a word
+            previous = found
+            position = found + 1
+        return score - len(name) * 0.01
+    
+    def query(self, name: str = "", kind: str = None, match: str = "prefix", path: str = None, limit: int = 100):
+        """Symbols whose name matches exactly, by prefix or fuzzily (case-insensitive)"""
+        query = name.lower()
+        
+        def wanted(key) -> bool:
+            return (kind is None or key[2] == kind) and (path is None or key[3] == path)
+        
+        with self.lock:
+            self.counts["queries"] += 1
+            if match == "fuzzy" and query:
+                scored = []
+                for key in self.symbols:
+                    if wanted(key):
+                        score = self.fuzzy_score(query, key[0])
+                        if score is not None:
+                            scored.append((-score, key))
+                scored.sort()
+                matched = [key for _, key in scored]
+            else:
+                matched = []
+                position = bisect.bisect_left(self.symbols, (query,))
+                while position < len(self.symbols):
+                    key = self.symbols[position]
+                    if not key[0].startswith(query) or (match == "exact" and key[0] != query):
+                        break
+                    if wanted(key):
+                        matched.append(key)
+                    position += 1
+                # Exact name matches first
+                matched.sort(key=lambda key: key[0] != query)
+        
+        fields = ("name", "kind", "path", "line", "container", "declaration")
+        return len(matched), [dict(zip(fields, key[1:])) for key in matched[:limit]]
+    
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counts, "files": len(self.files), "symbols": len(self.symbols)}
+
+def load_libc():
+    """libc with the inotify calls, or None where inotify is unavailable"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+class ProjectWatcher:
+    """Watches the project for changes made outside the server (e.g. saves in the Godot editor)
+    and pushes debounced added/modified/deleted deltas to subscribers. Uses inotify through
+    ctypes on Linux, so idle cost is zero; elsewhere it falls back to periodic mtime scans."""
+    
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct("iIII")  # struct inotify_event: wd, mask, cookie, name length
+    
+    def __init__(self, io: FileIOPool, debounce: float = 0.2, max_delay: float = 1.0, poll_interval: float = 2.0,
+                 locks: PathLockManager = None):
+        self.io = io
+        self.locks = locks  # when set, changed files are read-locked while subscribers read them
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.subscribers = []  # called on the I/O pool with each list of deltas
+        self.root = None
+        self.backend = None
+        self.libc = None
+        self.fd = None
+        self.watches = {}  # inotify watch descriptor -> directory
+        self.snapshot = {}  # polling backend: path -> (mtime_ns, size, is_dir)
+        self.poll_task = None
+        self.pending = {}  # path -> (delta type, is_dir) awaiting the debounce
+        self.flush_handle = None
+        self.first_pending = None
+        self.counts = {"events": 0, "flushes": 0, "deltas": 0, "overflows": 0, "watch_errors": 0}
+    
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+    
+    @staticmethod
+    def walk_dirs(top: str):
+        """The directories the Godot editor would scan: no hidden ones, none holding a .gdignore"""
+        stack = [top]
+        while stack:
+            directory = stack.pop()
+            yield directory
+            try:
+                with os.scandir(directory) as it:
+                    for item in it:
+                        if (not item.name.startswith(".") and item.is_dir(follow_symlinks=False)
+                                and not os.path.exists(os.path.join(item.path, ".gdignore"))):
+                            stack.append(item.path)
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                pass
+    
+    async def start(self, root: str):
+        await self.stop()
+        self.root = root
+        libc = load_libc()
+        if libc is not None:
+            try:
+                await self.io.run(None, self.start_inotify, libc)
+                asyncio.get_running_loop().add_reader(self.fd, self.read_events)
+                self.backend = "inotify"
+                return
+            except OSError as e:
+                logger.warning(f"inotify unavailable ({e}), watching {root} by polling")
+                self.close_inotify()
+        
+        self.snapshot = await self.io.run(None, self.scan_tree)
+        self.poll_task = asyncio.ensure_future(self.poll())
+        self.backend = "polling"
+    
+    def start_inotify(self, libc):
+        fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.libc, self.fd = libc, fd
+        for directory in self.walk_dirs(self.root):
+            self.add_watch(directory)
+    
+    def add_watch(self, directory: str):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            self.counts["watch_errors"] += 1
+            if error == errno.ENOSPC:
+                logger.warning("inotify watch limit reached; raise fs.inotify.max_user_watches")
+            return
+        self.watches[wd] = directory
+    
+    def unwatch_tree(self, directory: str):
+        """Drop the watches of a directory moved or deleted out from under us"""
+        for wd, path in list(self.watches.items()):
+            if path == directory or path.startswith(directory + os.sep):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                self.watches.pop(wd, None)
+    
+    def read_events(self):
+        """Event loop reader callback: turn raw inotify events into pending deltas"""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].split(b"\0", 1)[0]
+            offset += self.EVENT.size + length
+            
+            if mask & self.IN_Q_OVERFLOW:
+                self.counts["overflows"] += 1
+                self.queue(self.root, "rescan", True)
+                continue
+            if mask & self.IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            name = os.fsdecode(name)
+            if directory is None or not name or name.startswith("."):
+                continue  # unknown watch, event on the directory itself, or a hidden/temp file
+            
+            if mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                kind = "deleted"
+            elif mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                kind = "added"
+            else:
+                kind = "modified"
+            path = os.path.join(directory, name)
+            if kind == "added" and mask & self.IN_ISDIR:
+                self.add_watch(path)  # right away, so changes inside it are not missed meanwhile
+            self.queue(path, kind, bool(mask & self.IN_ISDIR))
+    
+    def scan_tree(self) -> Dict[str, Any]:
+        snapshot = {}
+        for directory in self.walk_dirs(self.root):
+            try:
+                with os.scandir(directory) as it:
+                    for item in it:
+                        if not item.name.startswith("."):
+                            stat = item.stat(follow_symlinks=False)
+                            snapshot[item.path] = (stat.st_mtime_ns, stat.st_size, item.is_dir(follow_symlinks=False))
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                pass
+        return snapshot
+    
+    async def poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                snapshot = await self.io.run(None, self.scan_tree)
+            except OSError as e:
+                logger.error(f"Error scanning project for changes: {e}")
+                continue
+            previous, self.snapshot = self.snapshot, snapshot
+            for path, state in snapshot.items():
+                if path not in previous:
+                    self.queue(path, "added", state[2])
+                elif previous[path] != state and not state[2]:
+                    self.queue(path, "modified", False)
+            for path, state in previous.items():
+                if path not in snapshot:
+                    self.queue(path, "deleted", state[2])
+    
+    def queue(self, path: str, kind: str, is_dir: bool):
+        """Collect a change; bursts are flushed together once quiet for the debounce window"""
+        self.counts["events"] += 1
+        previous = self.pending.get(path)
+        if previous is not None and previous[0] == "added" and kind == "modified":
+            kind = "added"
+        self.pending[path] = (kind, is_dir)
+        
+        loop = asyncio.get_running_loop()
+        if self.first_pending is None:
+            self.first_pending = loop.time()
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+        delay = min(self.debounce, self.first_pending + self.max_delay - loop.time())
+        self.flush_handle = loop.call_later(max(delay, 0), lambda: asyncio.ensure_future(self.flush()))
+    
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+        self.flush_handle = self.first_pending = None
+        if not pending:
+            return
+        deltas = [{"type": kind, "path": path, "is_dir": is_dir} for path, (kind, is_dir) in pending.items()]
+        try:
+            async with AsyncExitStack() as stack:
+                if self.locks is not None:
+                    # Shared locks, so subscribers never read a multi-file commit half-applied
+                    # (sorted, like TransactionManager.commit, so the two cannot deadlock)
+                    for key in sorted({self.locks.key(delta["path"]) for delta in deltas if not delta["is_dir"]}):
+                        await stack.enter_async_context(self.locks.read(key))
+                await self.io.run(None, self.dispatch, deltas)
+        except OSError as e:
+            logger.error(f"Error applying file changes: {e}")
+    
+    def dispatch(self, deltas):
+        """Settle deltas against the disk and hand them to subscribers (runs on the I/O pool)"""
+        settled = []
+        for delta in deltas:
+            if delta["type"] == "rescan":
+                if self.fd is not None:
+                    for directory in self.walk_dirs(self.root):
+                        self.add_watch(directory)  # returns the existing watch for known directories
+                settled.append(delta)
+                continue
+            if delta["type"] != "deleted" and not os.path.exists(delta["path"]):
+                delta["type"] = "deleted"  # created and removed within one burst
+            if delta["is_dir"] and delta["type"] == "deleted" and self.fd is not None:
+                self.unwatch_tree(delta["path"])
+            settled.append(delta)
+            
+            if delta["is_dir"] and delta["type"] == "added" and self.fd is not None:
+                # Watch the new subtree and report what was created in it before the watch existed
+                # (the polling backend sees every entry itself)
+                for directory in self.walk_dirs(delta["path"]):
+                    self.add_watch(directory)
+                    if directory != delta["path"]:
+                        settled.append({"type": "added", "path": directory, "is_dir": True})
+                    with os.scandir(directory) as it:
+                        for item in it:
+                            if not item.name.startswith(".") and not item.is_dir(follow_symlinks=False):
+                                settled.append({"type": "added", "path": item.path, "is_dir": False})
+        
+        self.counts["flushes"] += 1
+        self.counts["deltas"] += len(settled)
+        for subscriber in self.subscribers:
+            try:
+                subscriber(settled)
+            except Exception as e:
+                logger.error(f"Error in file change subscriber {subscriber}: {e}")
+    
+    def close_inotify(self):
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = None
+        self.watches = {}
+    
+    async def stop(self):
+        if self.fd is not None:
+            asyncio.get_running_loop().remove_reader(self.fd)
+            self.close_inotify()
+        if self.poll_task is not None:
+            self.poll_task.cancel()
+            self.poll_task = None
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+        self.pending = {}
+        self.flush_handle = self.first_pending = None
+        self.backend = None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counts,
+            "backend": self.backend,
+            "watches": len(self.watches) if self.fd is not None else None,
+            "pending": len(self.pending)
+        }
+
 class FixedGodotMCPServer:
-    def __init__(self, port: int = 8082):
+    def __init__(self, port: int = 8082, ingest_queue_size: int = 10000, ingest_workers: int = 4,
+                 max_body_size: int = 64 * 1024 * 1024, compress_min_size: int = 1024, io_workers: int = 8,
+                 coalesce_window: float = 0.1, max_upload_size: int = 4 * 1024 * 1024 * 1024,
+                 heatmap_bounds=(0, 0, 4096, 1024)):
         self.port = port
+        self.max_body_size = max_body_size  # limit on the decoded (decompressed) request body
+        self.max_upload_size = max_upload_size  # limit for streamed uploads, which are never held in memory
+        self.compress_min_size = compress_min_size
         self.godot_project_path = ""
-        self.app = web.Application()
+        self.websockets = set()
+        self.io = FileIOPool(io_workers)
+        self.hashes = ContentHashIndex()
+        self.history = VersionStore()
+        self.locks = PathLockManager()
+        self.writer = AtomicFileWriter(self.io, self.hashes, self.history, self.locks)
+        self.coalescer = WriteCoalescer(self.writer, coalesce_window)
+        self.transactions = TransactionManager(self.writer)
+        self.uploads = UploadManager(self.writer)
+        self.project_index = ProjectIndex(io_workers)
+        self.writer.listeners.append(self.project_index.refresh)
+        self.scene_index = SceneIndex(self.project_index)
+        self.writer.listeners.append(self.scene_index.changed)
+        self.dependencies = DependencyGraph(self.project_index)
+        self.writer.listeners.append(self.dependencies.changed)
+        self.symbols = SymbolIndex(self.project_index)
+        self.writer.listeners.append(self.symbols.changed)
+        self.watcher = ProjectWatcher(self.io, locks=self.locks)
+        self.watcher.subscribe(self.project_index.apply_deltas)
+        self.watcher.subscribe(self.scene_index.apply_deltas)
+        self.watcher.subscribe(self.dependencies.apply_deltas)
+        self.watcher.subscribe(self.symbols.apply_deltas)
+        self.watcher.subscribe(self.forget_deleted)
+        self.event_log = None
+        self.event_store = EventStore()
+        self.schemas = EventSchemaRegistry()
+        self.heatmaps = {}  # event type -> HeatmapPyramid of event positions
+        self.heatmap_bounds = heatmap_bounds  # world x, y, width, height covered by the grids
+        self.sessions = SessionTracker()
+        self.session_sweeper = None
+        self.ingest = IngestQueue(self.handle_event, ingest_queue_size, ingest_workers)
+        # Request bodies are decompressed by iter_body, which enforces max_body_size; handler_args
+        # override whatever runner serves the app, so aiohttp never decodes them first
+        self.app = web.Application(handler_args={"auto_decompress": False})
+        self.app.on_startup.append(self.start_ingest)
+        self.app.on_startup.append(self.start_session_sweeper)
+        self.app.on_shutdown.append(self.close_websockets)
+        self.app.on_shutdown.append(self.drain_writes)
+        self.app.on_shutdown.append(self.stop_ingest)
+        self.app.on_shutdown.append(self.stop_session_sweeper)
+        self.app.on_cleanup.append(self.close_event_log)
+        self.app.on_cleanup.append(self.stop_watcher)
+        self.app.on_cleanup.append(self.close_io)
         self.setup_routes()
     
     def setup_routes(self):
         """Setup HTTP routes"""
         self.app.router.add_get("/status", self.status)
         self.app.router.add_post("/set-project", self.set_project)
+        self.app.router.add_get("/project-structure", self.project_structure)
+        self.app.router.add_get("/symbols", self.find_symbols)
+        self.app.router.add_get("/dependencies", self.get_dependencies)
+        self.app.router.add_get("/dependents", self.get_dependents)
+        self.app.router.add_get("/scenes", self.list_scenes)
+        self.app.router.add_get("/scenes/model", self.scene_model)
+        self.app.router.add_get("/scenes/node", self.scene_node)
+        self.app.router.add_get("/scenes/nodes", self.find_scene_nodes)
         self.app.router.add_post("/create-file", self.create_file)  # New endpoint
+        self.app.router.add_post("/create-files", self.create_files)
+        self.app.router.add_post("/patch-file", self.patch_file)
+        self.app.router.add_post("/uploads", self.begin_upload)
+        self.app.router.add_get("/uploads/{upload_id}", self.upload_status)
+        self.app.router.add_patch("/uploads/{upload_id}", self.receive_upload)
+        self.app.router.add_post("/uploads/{upload_id}/complete", self.complete_upload)
+        self.app.router.add_delete("/uploads/{upload_id}", self.abort_upload)
+        self.app.router.add_get("/history", self.file_history)
+        self.app.router.add_post("/restore", self.restore_file)
+        self.app.router.add_post("/transactions", self.begin_transaction)
+        self.app.router.add_post("/transactions/{transaction_id}/files", self.stage_transaction_files)
+        self.app.router.add_post("/transactions/{transaction_id}/commit", self.commit_transaction)
+        self.app.router.add_post("/transactions/{transaction_id}/abort", self.abort_transaction)
         self.app.router.add_post("/from-godot", self.receive_from_godot)
+        self.app.router.add_post("/from-godot/batch", self.receive_batch_from_godot)
+        self.app.router.add_get("/ws", self.websocket_handler)
+        self.app.router.add_get("/events", self.read_events)
+        self.app.router.add_get("/analytics/events", self.query_events)
+        self.app.router.add_get("/analytics/heatmap", self.heatmap)
+        self.app.router.add_get("/sessions", self.list_sessions)
+        self.app.router.add_get("/schemas", self.schema_stats)
+        self.app.router.add_get("/sessions/{session_id}/state", self.session_state)
         self.app.middlewares.append(self.cors_handler)
+        self.app.middlewares.append(self.compression_handler)
     
     @web.middleware
     async def cors_handler(self, request, handler):
         """Handle CORS"""
         response = await handler(request)
         response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
-        response.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        response.headers["Access-Control-Allow-Methods"] = "GET, POST, PATCH, DELETE, OPTIONS"
+        response.headers["Access-Control-Allow-Headers"] = "Content-Type, Content-Encoding, Upload-Offset"
         return response
     
-    async def status(self, request):
-        """Server status"""
-        return web.json_response({
+    @web.middleware
+    async def compression_handler(self, request, handler):
+        """Compress large read-side responses when the client accepts it"""
+        response = await handler(request)
+        if request.method == "GET" and isinstance(response, web.Response) \
+                and response.body is not None and len(response.body) >= self.compress_min_size:
+            response.enable_compression()
+        return response
+    
+    def body_error(self, status_class, message: str, **kwargs):
+        return status_class(
+            text=json.dumps({"success": False, "error": message}),
+            content_type="application/json",
+            **kwargs
+        )
+    
+    async def iter_body(self, request, limit: int):
+        """Yield the request body as it streams in, decoding gzip/deflate, up to limit bytes"""
+        encoding = request.headers.get("Content-Encoding", "identity").lower()
+        if encoding not in ("identity", "gzip", "deflate"):
+            raise self.body_error(web.HTTPUnsupportedMediaType, f"Unsupported Content-Encoding: {encoding}")
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32) if encoding != "identity" else None
+        size = 0
+        
+        def take(data: bytes) -> bytes:
+            nonlocal size
+            size += len(data)
+            if size > limit:
+                raise self.body_error(
+                    web.HTTPRequestEntityTooLarge, "Request body too large",
+                    max_size=limit, actual_size=size
+                )
+            return data
+        
+        try:
+            async for chunk in request.content.iter_chunked(64 * 1024):
+                if decompressor is None:
+                    yield take(chunk)
+                    continue
+                # Bound each step so a compression bomb never expands past the limit
+                yield take(decompressor.decompress(chunk, limit - size + 1))
+                while decompressor.unconsumed_tail:
+                    yield take(decompressor.decompress(decompressor.unconsumed_tail, limit - size + 1))
+            
+            if decompressor is not None:
+                yield take(decompressor.flush())
+                if not decompressor.eof:
+                    raise self.body_error(web.HTTPBadRequest, "Truncated compressed body")
+        except zlib.error as e:
+            raise self.body_error(web.HTTPBadRequest, f"Invalid {encoding} body: {e}")
+    
+    async def read_body(self, request) -> bytes:
+        """Read the whole request body, up to max_body_size"""
+        return b"".join([chunk async for chunk in self.iter_body(request, self.max_body_size)])
+    
+    async def read_json(self, request) -> Dict[str, Any]:
+        """Read a JSON object body; anything else is a 400"""
+        try:
+            data = json.loads(await self.read_body(request))
+        except ValueError as e:
+            raise self.body_error(web.HTTPBadRequest, f"Invalid JSON body: {e}")
+        if not isinstance(data, dict):
+            raise self.body_error(web.HTTPBadRequest, "JSON body must be an object")
+        return data
+    
+    def status_info(self) -> Dict[str, Any]:
+        """Server status payload shared by HTTP and WebSocket"""
+        return {
             "status": "active",
             "server": "Fixed Godot MCP Server",
             "port": self.port,
-            "project_path": self.godot_project_path
-        })
+            "project_path": self.godot_project_path,
+            "websocket_clients": len(self.websockets),
+            "io": self.io.stats(),
+            "project_index": self.project_index.stats(),
+            "watcher": self.watcher.stats(),
+            "scene_index": self.scene_index.stats(),
+            "dependencies": self.dependencies.stats(),
+            "symbols": self.symbols.stats(),
+            "locks": self.locks.stats(),
+            "writes": self.writer.stats,
+            "coalescing": self.coalescer.report(),
+            "transactions": self.transactions.report(),
+            "history": self.history.report(),
+            "uploads": self.uploads.report(),
+            "content_hashes": self.hashes.stats(),
+            "ingest": self.ingest.stats(),
+            "sessions": self.sessions.stats(),
+            "event_log": self.event_log.stats() if self.event_log else None
+        }
+    
+    async def status(self, request):
+        """Server status"""
+        return web.json_response(self.status_info())
     
     async def set_project(self, request):
         """Set project path"""
-        data = await request.json()
+        data = await self.read_json(request)
         path = data.get("path", "")
         
-        if os.path.exists(path):
+        if await self.io.run(None, os.path.exists, path):
             self.godot_project_path = path
+            self.hashes.clear()
+            # Swap before closing, so events arriving meanwhile land in the new log
+            event_log = await self.io.run(None, self.open_event_log, path)
+            event_log, self.event_log = self.event_log, event_log
+            if event_log:
+                await event_log.close()
+            self.sessions.directory = await self.io.run(None, ensure_data_dir, path, "sessions")
+            await self.transactions.abort_all()
+            upload_dir = await self.io.run(None, ensure_data_dir, path, "uploads")
+            await self.io.run(None, self.uploads.open, upload_dir)
+            history_dir = await self.io.run(None, ensure_data_dir, path, "history")
+            await self.io.run(None, self.history.open, path, history_dir)
+            journal_dir = await self.io.run(None, ensure_data_dir, path, "transactions")
+            recovered = await self.io.run(None, self.transactions.recover, journal_dir)
+            if recovered:
+                logger.info(f"Recovered {recovered} interrupted transaction(s)")
+            swept = await self.io.run(None, self.writer.sweep, path)
+            if swept:
+                logger.info(f"Removed {swept} leftover temp/backup file(s)")
+            # Watch before indexing, so nothing changed during the build is missed
+            await self.watcher.start(path)
+            await self.io.run(None, self.project_index.build, path)
+            logger.info(f"Indexed {len(self.project_index.entries)} project entries in {self.project_index.build_seconds:.3f}s")
+            await self.io.run(None, self.scene_index.rebuild)
+            await self.io.run(None, self.dependencies.rebuild)
+            await self.io.run(None, self.symbols.rebuild)
             return web.json_response({"success": True, "message": f"Project set to: {path}"})
         else:
             return web.json_response({"success": False, "error": "Path not found"}, status=400)
     
+    async def project_structure(self, request):
+        """List the project tree from the index (?prefix=&depth=&glob=&type=&offset=&limit=)"""
+        if not self.godot_project_path:
+            return web.json_response({"success": False, "error": "No project path set"}, status=400)
+        try:
+            depth = int(request.query["depth"]) if "depth" in request.query else None
+            offset = max(int(request.query.get("offset", 0)), 0)
+            limit = min(max(int(request.query.get("limit", 1000)), 1), 10000)
+        except ValueError:
+            return web.json_response({"success": False, "error": "depth, offset and limit must be integers"}, status=400)
+        
+        result = self.project_index.query(
+            request.query.get("prefix", ""), depth, request.query.get("glob"),
+            request.query.get("type"), offset, limit
+        )
+        return web.json_response({"success": True, "project_path": self.godot_project_path, **result})
+    
+    async def find_symbols(self, request):
+        """GDScript declarations (?name=&kind=&match=prefix|exact|fuzzy&path=&limit=)"""
+        kind = request.query.get("kind")
+        match = request.query.get("match", "prefix")
+        if kind is not None and kind not in SymbolIndex.KINDS:
+            return web.json_response({"success": False, "error": f"kind must be one of {', '.join(SymbolIndex.KINDS)}"}, status=400)
+        if match not in ("prefix", "exact", "fuzzy"):
+            return web.json_response({"success": False, "error": "match must be prefix, exact or fuzzy"}, status=400)
+        try:
+            limit = min(max(int(request.query.get("limit", 100)), 1), 10000)
+        except ValueError:
+            return web.json_response({"success": False, "error": "limit must be an integer"}, status=400)
+        path = request.query.get("path")
+        if path and not path.startswith("res://"):
+            path = "res://" + path.lstrip("/")
+        
+        total, symbols = self.symbols.query(request.query.get("name", ""), kind, match, path, limit)
+        return web.json_response({"success": True, "total": total, "symbols": symbols})
+    
+    def dependency_response(self, request, reverse: bool):
+        path = request.query.get("path", "")
+        if not path:
+            return web.json_response({"success": False, "error": "Missing path"}, status=400)
+        if not path.startswith(("res://", "uid://")):
+            path = "res://" + path.lstrip("/")
+        transitive = request.query.get("transitive", "true").lower() not in ("0", "false", "no")
+        
+        started = time.perf_counter()
+        paths = self.dependencies.query(path, reverse, transitive)
+        return web.json_response({
+            "success": True,
+            "path": path,
+            "transitive": transitive,
+            "total": len(paths),
+            "dependents" if reverse else "dependencies": paths,
+            "query_us": round((time.perf_counter() - started) * 1e6, 1)
+        })
+    
+    async def get_dependencies(self, request):
+        """What a res:// path uses (?path=&transitive=)"""
+        return self.dependency_response(request, reverse=False)
+    
+    async def get_dependents(self, request):
+        """What uses a res:// path, i.e. what a change to it affects (?path=&transitive=)"""
+        return self.dependency_response(request, reverse=True)
+    
+    async def list_scenes(self, request):
+        """Every indexed scene with its root type and size"""
+        scenes = [
+            {
+                "scene": res_path,
+                "uid": cached["model"]["uid"],
+                "root_type": self.scene_index.root_type(res_path),
+                "nodes": len(cached["model"]["nodes"]),
+                "ext_resources": len(cached["model"]["ext_resources"]),
+                "sub_resources": len(cached["model"]["sub_resources"])
+            }
+            for res_path, cached in sorted(self.scene_index.scenes.items())
+        ]
+        return web.json_response({"success": True, "total": len(scenes), "scenes": scenes})
+    
+    def requested_scene(self, request):
+        """Cached model for ?scene= (res:// or project-relative), or an error response"""
+        scene = request.query.get("scene", "")
+        if not scene:
+            return None, web.json_response({"success": False, "error": "Missing scene"}, status=400)
+        if not scene.startswith("res://"):
+            scene = "res://" + scene.lstrip("/")
+        model = self.scene_index.model(scene)
+        if model is None:
+            return None, web.json_response({"success": False, "error": f"Scene not found: {scene}"}, status=404)
+        return (scene, model), None
+    
+    async def scene_model(self, request):
+        """Parsed scene: resources, nodes and connections"""
+        found, error = self.requested_scene(request)
+        if error:
+            return error
+        scene, model = found
+        return web.json_response({
+            "success": True,
+            "scene": scene,
+            **{key: value for key, value in model.items() if key != "node_paths"}
+        })
+    
+    async def scene_node(self, request):
+        """One node by path, e.g. ?scene=res://LightbearerScene.tscn&path=GameWorld/Characters/Kael"""
+        found, error = self.requested_scene(request)
+        if error:
+            return error
+        scene, model = found
+        path = request.query.get("path", ".").strip("/") or "."
+        if path not in model["node_paths"]:
+            return web.json_response({"success": False, "error": f"No node {path} in {scene}"}, status=404)
+        node = model["nodes"][model["node_paths"][path]]
+        children = [other["path"] for other in model["nodes"] if other["parent"] == path]
+        return web.json_response({"success": True, "scene": scene, "node": node, "children": children})
+    
+    async def find_scene_nodes(self, request):
+        """Nodes across scenes by ?type= (instanced scenes count as their root type), ?name= glob and ?scene="""
+        scene = request.query.get("scene")
+        if scene and not scene.startswith("res://"):
+            scene = "res://" + scene.lstrip("/")
+        nodes = self.scene_index.find_nodes(request.query.get("type"), request.query.get("name"), scene)
+        return web.json_response({"success": True, "total": len(nodes), "nodes": nodes})
+    
     async def create_file(self, request):
         """Create file with proper extension"""
+        if request.content_type != "application/json" and "filename" in request.query:
+            return await self.create_file_streaming(request)
         try:
-            data = await request.json()
+            data = await self.read_json(request)
             filename = data.get("filename", "")
             content = data.get("content", "")
             subdir = data.get("path", "")
+            fsync = data.get("fsync", "batched")
             
             if not self.godot_project_path:
                 return web.json_response({"success": False, "error": "No project path set"}, status=400)
+            if fsync not in AtomicFileWriter.FSYNC_POLICIES:
+                return web.json_response({"success": False, "error": f"Unknown fsync policy: {fsync}"}, status=400)
             
-            # Create full path
-            if subdir:
-                full_path = os.path.join(self.godot_project_path, subdir, filename)
-                os.makedirs(os.path.join(self.godot_project_path, subdir), exist_ok=True)
-            else:
-                full_path = os.path.join(self.godot_project_path, filename)
+            full_path = self.project_file_path(subdir, filename)
             
-            # Write file with exact filename (no extra .gd extension)
-            with open(full_path, "w", encoding="utf-8") as f:
-                f.write(content)
+            # Write file with exact filename (no extra .gd extension). The new content is
+            # renamed over the old file, so Godot never sees a half-written script or scene.
+            write = self.coalescer.write if data.get("coalesce") else self.writer.write
+            if not await write(full_path, content.encode("utf-8"), fsync):
+                # Same content already on disk: skip the write so Godot does not reimport
+                return web.json_response({
+                    "success": True,
+                    "unchanged": True,
+                    "message": f"File unchanged: {filename}",
+                    "path": full_path
+                })
             
             logger.info(f"Created file: {full_path}")
             return web.json_response({
                 "success": True,
+                "unchanged": False,
                 "message": f"File created: {filename}",
                 "path": full_path
             })
             
+        except web.HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error creating file: {e}")
             return web.json_response({"success": False, "error": str(e)}, status=500)
     
+    async def create_file_streaming(self, request):
+        """Raw-body /create-file (?filename=&path=&fsync=&sha256=): streamed to disk, never held in memory"""
+        if not self.godot_project_path:
+            return web.json_response({"success": False, "error": "No project path set"}, status=400)
+        fsync = request.query.get("fsync", "batched")
+        if fsync not in AtomicFileWriter.FSYNC_POLICIES:
+            return web.json_response({"success": False, "error": f"Unknown fsync policy: {fsync}"}, status=400)
+        
+        full_path = self.project_file_path(request.query.get("path", ""), request.query["filename"])
+        upload = await self.uploads.begin(full_path, sha256=request.query.get("sha256"))
+        try:
+            await self.uploads.receive(upload["id"], 0, self.iter_body(request, self.max_upload_size))
+            written = await self.uploads.complete(upload["id"], fsync)
+        except BaseException as e:
+            if upload["id"] in self.uploads.uploads:
+                await asyncio.shield(self.uploads.abort(upload["id"]))
+            if isinstance(e, ValueError):
+                return web.json_response({"success": False, "error": str(e)}, status=400)
+            if isinstance(e, OSError):
+                logger.error(f"Error creating file: {e}")
+                return web.json_response({"success": False, "error": str(e)}, status=500)
+            raise
+        
+        logger.info(f"Created file: {full_path} ({upload['offset']} bytes streamed)")
+        return web.json_response({
+            "success": True,
+            "unchanged": not written,
+            "message": f"File {'unchanged' if not written else 'created'}: {request.query['filename']}",
+            "path": full_path,
+            "size": upload["offset"]
+        })
+    
+    async def begin_upload(self, request):
+        """Start a resumable upload of {filename, path, size, sha256}; data follows in PATCH requests"""
+        if not self.godot_project_path:
+            return web.json_response({"success": False, "error": "No project path set"}, status=400)
+        data = await self.read_json(request)
+        filename = data.get("filename", "")
+        size = data.get("size")
+        if not filename:
+            return web.json_response({"success": False, "error": "Missing filename"}, status=400)
+        if size is not None and (not isinstance(size, int) or not 0 <= size <= self.max_upload_size):
+            return web.json_response({"success": False, "error": f"size must be an integer up to {self.max_upload_size}"}, status=400)
+        
+        full_path = self.project_file_path(data.get("path", ""), filename)
+        upload = await self.uploads.begin(full_path, size, data.get("sha256"))
+        return web.json_response({"success": True, "upload_id": upload["id"], "offset": 0, "path": full_path})
+    
+    async def upload_status(self, request):
+        """Current offset of an upload, to resume after a dropped connection"""
+        try:
+            upload = await self.uploads.get(request.match_info["upload_id"])
+        except KeyError as e:
+            return web.json_response({"success": False, "error": e.args[0]}, status=404)
+        return web.json_response({
+            "success": True,
+            "upload_id": upload["id"],
+            "offset": upload["offset"],
+            "size": upload["size"],
+            "path": upload["path"]
+        })
+    
+    async def receive_upload(self, request):
+        """Append the raw body at ?offset= (or the Upload-Offset header)"""
+        upload_id = request.match_info["upload_id"]
+        try:
+            offset = int(request.query.get("offset", request.headers.get("Upload-Offset", "")))
+        except ValueError:
+            return web.json_response({"success": False, "error": "Missing or invalid offset"}, status=400)
+        
+        try:
+            upload = await self.uploads.get(upload_id)
+            limit = (upload["size"] if upload["size"] is not None else self.max_upload_size) - offset
+            new_offset = await self.uploads.receive(upload_id, offset, self.iter_body(request, max(limit, 0)))
+        except KeyError as e:
+            return web.json_response({"success": False, "error": e.args[0]}, status=404)
+        except UploadConflict as e:
+            return web.json_response({"success": False, "error": str(e), "offset": e.offset}, status=409)
+        except OSError as e:
+            logger.error(f"Error receiving upload {upload_id}: {e}")
+            return web.json_response({"success": False, "error": str(e)}, status=500)
+        return web.json_response({"success": True, "upload_id": upload_id, "offset": new_offset})
+    
+    async def complete_upload(self, request):
+        """Verify a finished upload and move it into place"""
+        upload_id = request.match_info["upload_id"]
+        data = await self.read_json(request) if request.can_read_body else {}
+        fsync = data.get("fsync", "batched")
+        if fsync not in AtomicFileWriter.FSYNC_POLICIES:
+            return web.json_response({"success": False, "error": f"Unknown fsync policy: {fsync}"}, status=400)
+        
+        try:
+            upload = await self.uploads.get(upload_id)
+            written = await self.uploads.complete(upload_id, fsync)
+        except KeyError as e:
+            return web.json_response({"success": False, "error": e.args[0]}, status=404)
+        except UploadConflict as e:
+            return web.json_response({"success": False, "error": str(e), "offset": e.offset}, status=409)
+        except ValueError as e:
+            return web.json_response({"success": False, "error": str(e)}, status=400)
+        except OSError as e:
+            logger.error(f"Error completing upload {upload_id}: {e}")
+            return web.json_response({"success": False, "error": str(e)}, status=500)
+        
+        logger.info(f"Completed upload {upload_id}: {upload['path']} ({upload['offset']} bytes)")
+        return web.json_response({"success": True, "unchanged": not written, "path": upload["path"], "size": upload["offset"]})
+    
+    async def abort_upload(self, request):
+        """Discard an upload and its data"""
+        upload_id = request.match_info["upload_id"]
+        try:
+            await self.uploads.abort(upload_id)
+        except KeyError as e:
+            return web.json_response({"success": False, "error": e.args[0]}, status=404)
+        return web.json_response({"success": True, "upload_id": upload_id})
+    
+    def project_file_path(self, subdir: str, filename: str) -> str:
+        """Full path for a file in the project, optionally inside a subdirectory"""
+        if subdir:
+            return os.path.join(self.godot_project_path, subdir, filename)
+        return os.path.join(self.godot_project_path, filename)
+    
+    async def write_one(self, index: int, filename: str, subdir: str, content, fsync: str,
+                        coalesce: bool = False) -> Dict[str, Any]:
+        """Write one file of a bulk request and report its outcome"""
+        result = {"index": index, "filename": filename}
+        try:
+            if not filename or not isinstance(filename, str) or not isinstance(subdir, str):
+                raise ValueError("Missing or invalid filename")
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            if not isinstance(content, bytes):
+                raise ValueError("content must be a string")
+            if fsync not in AtomicFileWriter.FSYNC_POLICIES:
+                raise ValueError(f"Unknown fsync policy: {fsync}")
+            full_path = self.project_file_path(subdir, filename)
+            write = self.coalescer.write if coalesce else self.writer.write
+            written = await write(full_path, content, fsync)
+            result.update(success=True, unchanged=not written, path=full_path)
+        except (OSError, ValueError) as e:
+            result.update(success=False, error=str(e))
+        return result
+    
+    async def create_files(self, request):
+        """Create many files in one request (JSON list or multipart), written in parallel"""
+        if not self.godot_project_path:
+            return web.json_response({"success": False, "error": "No project path set"}, status=400)
+        
+        if request.content_type.startswith("multipart/"):
+            if request.headers.get("Content-Encoding", "identity").lower() != "identity":
+                return web.json_response({"success": False, "error": "Compressed multipart bodies are not supported"}, status=415)
+            results = await self.create_files_multipart(request)
+        else:
+            data = await self.read_json(request)
+            files = data.get("files")
+            if not isinstance(files, list):
+                return web.json_response({"success": False, "error": "files must be a list"}, status=400)
+            default_fsync = data.get("fsync", "batched")
+            default_coalesce = data.get("coalesce", False)
+            
+            writes = []
+            for index, entry in enumerate(files):
+                if not isinstance(entry, dict):
+                    entry = {}
+                writes.append(self.write_one(
+                    index, entry.get("filename", ""), entry.get("path", ""),
+                    entry.get("content", ""), entry.get("fsync", default_fsync),
+                    entry.get("coalesce", default_coalesce)
+                ))
+            results = await asyncio.gather(*writes)
+        
+        written = sum(1 for result in results if result["success"])
+        logger.info(f"Created {written}/{len(results)} files")
+        return web.json_response({
+            "success": written == len(results),
+            "written": written,
+            "failed": len(results) - written,
+            "results": results
+        })
+    
+    async def create_files_multipart(self, request):
+        """Each file part's filename is its project-relative path. Writes start only once the whole
+        body has been read, so a part over the size limit (or a broken body) leaves no file written.
+        The fsync policy comes from ?fsync= or an "fsync" field sent before the files."""
+        reader = await request.multipart()
+        fsync = request.query.get("fsync", "batched")
+        parts = []
+        size = 0
+        
+        async for part in reader:
+            if part.name == "fsync" and part.filename is None:
+                fsync = (await part.text()).strip()
+                continue
+            
+            # Some clients (aiohttp among them) percent-encode the filename parameter
+            relative_path = unquote(part.filename or part.name or "")
+            content = bytearray()
+            while chunk := await part.read_chunk():
+                size += len(chunk)
+                if size > self.max_body_size:
+                    raise self.body_error(
+                        web.HTTPRequestEntityTooLarge, "Request body too large",
+                        max_size=self.max_body_size, actual_size=size
+                    )
+                content.extend(chunk)
+            
+            parts.append((relative_path, bytes(content), fsync))
+        
+        return list(await asyncio.gather(*(
+            self.write_one(index, os.path.basename(relative_path), os.path.dirname(relative_path), content, fsync)
+            for index, (relative_path, content, fsync) in enumerate(parts)
+        )))
+    
+    async def patch_file(self, request):
+        """Apply a unified diff or range edits to an existing file, optionally checked against its base hash"""
+        data = await self.read_json(request)
+        filename = data.get("filename", "")
+        fsync = data.get("fsync", "batched")
+        base_sha256 = data.get("base_sha256")
+        
+        if not self.godot_project_path:
+            return web.json_response({"success": False, "error": "No project path set"}, status=400)
+        if not filename:
+            return web.json_response({"success": False, "error": "Missing filename"}, status=400)
+        if fsync not in AtomicFileWriter.FSYNC_POLICIES:
+            return web.json_response({"success": False, "error": f"Unknown fsync policy: {fsync}"}, status=400)
+        if ("diff" in data) == ("edits" in data):
+            return web.json_response({"success": False, "error": "Provide exactly one of diff or edits"}, status=400)
+        if "diff" in data and not isinstance(data["diff"], str):
+            return web.json_response({"success": False, "error": "diff must be a string"}, status=400)
+        
+        full_path = self.project_file_path(data.get("path", ""), filename)
+        result = {}
+        
+        def transform(base: bytes) -> bytes:
+            if base_sha256 and hashlib.sha256(base).hexdigest() != base_sha256:
+                raise PatchConflict("File changed since base_sha256 was computed")
+            if "diff" in data:
+                patched = apply_unified_diff(base, data["diff"].encode("utf-8"))
+            else:
+                patched = apply_range_edits(base, data["edits"])
+            result["sha256"] = hashlib.sha256(patched).hexdigest()
+            result["size"] = len(patched)
+            return patched
+        
+        try:
+            written = await self.writer.write(full_path, b"", fsync, transform=transform)
+        except FileNotFoundError:
+            return web.json_response({"success": False, "error": f"File not found: {filename}"}, status=404)
+        except PatchConflict as e:
+            return web.json_response({"success": False, "error": str(e)}, status=409)
+        except ValueError as e:
+            return web.json_response({"success": False, "error": str(e)}, status=400)
+        except OSError as e:
+            logger.error(f"Error patching file: {e}")
+            return web.json_response({"success": False, "error": str(e)}, status=500)
+        
+        logger.info(f"Patched file: {full_path}")
+        return web.json_response({
+            "success": True,
+            "unchanged": not written,
+            "path": full_path,
+            **result
+        })
+    
+    async def file_history(self, request):
+        """List the recorded versions of a file, newest first"""
+        filename = request.query.get("filename", "")
+        if not self.godot_project_path:
+            return web.json_response({"success": False, "error": "No project path set"}, status=400)
+        if not filename:
+            return web.json_response({"success": False, "error": "Missing filename"}, status=400)
+        
+        full_path = self.project_file_path(request.query.get("path", ""), filename)
+        versions = self.history.history(full_path)
+        try:
+            limit = int(request.query.get("limit", 100))
+        except ValueError:
+            return web.json_response({"success": False, "error": "limit must be an integer"}, status=400)
+        return web.json_response({
+            "success": True,
+            "path": full_path,
+            "total": len(versions),
+            "versions": versions[::-1][:limit]
+        })
+    
+    async def restore_file(self, request):
+        """Write a recorded version of a file back (recorded as a new version itself)"""
+        data = await self.read_json(request)
+        filename = data.get("filename", "")
+        version = data.get("version", "")
+        if not self.godot_project_path:
+            return web.json_response({"success": False, "error": "No project path set"}, status=400)
+        if not filename or not version:
+            return web.json_response({"success": False, "error": "Missing filename or version"}, status=400)
+        if data.get("fsync", "batched") not in AtomicFileWriter.FSYNC_POLICIES:
+            return web.json_response({"success": False, "error": f"Unknown fsync policy: {data['fsync']}"}, status=400)
+        
+        full_path = self.project_file_path(data.get("path", ""), filename)
+        if not any(entry["version"] == version for entry in self.history.history(full_path)):
+            return web.json_response({"success": False, "error": f"Unknown version of {filename}: {version}"}, status=404)
+        try:
+            content = await self.io.run(None, self.history.load, version)
+            written = await self.writer.write(full_path, content, data.get("fsync", "batched"))
+        except (OSError, ValueError) as e:
+            logger.error(f"Error restoring {full_path}: {e}")
+            return web.json_response({"success": False, "error": str(e)}, status=500)
+        
+        logger.info(f"Restored {full_path} to {version}")
+        return web.json_response({"success": True, "unchanged": not written, "path": full_path, "version": version})
+    
+    async def begin_transaction(self, request):
+        """Start a multi-file transaction"""
+        if not self.godot_project_path:
+            return web.json_response({"success": False, "error": "No project path set"}, status=400)
+        try:
+            transaction_id = await self.transactions.begin()
+        except TooManyTransactions as e:
+            return web.json_response({"success": False, "error": str(e)}, status=429)
+        return web.json_response({"success": True, "transaction_id": transaction_id})
+    
+    async def stage_transaction_files(self, request):
+        """Stage one file ({filename, path, content}) or several ({"files": [...]}) in a transaction"""
+        transaction_id = request.match_info["transaction_id"]
+        data = await self.read_json(request)
+        files = data.get("files", [data])
+        if not isinstance(files, list):
+            return web.json_response({"success": False, "error": "files must be a list"}, status=400)
+        
+        staged = []
+        try:
+            for entry in files:
+                filename = entry.get("filename", "") if isinstance(entry, dict) else ""
+                content = entry.get("content", "") if isinstance(entry, dict) else None
+                if not filename or not isinstance(content, str):
+                    return web.json_response({"success": False, "error": "Each file needs a filename and string content"}, status=400)
+                full_path = self.project_file_path(entry.get("path", ""), filename)
+                await self.transactions.stage(transaction_id, full_path, content.encode("utf-8"))
+                staged.append(full_path)
+        except KeyError as e:
+            return web.json_response({"success": False, "error": e.args[0]}, status=404)
+        except OSError as e:
+            return web.json_response({"success": False, "error": str(e)}, status=500)
+        
+        return web.json_response({"success": True, "transaction_id": transaction_id, "staged": staged})
+    
+    async def commit_transaction(self, request):
+        """Replace every staged file together; nothing changes if the commit fails"""
+        transaction_id = request.match_info["transaction_id"]
+        try:
+            written = await self.transactions.commit(transaction_id)
+        except KeyError as e:
+            return web.json_response({"success": False, "error": e.args[0]}, status=404)
+        except OSError as e:
+            logger.error(f"Transaction {transaction_id} rolled back: {e}")
+            return web.json_response({"success": False, "error": str(e), "rolled_back": True}, status=500)
+        
+        logger.info(f"Committed transaction {transaction_id}: {len(written)} file(s)")
+        return web.json_response({"success": True, "transaction_id": transaction_id, "written": written})
+    
+    async def abort_transaction(self, request):
+        """Discard a transaction and its staged files"""
+        transaction_id = request.match_info["transaction_id"]
+        try:
+            await self.transactions.abort(transaction_id)
+        except KeyError as e:
+            return web.json_response({"success": False, "error": e.args[0]}, status=404)
+        return web.json_response({"success": True, "transaction_id": transaction_id})
+    
+    def open_event_log(self, path: str) -> EventLog:
+        return EventLog(ensure_data_dir(path, "events"), executor=self.io.executor)
+    
+    def validate_event(self, data):
+        """Reject malformed events before they are queued"""
+        if not isinstance(data, dict):
+            raise ValueError("Event must be a JSON object")
+        if not isinstance(data.get("type", ""), str):
+            raise ValueError("Event type must be a string")
+        self.schemas.validate(data)
+    
+    async def handle_event(self, data):
+        """Consume a single queued event"""
+        logger.debug("Received from Godot: %s", data)
+        now = time.time()
+        # In-memory work first, so the log and store keep dequeue order across workers
+        self.event_store.append(data, now)
+        position = data.get("position")
+        if isinstance(position, dict):
+            self.add_to_heatmap(data.get("type", "unknown"), position)
+        if self.event_log:
+            self.event_log.append(data)
+        
+        session_id = data.get("session_id")
+        if self.sessions.needs_restore(session_id):
+            # Later events of the same session queue up behind the restore
+            async with self.io.ordered(("session", session_id)):
+                if self.sessions.needs_restore(session_id):
+                    state = await self.io.run(None, self.sessions.load, session_id)
+                    self.sessions.restore(session_id, state, now)
+        self.sessions.apply(data, now)
+    
+    def queue_full_response(self, error: IngestQueueFull):
+        return web.json_response(
+            {"received": False, "error": str(error), "retry_after": error.retry_after},
+            status=429,
+            headers={"Retry-After": str(error.retry_after)}
+        )
+    
     async def receive_from_godot(self, request):
         """Receive data from Godot"""
-        data = await request.json()
-        logger.info(f"Received from Godot: {data}")
-        return web.json_response({"received": True, "message": "Data processed"})
+        data = await self.read_json(request)
+        try:
+            self.validate_event(data)
+            self.ingest.put_many([data])
+        except ValueError as e:
+            return web.json_response({"received": False, "error": str(e)}, status=400)
+        except IngestQueueFull as e:
+            return self.queue_full_response(e)
+        return web.json_response({"received": True, "message": "Data queued"})
+    
+    def parse_batch(self, request, body: str):
+        """Split a batch body into events (JSON array or NDJSON)"""
+        body = body.strip()
+        if not body:
+            return []
+        if body.startswith("[") and request.content_type != "application/x-ndjson":
+            events = json.loads(body)
+            if not isinstance(events, list):
+                raise ValueError("Batch body must be a JSON array")
+            return events
+        
+        events = []
+        for line in body.splitlines():
+            line = line.strip()
+            if line:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    events.append(e)
+        return events
+    
+    async def receive_batch_from_godot(self, request):
+        """Receive a batch of events from Godot with per-event acknowledgements"""
+        try:
+            if request.content_type == BINARY_CONTENT_TYPE:
+                _, events, shaped = decode_binary_events(await self.read_body(request))
+            else:
+                events = self.parse_batch(request, (await self.read_body(request)).decode("utf-8"))
+                shaped = None
+        except ValueError as e:
+            return web.json_response({"received": False, "error": str(e)}, status=400)
+        
+        try:
+            return web.json_response(self.process_batch(events, shaped))
+        except IngestQueueFull as e:
+            return self.queue_full_response(e)
+    
+    def process_batch(self, events, shaped=None) -> Dict[str, Any]:
+        """Queue a list of events and build per-event acknowledgements; events flagged in
+        shaped were decoded from a typed binary layout and skip schema validation"""
+        results = []
+        valid = []
+        for index, event in enumerate(events):
+            try:
+                if isinstance(event, Exception):
+                    raise ValueError(f"Invalid JSON: {event}")
+                if not (shaped and shaped[index]):
+                    self.validate_event(event)
+                valid.append(event)
+                results.append({"index": index, "received": True})
+            except ValueError as e:
+                results.append({"index": index, "received": False, "error": str(e)})
+        
+        self.ingest.put_many(valid)
+        accepted = len(valid)
+        return {
+            "received": True,
+            "count": len(events),
+            "accepted": accepted,
+            "rejected": len(events) - accepted,
+            "results": results
+        }
+    
+    def handle_ws_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Dispatch one framed WebSocket message and build its reply"""
+        op = message.get("op", "event")
+        data = message.get("data")
+        
+        if op == "event":
+            self.validate_event(data)
+            self.ingest.put_many([data])
+            return {"received": True}
+        if op == "batch":
+            if not isinstance(data, list):
+                raise ValueError("Batch data must be a list")
+            return self.process_batch(data)
+        if op == "status":
+            return self.status_info()
+        raise ValueError(f"Unknown op: {op}")
+    
+    async def websocket_handler(self, request):
+        """Persistent event channel; each frame carries an id echoed in its reply"""
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self.websockets.add(ws)
+        logger.info("Godot WebSocket client connected")
+        
+        try:
+            async for msg in ws:
+                if msg.type not in (web.WSMsgType.TEXT, web.WSMsgType.BINARY):
+                    continue
+                
+                reply = {"id": None}
+                try:
+                    if msg.type == web.WSMsgType.BINARY:
+                        reply["id"], events, shaped = decode_binary_events(msg.data)
+                        reply.update(self.process_batch(events, shaped))
+                    else:
+                        message = json.loads(msg.data)
+                        if not isinstance(message, dict):
+                            raise ValueError("Frame must be a JSON object")
+                        reply["id"] = message.get("id")
+                        reply.update(self.handle_ws_message(message))
+                    reply["ok"] = True
+                except ValueError as e:
+                    reply["ok"] = False
+                    reply["error"] = str(e)
+                except IngestQueueFull as e:
+                    reply["ok"] = False
+                    reply["error"] = str(e)
+                    reply["retry_after"] = e.retry_after
+                await ws.send_str(json.dumps(reply))
+        finally:
+            self.websockets.discard(ws)
+            logger.info("Godot WebSocket client disconnected")
+        
+        return ws
+    
+    async def read_events(self, request):
+        """Read logged events from a (segment, offset) cursor, or one session's events
+        (?session_id=, where offset counts that session's events)"""
+        if not self.event_log:
+            return web.json_response({"success": False, "error": "No project path set"}, status=400)
+        
+        session_id = request.query.get("session_id")
+        try:
+            segment = request.query.get("segment")
+            segment = int(segment) if segment is not None else None
+            offset = int(request.query.get("offset", 0))
+            limit = min(int(request.query.get("limit", 1000)), 10000)
+        except ValueError:
+            return web.json_response({"success": False, "error": "Invalid cursor"}, status=400)
+        
+        await self.event_log.commit()
+        async with self.event_log.commit_lock:
+            if session_id:
+                events, cursor = await self.io.run(None, self.event_log.read_session, session_id, offset, limit)
+            else:
+                events, cursor = await self.io.run(None, self.event_log.read, segment, offset, limit)
+        return web.json_response({"success": True, "events": events, "next": cursor})
+    
+    async def query_events(self, request):
+        """Aggregate a column of the in-memory event store over an optional time range"""
+        event_type = request.query.get("type")
+        field = request.query.get("field")
+        if not event_type or not field:
+            return web.json_response({"success": True, "store": self.event_store.stats()})
+        
+        try:
+            start = float(request.query["start"]) if "start" in request.query else None
+            end = float(request.query["end"]) if "end" in request.query else None
+        except ValueError:
+            return web.json_response({"success": False, "error": "Invalid time range"}, status=400)
+        
+        try:
+            result = self.event_store.query(event_type, field, start, end)
+        except KeyError as e:
+            return web.json_response({"success": False, "error": e.args[0]}, status=404)
+        return web.json_response({"success": True, "type": event_type, "field": field, **result})
+    
+    def add_to_heatmap(self, event_type: str, position: Dict[str, Any]):
+        x, y = position.get("x"), position.get("y")
+        if not isinstance(x, (int, float)) or not isinstance(y, (int, float)):
+            return
+        pyramid = self.heatmaps.get(event_type)
+        if pyramid is None:
+            pyramid = self.heatmaps[event_type] = HeatmapPyramid(*self.heatmap_bounds)
+        pyramid.add(x, y)
+    
+    async def heatmap(self, request):
+        """Binned position counts for an event type (default: light pulses)"""
+        event_type = request.query.get("type", "light_pulse_used")
+        pyramid = self.heatmaps.get(event_type)
+        if pyramid is None:
+            return web.json_response({"success": False, "error": f"No positions recorded for {event_type}"}, status=404)
+        
+        try:
+            args = {key: float(request.query[key]) for key in ("x0", "x1", "y0", "y1") if key in request.query}
+            bin_size = float(request.query.get("bin", 64))
+        except ValueError:
+            return web.json_response({"success": False, "error": "Invalid bin size or range"}, status=400)
+        if not all(math.isfinite(value) for value in (bin_size, *args.values())):
+            return web.json_response({"success": False, "error": "Bin size and range must be finite numbers"}, status=400)
+        if bin_size <= 0:
+            return web.json_response({"success": False, "error": "Bin size must be positive"}, status=400)
+        
+        return web.json_response({"success": True, "type": event_type, **pyramid.query(bin_size, **args)})
+    
+    async def schema_stats(self, request):
+        """Validation counts and cost per registered event type"""
+        return web.json_response({"success": True, "enabled": bool(self.schemas.validators), "types": self.schemas.report()})
+    
+    async def session_state(self, request):
+        """Current progress record for one game session"""
+        session_id = request.match_info["session_id"]
+        state = self.sessions.resident(session_id) or await self.io.run(None, self.sessions.load, session_id)
+        if state is None:
+            return web.json_response({"success": False, "error": "Unknown session"}, status=404)
+        return web.json_response({"success": True, "state": state})
+    
+    async def list_sessions(self, request):
+        """Sessions matching field filters, e.g. ?barriers_removed=true&victorious=false"""
+        filters = {key: value for key, value in request.query.items() if key != "include_evicted"}
+        include_evicted = request.query.get("include_evicted") == "true"
+        evicted = []
+        if include_evicted:
+            # Only the disk reads leave the loop; resident records are never touched off it
+            resident = set(self.sessions.sessions) | set(self.sessions.saving)
+            evicted = await self.io.run(None, self.sessions.load_evicted, resident)
+        sessions = self.sessions.query(filters, evicted)
+        return web.json_response({"success": True, "count": len(sessions), "sessions": sessions})
+    
+    async def sweep_sessions(self, interval: float = 60.0):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                evicted = await self.evict_sessions(time.time())
+                if evicted:
+                    logger.info(f"Evicted {evicted} idle sessions to disk")
+            except OSError as e:
+                logger.error(f"Error evicting sessions: {e}")
+    
+    async def evict_sessions(self, now: float) -> int:
+        states = self.sessions.pop_idle(now)
+        saved = 0
+        try:
+            saved = await self.io.run(None, self.sessions.save, states)
+        except OSError as e:
+            saved = getattr(e, "saved", 0)
+            raise
+        finally:
+            self.sessions.finish_save(states, saved)
+        return len(states)
+    
+    async def start_session_sweeper(self, app):
+        self.session_sweeper = asyncio.ensure_future(self.sweep_sessions())
+    
+    async def stop_session_sweeper(self, app):
+        if self.session_sweeper:
+            self.session_sweeper.cancel()
+        await self.evict_sessions(math.inf)
+    
+    async def start_ingest(self, app):
+        self.ingest.start()
+    
+    async def stop_ingest(self, app):
+        await self.ingest.stop()
+    
+    async def close_event_log(self, app):
+        """Flush and close the event log"""
+        event_log, self.event_log = self.event_log, None
+        if event_log:
+            await event_log.close()
+    
+    def forget_deleted(self, deltas):
+        """Drop content hashes of files removed outside the server"""
+        for delta in deltas:
+            if delta["type"] == "rescan":
+                self.hashes.clear()
+            elif delta["type"] == "deleted":
+                self.hashes.forget(os.path.normpath(delta["path"]))
+    
+    async def stop_watcher(self, app):
+        await self.watcher.stop()
+    
+    async def drain_writes(self, app):
+        await self.coalescer.drain()
+        await self.transactions.abort_all()
+    
+    async def close_io(self, app):
+        self.io.shutdown()
+    
+    async def close_websockets(self, app):
+        """Close open WebSocket connections on shutdown"""
+        for ws in list(self.websockets):
+            await ws.close(code=1001, message=b"Server shutdown")
     
     async def start_server(self):
         """Start the server"""
@@ -0,0 +1,57 @@
+import unittest
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from godot_mcp_server_fixed import FixedGodotMCPServer, HeatmapPyramid
+
+
+class HeatmapPyramidTest(unittest.TestCase):
+    def setUp(self):
+        self.pyramid = HeatmapPyramid(x=-128, y=0, width=256, height=128)
+        for x, y in ((-128, 0), (-1, 5), (0, 0), (127.5, 127.5), (200, 10), (0, -1)):
+            self.pyramid.add(x, y)
+    
+    def test_level_selection(self):
+        self.assertEqual(self.pyramid.query(64)["level_bin_size"], 64)
+        self.assertEqual(self.pyramid.query(48)["level_bin_size"], 16)
+        self.assertEqual(self.pyramid.query(64, x0=-120)["level_bin_size"], 8)  # edge off the 16 grid
+        self.assertEqual(self.pyramid.query(3)["bin_size"], 8)  # never finer than the base bins
+    
+    def test_bins_and_bounds(self):
+        result = self.pyramid.query(128)
+        self.assertEqual((result["x0"], result["x1"], result["y0"], result["y1"]), (-128, 128, 0, 128))
+        self.assertEqual(result["grid"], [[2, 2]])
+        self.assertEqual((result["total"], result["outside"]), (4, 2))
+        
+        # Ranges are world coordinates, clamped to the grid
+        result = self.pyramid.query(64, x0=-1000, x1=0, y0=0, y1=64)
+        self.assertEqual((result["x0"], result["x1"]), (-128, 0))
+        self.assertEqual(result["grid"], [[1, 1]])
+    
+    def test_coarse_level_matches_base_level(self):
+        fine = self.pyramid.query(32, x0=-120)  # edge forces the 8-unit level
+        base = self.pyramid.query(8, x0=-120)
+        self.assertEqual(fine["level_bin_size"], 8)
+        self.assertEqual(sum(map(sum, fine["grid"])), 3)
+        self.assertEqual(sum(map(sum, fine["grid"])), sum(map(sum, base["grid"])))
+
+class HeatmapEndpointTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = FixedGodotMCPServer()
+        self.server.add_to_heatmap("light_pulse_used", {"x": 10, "y": 10})
+        self.client = TestClient(TestServer(self.server.app))
+        await self.client.start_server()
+    
+    async def asyncTearDown(self):
+        await self.client.close()
+    
+    async def test_rejects_non_finite_parameters(self):
+        for query in ("bin=nan", "bin=inf", "x1=inf", "y0=-inf", "x0=nan", "bin=0", "bin=abc"):
+            response = await self.client.get(f"/analytics/heatmap?{query}")
+            self.assertEqual(response.status, 400, query)
+        response = await self.client.get("/analytics/heatmap?bin=64&x1=1e300")
+        self.assertEqual(response.status, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
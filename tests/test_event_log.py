@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+from godot_mcp_server_fixed import EventLog
+
+
+class EventLogTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+    
+    async def asyncTearDown(self):
+        self.directory.cleanup()
+    
+    async def write_events(self, log, count):
+        for index in range(count):
+            log.append({"type": "energy_pickup", "index": index, "session_id": f"s{index % 2}"})
+        await log.commit()
+    
+    async def test_recovery_truncates_a_torn_tail(self):
+        log = EventLog(self.path)
+        await self.write_events(log, 4)
+        await log.close()
+        
+        segment = log.segment_path(0)
+        size = os.path.getsize(segment)
+        with open(segment, "ab") as f:
+            f.write(EventLog.RECORD_HEADER.pack(100, 0) + b'{"type": "cut')  # crashed mid-record
+        
+        log = EventLog(self.path)
+        self.assertEqual(os.path.getsize(segment), size)
+        events, cursor = log.read()
+        self.assertEqual([event["index"] for event in events], [0, 1, 2, 3])
+        self.assertEqual(cursor, {"segment": 0, "offset": size})
+        
+        # The session index is rebuilt from the recovered log, and appends continue after it
+        await self.write_events(log, 2)
+        events, cursor = log.read_session("s0")
+        self.assertEqual([event["index"] for event in events], [0, 2, 0])
+        self.assertEqual(cursor, {"session_id": "s0", "offset": 3})
+        await log.close()
+    
+    async def test_segment_rollover(self):
+        log = EventLog(self.path, segment_size=200)
+        await self.write_events(log, 12)
+        self.assertGreater(len(log.segments), 2)
+        
+        events, cursor = log.read(limit=5)
+        self.assertEqual([event["index"] for event in events], [0, 1, 2, 3, 4])
+        rest, _ = log.read(cursor["segment"], cursor["offset"])
+        self.assertEqual([event["index"] for event in rest], list(range(5, 12)))
+        
+        events, _ = log.read_session("s1", offset=2, limit=3)
+        self.assertEqual([event["index"] for event in events], [5, 7, 9])
+        await log.close()
+        
+        log = EventLog(self.path, segment_size=200)
+        events, _ = log.read_session("s1")
+        self.assertEqual([event["index"] for event in events], [1, 3, 5, 7, 9, 11])
+        self.assertEqual(log.read_session("missing"), ([], {"session_id": "missing", "offset": 0}))
+        await log.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
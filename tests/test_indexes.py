@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from godot_mcp_server_fixed import DependencyGraph, ProjectIndex, SceneIndex, SymbolIndex
+
+
+SCENE = '[gd_scene format=3]\n\n[ext_resource type="Script" path="res://Main.gd" id="1"]\n\n[node name="Root" type="Node2D"]\n'
+
+
+class RescanTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.write("Main.gd", "extends Node2D\n\nfunc main_ready():\n\tpass\n")
+        self.write(".godot/editor/Cached.gd", "func main_cached():\n\tpass\n")
+        for relative in ("Main.tscn", "levels/One.tscn", ".godot/imported/Cache.tscn",
+                         ".mcp/history/Old.tscn", "addons/skip/Skipped.tscn"):
+            self.write(relative, SCENE)
+        self.write("addons/skip/.gdignore", "")
+        self.project = ProjectIndex(workers=2)
+        self.project.build(self.root)
+    
+    def tearDown(self):
+        self.directory.cleanup()
+    
+    def write(self, relative, text):
+        path = os.path.join(self.root, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+    
+    def rescan(self, index):
+        self.write("levels/Two.tscn", SCENE)
+        self.write(".godot/imported/New.tscn", SCENE)
+        deltas = [{"type": "rescan", "path": self.root, "is_dir": True}]
+        self.project.apply_deltas(deltas)
+        index.apply_deltas(deltas)
+    
+    def test_scene_rescan_skips_hidden_and_ignored(self):
+        scenes = SceneIndex(self.project)
+        scenes.rebuild()
+        self.assertEqual(sorted(scenes.scenes), ["res://Main.tscn", "res://levels/One.tscn"])
+        
+        self.rescan(scenes)
+        self.assertEqual(sorted(scenes.scenes), ["res://Main.tscn", "res://levels/One.tscn", "res://levels/Two.tscn"])
+    
+    
+    def test_dependency_rescan_skips_hidden_and_ignored(self):
+        graph = DependencyGraph(self.project)
+        graph.rebuild()
+        self.rescan(graph)
+        self.assertEqual(
+            graph.query("res://Main.gd", reverse=True),
+            ["res://Main.tscn", "res://levels/One.tscn", "res://levels/Two.tscn"]
+        )
+    
+    
+    def test_symbol_rescan_skips_hidden_and_ignored(self):
+        symbols = SymbolIndex(self.project)
+        symbols.rebuild()
+        self.write("addons/skip/Ignored.gd", "func main_ignored():\n\tpass\n")
+        self.write("levels/Level.gd", "func main_level():\n\tpass\n")
+        self.rescan(symbols)
+        total, found = symbols.query("main_", kind="func")
+        self.assertEqual([symbol["name"] for symbol in found], ["main_level", "main_ready"])
+    
+    def test_deleted_directory_drops_its_symbols(self):
+        symbols = SymbolIndex(self.project)
+        self.write("levels/Level.gd", "func main_level():\n\tpass\n")
+        self.project.build(self.root)
+        symbols.rebuild()
+        os.remove(os.path.join(self.root, "levels", "Level.gd"))
+        symbols.apply_deltas([{"type": "deleted", "path": os.path.join(self.root, "levels"), "is_dir": True}])
+        self.assertEqual(symbols.query("main_level", match="exact"), (0, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+import gzip
+import json
+import struct
+import unittest
+import zlib
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from godot_mcp_server_fixed import BINARY_CONTENT_TYPE, FixedGodotMCPServer, decode_binary_events
+
+
+class GodotBuffer:
+    """Mirrors the StreamPeerBuffer calls MCPClient.gd's encode_events makes (little-endian)"""
+    
+    def __init__(self):
+        self.data = bytearray()
+    
+    def put(self, fmt, *values):
+        self.data += struct.pack("<" + fmt, *values)
+    
+    def put_utf8_string(self, text):
+        encoded = text.encode("utf-8")
+        self.put("I", len(encoded))
+        self.data += encoded
+
+
+def encode_events(session_id, events, request_id=0):
+    """Python port of MCPClient.gd encode_events, for a batch whose codes are given explicitly"""
+    buffer = GodotBuffer()
+    buffer.data += b"GEV1"
+    buffer.put("I", request_id)
+    buffer.put_utf8_string(session_id)
+    buffer.put("H", len(events))
+    for code, event in events:
+        buffer.put("B", code)
+        if code == 1:
+            buffer.put("ffff", event["position"]["x"], event["position"]["y"],
+                       event["energy_remaining"], event["energy_percentage"])
+        elif code == 2:
+            buffer.put("ff", event["amount"], event["energy_remaining"])
+        elif code == 3:
+            buffer.put_utf8_string(event["shadow_name"])
+        elif code == 4:
+            buffer.put_utf8_string(event["villager_name"])
+        elif code == 6:
+            buffer.put("f", event["game_time"])
+        elif code == 7:
+            buffer.put("HH", event["total_villagers"], event["total_shadows"])
+        elif code == 0:
+            buffer.put_utf8_string(json.dumps(event))
+    return bytes(buffer.data)
+
+
+EVENTS = [
+    (7, {"type": "game_start", "total_villagers": 3, "total_shadows": 5}),
+    (1, {"type": "light_pulse_used", "position": {"x": 12.5, "y": -3.25},
+         "energy_remaining": 75.0, "energy_percentage": 0.75}),
+    (2, {"type": "energy_pickup", "amount": 20.0, "energy_remaining": 95.0}),
+    (3, {"type": "shadow_defeated", "shadow_name": "Shadow_ö1"}),
+    (4, {"type": "villager_cleansed", "villager_name": "Villager2"}),
+    (5, {"type": "barriers_removed"}),
+    (6, {"type": "victory", "game_time": 61.5}),
+    (0, {"type": "player_died", "cause": "shadow", "session_id": "other"}),
+]
+
+
+class BinaryEventsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = FixedGodotMCPServer()
+        self.client = TestClient(TestServer(self.server.app))
+        await self.client.start_server()
+    
+    async def asyncTearDown(self):
+        await self.client.close()
+    
+    def test_round_trip(self):
+        request_id, events, shaped = decode_binary_events(encode_events("sess-1", EVENTS, request_id=42))
+        self.assertEqual(request_id, 42)
+        self.assertEqual(shaped, [True] * 7 + [False])
+        for (_, expected), event in zip(EVENTS, events):
+            self.assertEqual(event, {"session_id": "sess-1", **expected})
+        
+        # Fixed layouts skip validation, so every one of them must satisfy its schema as decoded
+        for event in events[:7]:
+            self.server.schemas.validate(event)
+    
+    def test_truncated_batch(self):
+        data = encode_events("sess-1", EVENTS)
+        with self.assertRaisesRegex(ValueError, "Truncated"):
+            decode_binary_events(data[:-3])
+        with self.assertRaisesRegex(ValueError, "Unknown binary event code"):
+            decode_binary_events(encode_events("sess-1", [(9, {})]))
+    
+    async def test_generic_events_are_still_validated(self):
+        events = [(1, EVENTS[1][1]), (0, {"type": "victory", "game_time": "soon"})]
+        response = await self.client.post("/from-godot/batch", data=encode_events("sess-1", events),
+                                           headers={"Content-Type": BINARY_CONTENT_TYPE})
+        body = await response.json()
+        self.assertEqual(response.status, 200)
+        self.assertEqual((body["accepted"], body["rejected"]), (1, 1))
+        self.assertFalse(body["results"][1]["received"])
+
+
+class EventTypeTest(unittest.IsolatedAsyncioTestCase):
+    BAD_TYPES = [["light_pulse_used"], {"name": "victory"}, 7]
+    
+    async def asyncSetUp(self):
+        self.server = FixedGodotMCPServer()
+        self.client = TestClient(TestServer(self.server.app))
+        await self.client.start_server()
+    
+    async def asyncTearDown(self):
+        await self.client.close()
+    
+    async def test_single_event(self):
+        for event_type in self.BAD_TYPES:
+            response = await self.client.post("/from-godot", json={"type": event_type})
+            self.assertEqual(response.status, 400)
+            self.assertEqual((await response.json())["error"], "Event type must be a string")
+    
+    async def test_batch_acks_each_event(self):
+        events = [{"type": event_type} for event_type in self.BAD_TYPES] + [{"type": "barriers_removed"}]
+        response = await self.client.post("/from-godot/batch", json=events)
+        self.assertEqual(response.status, 200)
+        body = await response.json()
+        self.assertEqual((body["accepted"], body["rejected"]), (1, 3))
+        self.assertEqual([result["received"] for result in body["results"]], [False, False, False, True])
+    
+    async def test_websocket_stays_open(self):
+        async with self.client.ws_connect("/ws") as ws:
+            for index, event_type in enumerate(self.BAD_TYPES):
+                await ws.send_json({"id": index, "op": "event", "data": {"type": event_type}})
+                reply = await ws.receive_json()
+                self.assertEqual((reply["id"], reply["ok"]), (index, False))
+                self.assertEqual(reply["error"], "Event type must be a string")
+            
+            await ws.send_json({"id": "last", "op": "event", "data": {"type": "barriers_removed"}})
+            reply = await ws.receive_json()
+            self.assertEqual((reply["id"], reply["ok"]), ("last", True))
+
+
+class RequestBodyTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = FixedGodotMCPServer(max_body_size=4096)
+        self.client = TestClient(TestServer(self.server.app))  # default runner settings
+        await self.client.start_server()
+    
+    async def asyncTearDown(self):
+        await self.client.close()
+    
+    async def post(self, path, body, encoding="identity"):
+        return await self.client.post(path, data=body, headers={
+            "Content-Type": "application/json", "Content-Encoding": encoding})
+    
+    async def test_compressed_bodies(self):
+        event = json.dumps({"type": "game_start", "session_id": "s", "total_villagers": 1, "total_shadows": 1}).encode()
+        for encoding, body in (("gzip", gzip.compress(event)), ("deflate", zlib.compress(event))):
+            response = await self.post("/from-godot", body, encoding)
+            self.assertEqual(response.status, 200, encoding)
+            self.assertTrue((await response.json())["received"])
+        
+        response = await self.post("/from-godot", b"not gzip", "gzip")
+        self.assertEqual(response.status, 400)
+        response = await self.post("/from-godot", gzip.compress(event)[:-8], "gzip")
+        self.assertEqual(response.status, 400)
+        response = await self.post("/from-godot", event, "br")
+        self.assertEqual(response.status, 415)
+    
+    async def test_decompressed_size_limit(self):
+        bomb = gzip.compress(b'{"type": "' + b"x" * 100000 + b'"}')
+        self.assertLess(len(bomb), 4096)
+        response = await self.post("/from-godot", bomb, "gzip")
+        self.assertEqual(response.status, 413)
+        self.assertEqual((await response.json())["error"], "Request body too large")
+    
+    async def test_malformed_json_is_a_client_error(self):
+        for path in ("/from-godot", "/set-project", "/create-files", "/patch-file", "/create-file"):
+            for body in (b"{oops", b"[1, 2]", b"\xff"):
+                response = await self.post(path, body)
+                self.assertEqual(response.status, 400, (path, body))
+                self.assertFalse((await response.json())["success"])
+
+
+if __name__ == "__main__":
+    unittest.main()
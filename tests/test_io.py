@@ -0,0 +1,97 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from godot_mcp_server_fixed import FileIOPool, PathLockManager, ProjectWatcher
+
+
+class OrderedKeyTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.io = FileIOPool(workers=2)
+    
+    async def asyncTearDown(self):
+        self.io.shutdown()
+    
+    async def hold(self, name, log, release=None):
+        async with self.io.ordered("key"):
+            log.append(f"{name} start")
+            if release is not None:
+                await release.wait()
+            log.append(f"{name} end")
+    
+    async def test_cancelled_waiter_keeps_the_chain(self):
+        log = []
+        release = asyncio.Event()
+        first = asyncio.ensure_future(self.hold("first", log, release))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(self.hold("second", log))
+        await asyncio.sleep(0)
+        third = asyncio.ensure_future(self.hold("third", log))
+        await asyncio.sleep(0)
+        
+        second.cancel()
+        await asyncio.sleep(0.01)
+        self.assertEqual(log, ["first start"])  # third still waits for first
+        
+        release.set()
+        await asyncio.wait_for(asyncio.gather(first, third), 1)
+        self.assertTrue(second.cancelled())
+        self.assertEqual(log, ["first start", "first end", "third start", "third end"])
+        self.assertEqual(self.io.tails, {})
+    
+    async def test_cancelled_last_waiter_is_not_skipped_by_newcomers(self):
+        log = []
+        release = asyncio.Event()
+        first = asyncio.ensure_future(self.hold("first", log, release))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(self.hold("second", log))
+        await asyncio.sleep(0)
+        second.cancel()
+        await asyncio.sleep(0)
+        
+        third = asyncio.ensure_future(self.hold("third", log))
+        await asyncio.sleep(0.01)
+        self.assertEqual(log, ["first start"])
+        
+        release.set()
+        await asyncio.wait_for(asyncio.gather(first, third), 1)
+        self.assertEqual(log, ["first start", "first end", "third start", "third end"])
+        self.assertEqual(self.io.tails, {})
+
+
+class WatcherReadLockTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.io = FileIOPool(workers=2)
+        self.locks = PathLockManager()
+        self.watcher = ProjectWatcher(self.io, locks=self.locks)
+        self.directory = tempfile.TemporaryDirectory()
+    
+    async def asyncTearDown(self):
+        self.io.shutdown()
+        self.directory.cleanup()
+    
+    async def test_subscribers_wait_for_writers(self):
+        path = os.path.join(self.directory.name, "Main.tscn")
+        seen = []
+        
+        def read(deltas):
+            with open(path) as f:
+                seen.append(f.read())
+        self.watcher.subscribe(read)
+        
+        with open(path, "w") as f:
+            f.write("old")
+        async with self.locks.write(path):
+            self.watcher.pending[path] = ("modified", False)
+            flush = asyncio.ensure_future(self.watcher.flush())
+            await asyncio.sleep(0.05)
+            self.assertEqual(seen, [])
+            with open(path, "w") as f:
+                f.write("new")
+        await asyncio.wait_for(flush, 1)
+        self.assertEqual(seen, ["new"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import difflib
+import hashlib
+import os
+import tempfile
+import unittest
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from godot_mcp_server_fixed import FixedGodotMCPServer, PatchConflict, apply_unified_diff
+
+
+def unified_diff(old: bytes, new: bytes, context: int = 3) -> bytes:
+    lines = difflib.unified_diff(old.decode().splitlines(keepends=True), new.decode().splitlines(keepends=True),
+                                 "a/Player.gd", "b/Player.gd", n=context)
+    return "".join(lines).encode()
+
+
+class UnifiedDiffTest(unittest.TestCase):
+    BASE = b"".join(b"line %d\n" % number for number in range(1, 31))
+    
+    def test_multiple_hunks(self):
+        new = self.BASE.replace(b"line 3\n", b"line three\n").replace(b"line 25\n", b"line 25\nextra\n")
+        diff = unified_diff(self.BASE, new)
+        self.assertEqual(diff.count(b"@@ -"), 2)
+        self.assertEqual(apply_unified_diff(self.BASE, diff), new)
+        self.assertEqual(apply_unified_diff(self.BASE, diff + b"\n"), new)  # trailing empty line
+    
+    def test_no_newline_at_end_of_file(self):
+        diff = b"@@ -1,3 +1,3 @@\n a\n b\n-c\n\\ No newline at end of file\n+d\n"
+        self.assertEqual(apply_unified_diff(b"a\nb\nc", diff), b"a\nb\nd\n")
+        
+        diff = b"@@ -1,2 +1,2 @@\n a\n-b\n+c\n\\ No newline at end of file\n"
+        self.assertEqual(apply_unified_diff(b"a\nb\n", diff), b"a\nc")
+    
+    def test_empty_context_line_without_space(self):
+        diff = b"@@ -1,3 +1,3 @@\n a\n\n-c\n+d\n"
+        self.assertEqual(apply_unified_diff(b"a\n\nc\n", diff), b"a\n\nd\n")
+    
+    def test_count_mismatch_is_malformed(self):
+        for diff in (
+            b"@@ -1,3 +1,3 @@\n a\n-b\n+c\n",  # ends early
+            b"@@ -1,2 +1,2 @@\n a\n-b\n+c\n d\n",  # runs past its counts
+            b"@@ -1,1 +1,1 @@\n-a\n+b\n+c\n",
+        ):
+            with self.assertRaises(ValueError) as caught:
+                apply_unified_diff(b"a\nb\nd\n", diff)
+            self.assertNotIsInstance(caught.exception, PatchConflict)
+    
+    def test_mismatched_context_conflicts(self):
+        with self.assertRaises(PatchConflict):
+            apply_unified_diff(b"a\nx\n", b"@@ -1,2 +1,2 @@\n a\n-b\n+c\n")
+
+
+class PatchFileTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.path = os.path.join(self.root, "Player.gd")
+        with open(self.path, "wb") as f:
+            f.write(b"extends Node\nvar speed = 1\n")
+        self.server = FixedGodotMCPServer()
+        self.client = TestClient(TestServer(self.server.app))
+        await self.client.start_server()
+        await self.client.post("/set-project", json={"path": self.root})
+    
+    async def asyncTearDown(self):
+        await self.client.close()
+        self.directory.cleanup()
+    
+    async def patch(self, diff, base=None):
+        with open(self.path, "rb") as f:
+            base = base or hashlib.sha256(f.read()).hexdigest()
+        return await self.client.post("/patch-file", json={"filename": "Player.gd", "diff": diff, "base_sha256": base})
+    
+    async def test_patch_applies(self):
+        response = await self.patch("@@ -2 +2 @@\n-var speed = 1\n+var speed = 2\n\n")
+        self.assertEqual(response.status, 200)
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"extends Node\nvar speed = 2\n")
+    
+    async def test_base_hash_mismatch(self):
+        response = await self.patch("@@ -2 +2 @@\n-var speed = 1\n+var speed = 2\n", base="0" * 64)
+        self.assertEqual(response.status, 409)
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"extends Node\nvar speed = 1\n")
+    
+    async def test_malformed_diff(self):
+        response = await self.patch("@@ -2,2 +2,2 @@\n-var speed = 1\n+var speed = 2\n")
+        self.assertEqual(response.status, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import json
+import unittest
+
+from godot_mcp_server_fixed import parse_scene
+
+
+SCENE = """[gd_scene format=3 uid="uid://b1"]
+
+[node name="Root" type="Camera2D"]
+limit_left = inf_neg
+limit_right = inf
+zoom = Vector2(-inf, nan)
+
+[node name="Child" type="Sprite2D" parent="."]
+"""
+
+
+class SceneParserTest(unittest.TestCase):
+    def test_non_finite_floats_are_json_safe(self):
+        model = parse_scene(SCENE)
+        properties = model["nodes"][0]["properties"]
+        self.assertEqual(properties["limit_left"], "inf_neg")
+        self.assertEqual(properties["limit_right"], "inf")
+        self.assertEqual(properties["zoom"], {"type": "Vector2", "args": ["inf_neg", "nan"]})
+        json.dumps(model, allow_nan=False)
+    
+    def test_bare_identifier_before_a_section(self):
+        model = parse_scene(SCENE.replace("zoom = Vector2(-inf, nan)", "anchor_mode = DRAG_CENTER"))
+        self.assertEqual([node["path"] for node in model["nodes"]], [".", "Child"])
+        self.assertEqual(model["nodes"][0]["properties"]["anchor_mode"], "DRAG_CENTER")
+    
+    def test_typed_collection(self):
+        model = parse_scene(SCENE.replace("zoom = Vector2(-inf, nan)", 'tags = Array[StringName]([&"a", &"b"])'))
+        self.assertEqual(model["nodes"][0]["properties"]["tags"], ["a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import asyncio
+import tempfile
+import time
+import os
+import unittest
+from unittest import mock
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from godot_mcp_server_fixed import FixedGodotMCPServer, SessionTracker
+
+
+class SessionRestoreTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = FixedGodotMCPServer()
+        self.server.sessions.directory = self.directory.name
+        
+        evicted = SessionTracker.new_state("s1", 0.0)
+        evicted["events"] = 5
+        evicted["light_pulses"] = 2
+        self.server.sessions.save([evicted])
+    
+    async def asyncTearDown(self):
+        self.server.io.shutdown()
+        self.directory.cleanup()
+    
+    async def test_restore_does_not_block_the_loop(self):
+        load = self.server.sessions.load
+        
+        def slow_load(session_id):
+            time.sleep(0.2)  # a slow disk
+            return load(session_id)
+        self.server.sessions.load = slow_load
+        
+        ticks = 0
+        
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        task = asyncio.ensure_future(ticker())
+        try:
+            await asyncio.gather(
+                self.server.handle_event({"type": "light_pulse_used", "session_id": "s1"}),
+                self.server.handle_event({"type": "victory", "session_id": "s1"})
+            )
+        finally:
+            task.cancel()
+        
+        self.assertGreater(ticks, 5)
+        state = self.server.sessions.get("s1")
+        self.assertEqual(state["events"], 7)
+        self.assertEqual(state["light_pulses"], 3)
+        self.assertTrue(state["victorious"])
+    
+    async def test_apply_never_reads_disk(self):
+        def fail(session_id):
+            raise AssertionError("apply touched the disk")
+        self.server.sessions.load = fail
+        self.server.sessions.apply({"type": "game_start", "session_id": "s2"}, 1.0)
+        self.assertEqual(self.server.sessions.get("s2")["events"], 1)
+
+
+class SessionEvictionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = FixedGodotMCPServer()
+        self.tracker = self.server.sessions
+        self.tracker.directory = self.directory.name
+        self.tracker.idle_timeout = 10
+        for session_id in ("a", "b", "c"):
+            self.tracker.apply({"type": "light_pulse_used", "session_id": session_id}, 0.0)
+    
+    async def asyncTearDown(self):
+        self.server.io.shutdown()
+        self.directory.cleanup()
+    
+    async def test_failed_save_keeps_unsaved_sessions(self):
+        replace = os.replace
+        calls = 0
+        
+        def flaky_replace(source, target):
+            nonlocal calls
+            calls += 1
+            if calls == 2:
+                raise OSError("disk full")
+            replace(source, target)
+        
+        with mock.patch("godot_mcp_server_fixed.os.replace", flaky_replace):
+            with self.assertRaises(OSError):
+                await self.server.evict_sessions(100.0)
+        
+        self.assertEqual(sorted(self.tracker.sessions), ["b", "c"])
+        self.assertEqual(self.tracker.saving, {})
+        self.assertEqual(self.tracker.stats()["evicted"], 1)
+        self.assertEqual(os.listdir(self.directory.name), ["a.json"])  # no temp files left behind
+        
+        self.assertEqual(await self.server.evict_sessions(100.0), 2)
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["a.json", "b.json", "c.json"])
+    
+    async def test_list_includes_evicted_once(self):
+        await self.server.evict_sessions(100.0)
+        self.tracker.apply({"type": "victory", "session_id": "d"}, 100.0)
+        self.tracker.restore("a", self.tracker.load("a"), 100.0)  # back in memory, still on disk
+        
+        client = TestClient(TestServer(self.server.app))
+        await client.start_server()
+        try:
+            response = await client.get("/sessions?include_evicted=true")
+            body = await response.json()
+            self.assertEqual(sorted(s["session_id"] for s in body["sessions"]), ["a", "b", "c", "d"])
+            
+            response = await client.get("/sessions?include_evicted=true&victorious=true")
+            self.assertEqual([s["session_id"] for s in (await response.json())["sessions"]], ["d"])
+            
+            response = await client.get("/sessions/b/state")
+            self.assertEqual((await response.json())["state"]["light_pulses"], 1)
+        finally:
+            await client.close()
+
+
+class SessionFilterTest(unittest.TestCase):
+    def test_filters_follow_the_stored_type(self):
+        tracker = SessionTracker()
+        tracker.apply({"type": "game_start", "session_id": "123", "total_villagers": 3}, 1.0)
+        tracker.apply({"type": "game_start", "session_id": "abc"}, 1.0)
+        
+        self.assertEqual([s["session_id"] for s in tracker.query({"session_id": "123"})], ["123"])
+        self.assertEqual([s["session_id"] for s in tracker.query({"total_villagers": "3"})], ["123"])
+        self.assertEqual([s["session_id"] for s in tracker.query({"total_villagers": "null"})], ["abc"])
+        self.assertEqual(len(tracker.query({"victorious": "false"})), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from godot_mcp_server_fixed import FixedGodotMCPServer
+
+
+class UploadTest(unittest.IsolatedAsyncioTestCase):
+    DATA = b"".join(b"chunk %04d\n" % number for number in range(1000))
+    
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.client = await self.start()
+    
+    async def asyncTearDown(self):
+        await self.client.close()
+        self.directory.cleanup()
+    
+    async def start(self):
+        self.server = FixedGodotMCPServer()
+        client = TestClient(TestServer(self.server.app))
+        await client.start_server()
+        response = await client.post("/set-project", json={"path": self.root})
+        self.assertEqual(response.status, 200)
+        return client
+    
+    async def begin(self, **fields):
+        response = await self.client.post("/uploads", json={"filename": "level.bin", "size": len(self.DATA), **fields})
+        self.assertEqual(response.status, 200)
+        return (await response.json())["upload_id"]
+    
+    async def send(self, upload_id, offset, data):
+        return await self.client.patch(f"/uploads/{upload_id}", data=data, headers={"Upload-Offset": str(offset)})
+    
+    def target(self):
+        with open(os.path.join(self.root, "level.bin"), "rb") as f:
+            return f.read()
+    
+    async def test_resume_at_a_mismatched_offset(self):
+        upload_id = await self.begin()
+        response = await self.send(upload_id, 0, self.DATA[:4000])
+        self.assertEqual((await response.json())["offset"], 4000)
+        
+        for offset in (0, 3999, 4001):
+            response = await self.send(upload_id, offset, self.DATA[offset:])
+            self.assertEqual(response.status, 409)
+            self.assertEqual((await response.json())["offset"], 4000)  # where the client should resume
+        
+        # The rejected requests appended nothing; resuming at the reported offset finishes the file
+        response = await self.send(upload_id, 4000, self.DATA[4000:])
+        self.assertEqual((await response.json())["offset"], len(self.DATA))
+        response = await self.client.post(f"/uploads/{upload_id}/complete")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.target(), self.DATA)
+    
+    async def test_resume_after_restart(self):
+        upload_id = await self.begin(sha256=hashlib.sha256(self.DATA).hexdigest())
+        await self.send(upload_id, 0, self.DATA[:5000])
+        await self.client.close()
+        
+        self.client = await self.start()
+        response = await self.client.get(f"/uploads/{upload_id}")
+        self.assertEqual((await response.json())["offset"], 5000)
+        await self.send(upload_id, 5000, self.DATA[5000:])
+        response = await self.client.post(f"/uploads/{upload_id}/complete")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.target(), self.DATA)
+    
+    async def test_double_completion(self):
+        upload_id = await self.begin()
+        response = await self.client.post(f"/uploads/{upload_id}/complete")
+        self.assertEqual(response.status, 409)  # nothing sent yet
+        
+        await self.send(upload_id, 0, self.DATA)
+        response = await self.client.post(f"/uploads/{upload_id}/complete")
+        self.assertEqual(response.status, 200)
+        response = await self.client.post(f"/uploads/{upload_id}/complete")
+        self.assertEqual(response.status, 404)
+        response = await self.send(upload_id, len(self.DATA), b"more")
+        self.assertEqual(response.status, 404)
+        self.assertEqual(self.target(), self.DATA)
+        self.assertEqual(self.server.uploads.stats["completed"], 1)
+    
+    async def test_sha256_mismatch_discards_the_upload(self):
+        upload_id = await self.begin(sha256="0" * 64)
+        await self.send(upload_id, 0, self.DATA)
+        response = await self.client.post(f"/uploads/{upload_id}/complete")
+        self.assertEqual(response.status, 400)
+        response = await self.client.get(f"/uploads/{upload_id}")
+        self.assertEqual(response.status, 404)
+        self.assertFalse(os.path.exists(os.path.join(self.root, "level.bin")))
+    
+    async def test_stale_uploads_expire_when_the_project_opens(self):
+        stale = await self.begin()
+        await self.send(stale, 0, self.DATA[:100])
+        fresh = await self.begin()
+        upload_dir = self.server.uploads.directory
+        cutoff = time.time() - self.server.uploads.ttl - 60
+        for name in os.listdir(upload_dir):
+            if name.startswith(stale):
+                os.utime(os.path.join(upload_dir, name), (cutoff, cutoff))
+        
+        response = await self.client.post("/set-project", json={"path": self.root})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.server.uploads.stats["expired"], 1)
+        self.assertEqual((await self.client.get(f"/uploads/{stale}")).status, 404)
+        self.assertEqual((await self.client.get(f"/uploads/{fresh}")).status, 200)
+        self.assertEqual(sorted(os.listdir(upload_dir)), sorted([f"{fresh}.json", f"{fresh}.part"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,346 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from godot_mcp_server_fixed import (
+    AtomicFileWriter, ContentHashIndex, FileIOPool, FixedGodotMCPServer, WriteCoalescer, TooManyTransactions, TransactionManager, VersionStore,
+    ensure_data_dir
+)
+
+
+def touch(path, age=0.0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("x")
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+
+
+class LeftoverSweepTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        touch(os.path.join(self.root, "project.godot"))
+        self.server = FixedGodotMCPServer()
+        self.client = TestClient(TestServer(self.server.app))
+        await self.client.start_server()
+    
+    async def asyncTearDown(self):
+        await self.client.close()
+        self.directory.cleanup()
+    
+    async def test_set_project_removes_crash_leftovers(self):
+        pid = os.getpid()
+        stale = [
+            os.path.join(self.root, ".Player.gd.999999-3.tmp"),
+            os.path.join(self.root, "scenes", ".Main.tscn.999999-7.bak"),
+            os.path.join(self.root, f".Old.gd.{pid}-1.tmp")
+        ]
+        kept = [
+            os.path.join(self.root, f".Live.gd.{pid}-2.tmp"),  # may belong to an in-flight write
+            os.path.join(self.root, "notes.tmp"),
+            os.path.join(self.root, "scenes", "notes.txt")
+        ]
+        for path in stale[:2] + kept:
+            touch(path)
+        touch(stale[2], age=2 * self.server.writer.LEFTOVER_AGE)
+        
+        response = await self.client.post("/set-project", json={"path": self.root})
+        self.assertEqual(response.status, 200)
+        
+        for path in stale:
+            self.assertFalse(os.path.exists(path), path)
+        for path in kept:
+            self.assertTrue(os.path.exists(path), path)
+        self.assertEqual(self.server.writer.stats["swept"], 3)
+
+
+class TransactionHistoryTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.io = FileIOPool(workers=2)
+        self.history = VersionStore()
+        self.history.open(self.root, ensure_data_dir(self.root, "history"))
+        self.transactions = TransactionManager(AtomicFileWriter(self.io, history=self.history))
+        self.transactions.recover(ensure_data_dir(self.root, "transactions"))
+        self.path = os.path.join(self.root, "Player.gd")
+    
+    async def asyncTearDown(self):
+        self.io.shutdown()
+        self.directory.cleanup()
+    
+    async def test_aborted_content_leaves_no_history(self):
+        transaction_id = await self.transactions.begin()
+        await self.transactions.stage(transaction_id, self.path, b"extends Node\n")
+        await self.transactions.abort(transaction_id)
+        
+        self.assertEqual(self.history.history(self.path), [])
+        self.assertEqual(self.history.stats["objects"], 0)
+    
+    async def test_committed_content_is_versioned(self):
+        transaction_id = await self.transactions.begin()
+        await self.transactions.stage(transaction_id, self.path, b"extends Node\n")
+        await self.transactions.commit(transaction_id)
+        
+        versions = self.history.history(self.path)
+        self.assertEqual(len(versions), 1)
+        self.assertEqual(self.history.load(versions[0]["version"]), b"extends Node\n")
+
+
+class TransactionRecoveryTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.journal_dir = ensure_data_dir(self.root, "transactions")
+        self.io = FileIOPool(workers=2)
+        self.transactions = self.manager()
+        self.existing = os.path.join(self.root, "Player.gd")
+        self.created = os.path.join(self.root, "scenes", "Enemy.gd")
+        with open(self.existing, "wb") as f:
+            f.write(b"old player\n")
+    
+    async def asyncTearDown(self):
+        self.io.shutdown()
+        self.directory.cleanup()
+    
+    def manager(self, **kwargs):
+        transactions = TransactionManager(AtomicFileWriter(self.io), **kwargs)
+        transactions.recover(self.journal_dir)
+        return transactions
+    
+    async def stage_both(self):
+        transaction_id = await self.transactions.begin()
+        await self.transactions.stage(transaction_id, self.existing, b"new player\n")
+        await self.transactions.stage(transaction_id, self.created, b"new enemy\n")
+        return transaction_id
+    
+    def leftovers(self):
+        return sorted(
+            name for _, _, names in os.walk(self.root) for name in names
+            if name.endswith((".tmp", ".bak", ".json"))
+        )
+    
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+    
+    async def test_crash_before_the_commit_point_rolls_back(self):
+        transaction_id = await self.stage_both()
+        replace = os.replace
+        
+        def crash_on_second_file(source, target):
+            if target == self.created:
+                raise OSError("power cut")
+            replace(source, target)
+        
+        # The process "dies" mid-rename: no rollback runs, the prepared journal stays behind
+        with mock.patch("godot_mcp_server_fixed.os.replace", crash_on_second_file), \
+                mock.patch.object(self.transactions, "rollback"):
+            with self.assertRaises(OSError):
+                await self.transactions.commit(transaction_id)
+        self.assertEqual(self.read(self.existing), b"new player\n")
+        
+        recovered = self.manager()
+        self.assertEqual(recovered.stats["recovered"], 1)
+        self.assertEqual(recovered.stats["rolled_back"], 1)
+        self.assertEqual(self.read(self.existing), b"old player\n")
+        self.assertFalse(os.path.exists(self.created))
+        self.assertEqual(self.leftovers(), [])
+    
+    async def test_crash_after_the_commit_point_completes(self):
+        transaction_id = await self.stage_both()
+        with mock.patch.object(self.transactions, "finish"):
+            await self.transactions.commit(transaction_id)
+        self.assertTrue(any(name.endswith(".bak") for name in self.leftovers()))
+        
+        recovered = self.manager()
+        self.assertEqual((recovered.stats["recovered"], recovered.stats["rolled_back"]), (1, 0))
+        self.assertEqual(self.read(self.existing), b"new player\n")
+        self.assertEqual(self.read(self.created), b"new enemy\n")
+        self.assertEqual(self.leftovers(), [])
+    
+    async def test_staged_files_hold_no_descriptors(self):
+        before = len(os.listdir("/proc/self/fd"))
+        transaction_id = await self.stage_both()
+        self.assertEqual(len(os.listdir("/proc/self/fd")), before)
+        await self.transactions.commit(transaction_id)
+        self.assertEqual(self.read(self.created), b"new enemy\n")
+    
+    async def test_idle_transactions_expire(self):
+        self.transactions = self.manager(ttl=60, max_open=1)
+        await self.stage_both()
+        with self.assertRaises(TooManyTransactions):
+            await self.transactions.begin()
+        
+        with mock.patch("godot_mcp_server_fixed.time.time", return_value=time.time() + 120):
+            transaction_id = await self.transactions.begin()
+        self.assertEqual(list(self.transactions.open), [transaction_id])
+        self.assertEqual(self.transactions.stats["expired"], 1)
+        self.assertEqual(self.leftovers(), [])  # the expired transaction's temp files are gone
+
+
+class ContentHashSkipTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "Player.gd")
+        self.io = FileIOPool(workers=2)
+        self.hashes = ContentHashIndex()
+        self.writer = AtomicFileWriter(self.io, hashes=self.hashes)
+    
+    async def asyncTearDown(self):
+        self.io.shutdown()
+        self.directory.cleanup()
+    
+    def edit_outside(self, data, mtime_offset=1.0):
+        with open(self.path, "wb") as f:
+            f.write(data)
+        stamp = os.stat(self.path).st_mtime + mtime_offset
+        os.utime(self.path, (stamp, stamp))
+    
+    async def test_identical_content_is_skipped(self):
+        for fsync in AtomicFileWriter.FSYNC_POLICIES:
+            data = f"extends Node # {fsync}\n".encode()
+            self.assertTrue(await self.writer.write(self.path, data, fsync))
+            inode = os.stat(self.path).st_ino
+            self.assertFalse(await self.writer.write(self.path, data, fsync))
+            self.assertEqual(os.stat(self.path).st_ino, inode)  # not replaced
+        self.assertEqual(self.writer.stats["unchanged"], len(AtomicFileWriter.FSYNC_POLICIES))
+    
+    async def test_outside_edits_are_noticed(self):
+        await self.writer.write(self.path, b"speed = 1\n")
+        
+        self.edit_outside(b"speed = 2\n")  # same size, new content
+        self.assertTrue(await self.writer.write(self.path, b"speed = 1\n"))
+        
+        self.edit_outside(b"speed = 1\n")  # touched, but the content is what we would write
+        self.assertFalse(await self.writer.write(self.path, b"speed = 1\n"))
+        
+        os.unlink(self.path)
+        self.assertTrue(await self.writer.write(self.path, b"speed = 1\n"))
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"speed = 1\n")
+    
+    async def test_unknown_files_are_hashed_once(self):
+        self.edit_outside(b"var a = 1\n")
+        self.assertFalse(await self.writer.write(self.path, b"var a = 1\n"))
+        self.assertTrue(await self.writer.write(self.path, b"var a = 22\n"))  # size differs: no read needed
+        self.assertEqual(self.hashes.stats(), {"files": 1, "unchanged": 1, "changed": 1})
+
+
+class GroupCommitTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.io = FileIOPool(workers=2)
+        self.writer = AtomicFileWriter(self.io)
+    
+    async def asyncTearDown(self):
+        self.io.shutdown()
+        self.directory.cleanup()
+    
+    async def test_cancelled_committer_still_completes_the_batch(self):
+        commit_batch = self.writer.commit_batch
+        
+        def slow_commit_batch(batch):
+            time.sleep(0.2)
+            return commit_batch(batch)
+        self.writer.commit_batch = slow_commit_batch
+        
+        paths = [os.path.join(self.root, name) for name in ("a.gd", "b.gd")]
+        async with self.writer.commit_lock:
+            # Both writes stage while the lock is held, so the first to get it commits them together
+            first = asyncio.ensure_future(self.writer.write(paths[0], b"a"))
+            second = asyncio.ensure_future(self.writer.write(paths[1], b"b"))
+            while len(self.writer.pending) < 2:
+                await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        first.cancel()
+        
+        self.assertTrue(await asyncio.wait_for(second, 2))
+        self.assertTrue(first.cancelled())
+        async with self.writer.commit_lock:
+            pass  # the shielded commit has finished
+        for path, content in zip(paths, ("a", "b")):
+            with open(path) as f:
+                self.assertEqual(f.read(), content)
+        self.assertEqual(self.writer.stats["group_commits"], 1)
+
+
+class WriteCoalescerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.path = os.path.join(self.root, "Player.gd")
+        self.io = FileIOPool(workers=2)
+        self.writer = AtomicFileWriter(self.io)
+        self.coalescer = WriteCoalescer(self.writer, window=0.05, max_delay=0.2)
+    
+    async def asyncTearDown(self):
+        self.io.shutdown()
+        self.directory.cleanup()
+    
+    def read(self, path=None):
+        with open(path or self.path, "rb") as f:
+            return f.read()
+    
+    async def test_burst_becomes_one_write(self):
+        results = await asyncio.gather(*(
+            self.coalescer.write(self.path, b"version %d\n" % number, fsync)
+            for number, fsync in enumerate(["none", "immediate", "batched"])
+        ))
+        self.assertEqual(results, [True, True, True])  # every caller gets the merged write's outcome
+        self.assertEqual(self.read(), b"version 2\n")
+        self.assertEqual(self.coalescer.stats, {"requests": 3, "coalesced": 2, "flushes": 1})
+        self.assertEqual(self.writer.stats["writes"], 1)
+        self.assertEqual(self.writer.stats["immediate"], 1)  # as durable as the strictest request
+    
+    async def test_paths_are_independent(self):
+        other = os.path.join(self.root, "Enemy.gd")
+        await asyncio.gather(self.coalescer.write(self.path, b"a"), self.coalescer.write(other, b"b"))
+        self.assertEqual((self.read(), self.read(other)), (b"a", b"b"))
+        self.assertEqual(self.coalescer.stats["flushes"], 2)
+    
+    async def test_constant_writes_still_flush(self):
+        tasks = []
+        for number in range(12):
+            tasks.append(asyncio.ensure_future(self.coalescer.write(self.path, b"%d" % number)))
+            await asyncio.sleep(0.03)  # always inside the window, so only max_delay forces a flush
+        await asyncio.gather(*tasks)
+        self.assertGreaterEqual(self.coalescer.stats["flushes"], 2)
+        self.assertLess(self.coalescer.stats["flushes"], 12)
+        self.assertEqual(self.read(), b"11")
+    
+    async def test_cancelled_caller_does_not_cancel_the_write(self):
+        first = asyncio.ensure_future(self.coalescer.write(self.path, b"first"))
+        second = asyncio.ensure_future(self.coalescer.write(self.path, b"second"))
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertTrue(await second)
+        self.assertEqual(self.read(), b"second")
+    
+    async def test_errors_reach_every_caller(self):
+        with open(os.path.join(self.root, "scenes"), "w") as f:
+            f.write("a file where a directory should be")
+        path = os.path.join(self.root, "scenes", "Main.gd")
+        results = await asyncio.gather(self.coalescer.write(path, b"a"), self.coalescer.write(path, b"b"),
+                                       return_exceptions=True)
+        self.assertTrue(all(isinstance(result, OSError) for result in results))
+    
+    async def test_drain_flushes_immediately(self):
+        self.coalescer.window = self.coalescer.max_delay = 60
+        task = asyncio.ensure_future(self.coalescer.write(self.path, b"pending"))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(self.coalescer.drain(), 2)
+        self.assertTrue(await task)
+        self.assertEqual(self.read(), b"pending")
+
+
+if __name__ == "__main__":
+    unittest.main()